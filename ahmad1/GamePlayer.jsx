@@ -18,12 +18,15 @@ import {
 } from 'lucide-react'
 import axios from 'axios'
 
+const HEARTBEAT_INTERVAL_MS = 15000
+
 const GamePlayer = () => {
   const { gameId } = useParams()
   const [searchParams] = useSearchParams()
   const { user, updateUser } = useAuth()
   const navigate = useNavigate()
   const iframeRef = useRef(null)
+  const unsentPlayRef = useRef(0)
   
   const [game, setGame] = useState(null)
   const [loading, setLoading] = useState(true)
@@ -55,6 +58,38 @@ const GamePlayer = () => {
     }
   }, [game, user, isPreview])
 
+  // Report visible play time in batched heartbeats
+  useEffect(() => {
+    if (!sessionId) return
+
+    const tick = setInterval(() => {
+      if (document.visibilityState === 'visible') unsentPlayRef.current += 1
+    }, 1000)
+
+    const flush = (beacon = false) => {
+      if (unsentPlayRef.current === 0) return
+      const payload = JSON.stringify({ t: [[sessionId, unsentPlayRef.current]] })
+      unsentPlayRef.current = 0
+      if (beacon && navigator.sendBeacon) {
+        navigator.sendBeacon('/api/games/heartbeat', new Blob([payload], { type: 'application/json' }))
+      } else {
+        axios.post('/api/games/heartbeat', payload, { headers: { 'Content-Type': 'application/json' } })
+          .catch(() => {})
+      }
+    }
+
+    const heartbeat = setInterval(() => flush(), HEARTBEAT_INTERVAL_MS)
+    const onPageHide = () => flush(true)
+    window.addEventListener('pagehide', onPageHide)
+
+    return () => {
+      clearInterval(tick)
+      clearInterval(heartbeat)
+      window.removeEventListener('pagehide', onPageHide)
+      flush(true)
+    }
+  }, [sessionId])
+
   const fetchGame = async () => {
     try {
       const response = await axios.get(`/api/games/${gameId}`)
@@ -85,6 +120,12 @@ const GamePlayer = () => {
     if (!sessionId) return
     
     try {
+      // Send the play time since the last heartbeat before closing the session
+      if (unsentPlayRef.current > 0) {
+        const seconds = unsentPlayRef.current
+        unsentPlayRef.current = 0
+        await axios.post('/api/games/heartbeat', { t: [[sessionId, seconds]] })
+      }
       const response = await axios.post(`/api/games/sessions/${sessionId}/end`)
       
       if (response.data.points_awarded > 0) {
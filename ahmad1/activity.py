@@ -0,0 +1,137 @@
+from src.models.user import PointLog, db
+from sqlalchemy.orm import Session
+from bisect import insort
+from datetime import datetime, timedelta
+import threading
+import time
+
+
+class ActivityTracker:
+    """Per-user sliding window of recent PointLog timestamps, kept in memory.
+
+    Awards committed by this worker are fed in directly. A user's window is
+    loaded from PointLog the first time it is needed and then topped up
+    incrementally (rows with a higher id) every RESYNC_SECONDS, or right away
+    through sync(), which is how awards written by other workers become visible. The state can always be
+    rebuilt from the database, so losing it (restart, eviction) is harmless.
+    """
+
+    WINDOW_SECONDS = 3600
+    MAX_EVENTS = 1000
+    RESYNC_SECONDS = 5
+    MAX_USERS = 50000
+
+    _lock = threading.Lock()
+    _buffers = {}
+    _versions = {}
+
+    @classmethod
+    def record(cls, user_id, created_at):
+        """Feed one committed award into the user's window (if loaded)"""
+        with cls._lock:
+            cls._versions[user_id] = cls._versions.get(user_id, 0) + 1
+            buffer = cls._buffers.get(user_id)
+            if buffer is None or created_at in buffer['seen']:
+                return
+            cls._append(buffer, created_at)
+
+    @classmethod
+    def version(cls, user_id):
+        """Counter that changes whenever a new award is seen for the user"""
+        return cls._versions.get(user_id, 0)
+
+    @classmethod
+    def sync(cls, user_id):
+        """Top the window up with awards committed elsewhere, then return the version"""
+        cls._buffer(user_id, force=True)
+        return cls.version(user_id)
+
+    @classmethod
+    def recent(cls, user_id, seconds):
+        """Sorted timestamps of the user's awards within the last `seconds`"""
+        buffer = cls._buffer(user_id)
+        threshold = datetime.utcnow() - timedelta(seconds=seconds)
+        with cls._lock:
+            cls._prune(buffer)
+            return [created_at for created_at in buffer['times'] if created_at >= threshold]
+
+    @classmethod
+    def reset(cls, user_id=None):
+        """Drop cached windows so they are rebuilt from the database"""
+        with cls._lock:
+            if user_id is None:
+                cls._buffers.clear()
+            else:
+                cls._buffers.pop(user_id, None)
+
+    @classmethod
+    def _buffer(cls, user_id, force=False):
+        buffer = cls._buffers.get(user_id)
+        if buffer is None:
+            threshold = datetime.utcnow() - timedelta(seconds=cls.WINDOW_SECONDS)
+            rows = db.session.query(PointLog.id, PointLog.created_at).filter(
+                PointLog.user_id == user_id,
+                PointLog.created_at >= threshold
+            ).order_by(PointLog.created_at.desc()).limit(cls.MAX_EVENTS).all()
+            last_id = db.session.query(db.func.max(PointLog.id))\
+                .filter(PointLog.user_id == user_id).scalar() or 0
+
+            buffer = {'times': [], 'seen': set(), 'last_id': last_id, 'synced_at': time.monotonic()}
+            for _, created_at in reversed(rows):
+                cls._append(buffer, created_at)
+
+            with cls._lock:
+                if len(cls._buffers) >= cls.MAX_USERS:
+                    cls._buffers.pop(next(iter(cls._buffers)))
+                # A (re)loaded window may hold awards nobody counted while it was evicted
+                cls._versions[user_id] = cls._versions.get(user_id, 0) + 1
+                buffer = cls._buffers.setdefault(user_id, buffer)
+
+        elif force or time.monotonic() - buffer['synced_at'] >= cls.RESYNC_SECONDS:
+            rows = db.session.query(PointLog.id, PointLog.created_at).filter(
+                PointLog.user_id == user_id,
+                PointLog.id > buffer['last_id']
+            ).all()
+            with cls._lock:
+                for log_id, created_at in rows:
+                    buffer['last_id'] = max(buffer['last_id'], log_id)
+                    if created_at not in buffer['seen']:
+                        cls._append(buffer, created_at)
+                        cls._versions[user_id] = cls._versions.get(user_id, 0) + 1
+                buffer['synced_at'] = time.monotonic()
+
+        return buffer
+
+    @classmethod
+    def _append(cls, buffer, created_at):
+        insort(buffer['times'], created_at)
+        buffer['seen'].add(created_at)
+        if len(buffer['times']) > cls.MAX_EVENTS:
+            buffer['seen'].discard(buffer['times'].pop(0))
+
+    @classmethod
+    def _prune(cls, buffer):
+        threshold = datetime.utcnow() - timedelta(seconds=cls.WINDOW_SECONDS)
+        times = buffer['times']
+        while times and times[0] < threshold:
+            buffer['seen'].discard(times.pop(0))
+
+
+# Feed awards written through the ORM once their transaction commits
+
+@db.event.listens_for(PointLog, 'after_insert')
+def _track_point_log(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault('activity_events', []).append((target.user_id, target.created_at))
+
+
+@db.event.listens_for(Session, 'after_commit')
+def _apply_activity_events(session):
+    for user_id, created_at in session.info.pop('activity_events', []):
+        ActivityTracker.record(user_id, created_at)
+
+
+@db.event.listens_for(Session, 'after_rollback')
+def _discard_activity_events(session):
+    session.info.pop('activity_events', None)
@@ -1,6 +1,15 @@
 from flask import Blueprint, jsonify, request, session
-from src.models.user import User, Game, PointLog, WithdrawalRequest, GameSession, Referral, db
-from datetime import datetime, timedelta
+from src.models.user import User, Game, PointLog, DailyStat, WithdrawalRequest, GameSession, db
+from src.models.engine import retry_on_busy, is_sqlite_busy
+from src.models.awards import award_points, adjust_balance
+from src.models.bulk import BulkPointsAdjustment, WithdrawalBatch
+from src.models.stats import DashboardStats
+from src.models.suspicious import SuspiciousActivityReport
+from src.models.pagination import paginate_request, keyset_paginate
+from src.models.search import UserSearch
+from src.models.profiling import RequestProfiler
+from src.models.referrals import ReferralGraph
+from datetime import datetime
 from functools import wraps
 
 admin_bp = Blueprint('admin', __name__)
@@ -24,90 +33,67 @@ def admin_required(f):
 def get_dashboard_stats():
     """Get admin dashboard statistics"""
     try:
-        # User statistics
-        total_users = User.query.count()
-        today = datetime.utcnow().date()
-        new_users_today = User.query.filter(db.func.date(User.created_at) == today).count()
-        active_users_today = User.query.filter(db.func.date(User.last_login) == today).count()
-        
-        # Points statistics
-        total_points_distributed = db.session.query(db.func.sum(PointLog.points_earned)).scalar() or 0
-        points_today = db.session.query(db.func.sum(PointLog.points_earned)).filter(
-            db.func.date(PointLog.created_at) == today
-        ).scalar() or 0
-        
-        # Game statistics
-        total_games = Game.query.count()
-        total_sessions_today = GameSession.query.filter(
-            db.func.date(GameSession.start_time) == today
-        ).count()
-        
-        # Withdrawal statistics
-        pending_withdrawals = WithdrawalRequest.query.filter_by(status='pending').count()
-        total_withdrawals = WithdrawalRequest.query.count()
-        total_withdrawal_amount = db.session.query(db.func.sum(WithdrawalRequest.amount_usd)).filter_by(
-            status='approved'
-        ).scalar() or 0
-        
-        # Referral statistics
-        total_referrals = Referral.query.count()
-        referrals_today = Referral.query.filter(db.func.date(Referral.created_at) == today).count()
-        
-        return jsonify({
-            'users': {
-                'total': total_users,
-                'new_today': new_users_today,
-                'active_today': active_users_today
-            },
-            'points': {
-                'total_distributed': total_points_distributed,
-                'distributed_today': points_today
-            },
-            'games': {
-                'total': total_games,
-                'sessions_today': total_sessions_today
-            },
-            'withdrawals': {
-                'pending': pending_withdrawals,
-                'total': total_withdrawals,
-                'total_amount': total_withdrawal_amount
-            },
-            'referrals': {
-                'total': total_referrals,
-                'today': referrals_today
-            }
-        })
+        return jsonify(DashboardStats.get())
         
     except Exception as e:
         return jsonify({'error': 'حدث خطأ في جلب إحصائيات اللوحة'}), 500
 
+@admin_bp.route('/admin/stats/rebuild', methods=['POST'])
+@admin_required
+def rebuild_stats():
+    """Rebuild dashboard rollups from the base tables"""
+    try:
+        rows = DashboardStats.rebuild()
+        return jsonify({'message': 'تم إعادة بناء الإحصائيات بنجاح', 'rows': rows})
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'حدث خطأ أثناء إعادة بناء الإحصائيات'}), 500
+
+@admin_bp.route('/admin/perf', methods=['GET'])
+@admin_required
+def get_perf_profile():
+    """Per-endpoint query counts, SQL time and latency histograms for this worker"""
+    if not RequestProfiler.enabled():
+        return jsonify({'error': 'تحليل الأداء غير مفعل'}), 404
+
+    sort = request.args.get('sort', 'sql_ms_total')
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    return jsonify(RequestProfiler.snapshot(sort=sort, limit=limit))
+
+@admin_bp.route('/admin/perf', methods=['DELETE'])
+@admin_required
+def reset_perf_profile():
+    """Start a fresh profiling window"""
+    RequestProfiler.reset()
+    return jsonify({'message': 'تم إعادة تعيين بيانات الأداء'})
+
 @admin_bp.route('/admin/users', methods=['GET'])
 @admin_required
 def get_all_users():
     """Get all users with pagination"""
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
-    search = request.args.get('search', '')
-    
-    query = User.query
+    search = request.args.get('search', '').strip()
     
     if search:
-        query = query.filter(
-            (User.name.contains(search)) |
-            (User.email.contains(search)) |
-            (User.phone_number.contains(search))
+        # Ranked matches from the FTS index; counted on the first page unless asked
+        page = request.args.get('page', 1, type=int)
+        include_total = request.args.get('include_total')
+        result = UserSearch.search(
+            search,
+            page=page,
+            per_page=request.args.get('per_page', 20, type=int),
+            include_total=page <= 1 if include_total is None else include_total.lower() in ('1', 'true')
         )
+        result['users'] = User.bulk_to_dict(result.pop('items'))
+        return jsonify(result)
     
-    users = query.order_by(User.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    try:
+        result = paginate_request(User.query, User)
+    except ValueError:
+        return jsonify({'error': 'مؤشر الصفحة غير صالح'}), 400
     
-    return jsonify({
-        'users': [user.to_dict() for user in users.items],
-        'total': users.total,
-        'pages': users.pages,
-        'current_page': page
-    })
+    result['users'] = User.bulk_to_dict(result.pop('items'))
+    return jsonify(result)
 
 @admin_bp.route('/admin/users/<int:user_id>', methods=['GET'])
 @admin_required
@@ -122,23 +108,34 @@ def get_user_details(user_id):
     recent_sessions = GameSession.query.filter_by(user_id=user_id)\
         .order_by(GameSession.start_time.desc()).limit(10).all()
     
-    withdrawals = WithdrawalRequest.query.filter_by(user_id=user_id)\
-        .order_by(WithdrawalRequest.created_at.desc()).all()
+    # First page only; the rest is reachable with withdrawals_next_cursor
+    try:
+        withdrawals = keyset_paginate(
+            WithdrawalRequest.query.filter_by(user_id=user_id),
+            WithdrawalRequest,
+            cursor=request.args.get('withdrawals_cursor') or None,
+            per_page=request.args.get('withdrawals_per_page', 20, type=int),
+            include_total=False
+        )
+    except ValueError:
+        return jsonify({'error': 'مؤشر الصفحة غير صالح'}), 400
     
     return jsonify({
         'user': user.to_dict(),
         'recent_points': [log.to_dict() for log in recent_points],
         'recent_sessions': [session.to_dict() for session in recent_sessions],
-        'withdrawals': [withdrawal.to_dict() for withdrawal in withdrawals]
+        'withdrawals': [withdrawal.to_dict() for withdrawal in withdrawals['items']],
+        'withdrawals_next_cursor': withdrawals['next_cursor']
     })
 
 @admin_bp.route('/admin/users/<int:user_id>/points', methods=['POST'])
 @admin_required
+@retry_on_busy
 def adjust_user_points(user_id):
     """Adjust user points (add or subtract)"""
     try:
         data = request.json
-        user = User.query.get_or_404(user_id)
+        User.query.get_or_404(user_id)
         
         points_change = data.get('points', 0)
         reason = data.get('reason', 'تعديل إداري')
@@ -146,26 +143,68 @@ def adjust_user_points(user_id):
         if points_change == 0:
             return jsonify({'error': 'يجب تحديد عدد النقاط'}), 400
         
-        # Update user points
-        user.points += points_change
-        
-        # Create log entry
-        point_log = PointLog(
-            user_id=user_id,
-            points_earned=points_change,
-            activity_type='admin_adjustment'
-        )
-        
-        db.session.add(point_log)
+        # Update user points and create log entry in one atomic step
+        new_balance = award_points(user_id, points_change, 'admin_adjustment', enforce_cap=False)
         db.session.commit()
         
         return jsonify({
             'message': 'تم تعديل النقاط بنجاح',
-            'new_balance': user.points
+            'new_balance': new_balance
         })
         
     except Exception as e:
         db.session.rollback()
+        if is_sqlite_busy(e):
+            raise
+        return jsonify({'error': 'حدث خطأ أثناء تعديل النقاط'}), 500
+
+@admin_bp.route('/admin/users/points/bulk', methods=['POST'])
+@admin_required
+def bulk_adjust_points():
+    """Adjust points for many users from a CSV or JSON list of (user_id, delta, reason)"""
+    try:
+        upload = request.files.get('file')
+        if upload is not None:
+            fmt = 'json' if upload.filename.lower().endswith('.json') else 'csv'
+            rows = BulkPointsAdjustment.parse(upload.read(), fmt)
+            allow_negative = request.form.get('allow_negative') == 'true'
+        elif request.mimetype == 'text/csv':
+            rows = BulkPointsAdjustment.parse(request.get_data(), 'csv')
+            allow_negative = request.args.get('allow_negative') == 'true'
+        else:
+            data = request.get_json(silent=True)
+            if data is None:
+                return jsonify({'error': 'بيانات غير صالحة'}), 400
+            rows = BulkPointsAdjustment.parse(data, 'json')
+            allow_negative = isinstance(data, dict) and bool(data.get('allow_negative'))
+
+        if not rows:
+            return jsonify({'error': 'لا توجد تعديلات لتطبيقها'}), 400
+        if len(rows) > BulkPointsAdjustment.MAX_ROWS:
+            return jsonify({'error': f'الحد الأقصى {BulkPointsAdjustment.MAX_ROWS} صف في الطلب الواحد'}), 400
+
+        results, summary = BulkPointsAdjustment.apply(rows, allow_negative=allow_negative)
+
+        if summary['failed_chunk']:
+            # Earlier chunks are committed; the results say which rows to retry
+            busy = summary['error'] == 'busy'
+            return jsonify({
+                'error': 'الخادم مشغول حالياً، تم تطبيق جزء من التعديلات فقط' if busy
+                else 'حدث خطأ أثناء تعديل النقاط، تم تطبيق جزء من التعديلات فقط',
+                'summary': summary,
+                'results': results
+            }), 503 if busy else 500
+
+        return jsonify({
+            'message': 'تم تطبيق التعديلات',
+            'summary': summary,
+            'results': results
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        if is_sqlite_busy(e):
+            return jsonify({'error': 'الخادم مشغول حالياً، يرجى المحاولة مرة أخرى'}), 503
         return jsonify({'error': 'حدث خطأ أثناء تعديل النقاط'}), 500
 
 @admin_bp.route('/admin/users/<int:user_id>/ban', methods=['POST'])
@@ -205,38 +244,38 @@ def ban_user(user_id):
 def get_withdrawal_requests():
     """Get all withdrawal requests"""
     status = request.args.get('status', 'all')
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
     
     query = WithdrawalRequest.query
     
     if status != 'all':
         query = query.filter_by(status=status)
     
-    withdrawals = query.order_by(WithdrawalRequest.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    try:
+        page = paginate_request(query, WithdrawalRequest)
+    except ValueError:
+        return jsonify({'error': 'مؤشر الصفحة غير صالح'}), 400
+    withdrawals = page.pop('items')
+    
+    # Include user information (one query for the whole page)
+    user_ids = {withdrawal.user_id for withdrawal in withdrawals}
+    users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))} if user_ids else {}
     
-    # Include user information
     result = []
-    for withdrawal in withdrawals.items:
+    for withdrawal in withdrawals:
         withdrawal_dict = withdrawal.to_dict()
-        user = User.query.get(withdrawal.user_id)
+        user = users[withdrawal.user_id]
         withdrawal_dict['user'] = {
             'name': user.name,
             'email': user.email
         }
         result.append(withdrawal_dict)
     
-    return jsonify({
-        'withdrawals': result,
-        'total': withdrawals.total,
-        'pages': withdrawals.pages,
-        'current_page': page
-    })
+    page['withdrawals'] = result
+    return jsonify(page)
 
 @admin_bp.route('/admin/withdrawals/<int:withdrawal_id>/approve', methods=['POST'])
 @admin_required
+@retry_on_busy
 def approve_withdrawal(withdrawal_id):
     """Approve a withdrawal request"""
     try:
@@ -248,9 +287,17 @@ def approve_withdrawal(withdrawal_id):
         
         transaction_id = data.get('transaction_id', '')
         
-        withdrawal.status = 'approved'
-        withdrawal.transaction_id = transaction_id
-        withdrawal.updated_at = datetime.utcnow()
+        # Claim the request atomically so the rollup is only bumped once
+        claimed = WithdrawalRequest.query.filter_by(id=withdrawal_id, status='pending').update({
+            'status': 'approved',
+            'transaction_id': transaction_id,
+            'updated_at': datetime.utcnow()
+        })
+        if not claimed:
+            db.session.rollback()
+            return jsonify({'error': 'طلب السحب تم معالجته بالفعل'}), 400
+        
+        DailyStat.bump('approved_withdrawal_cents', round(withdrawal.amount_usd * 100))
         
         db.session.commit()
         
@@ -258,10 +305,13 @@ def approve_withdrawal(withdrawal_id):
         
     except Exception as e:
         db.session.rollback()
+        if is_sqlite_busy(e):
+            raise
         return jsonify({'error': 'حدث خطأ أثناء الموافقة على طلب السحب'}), 500
 
 @admin_bp.route('/admin/withdrawals/<int:withdrawal_id>/reject', methods=['POST'])
 @admin_required
+@retry_on_busy
 def reject_withdrawal(withdrawal_id):
     """Reject a withdrawal request"""
     try:
@@ -273,12 +323,17 @@ def reject_withdrawal(withdrawal_id):
         
         reason = data.get('reason', 'لم يتم تحديد السبب')
         
-        # Return points to user
-        user = User.query.get(withdrawal.user_id)
-        user.points += withdrawal.points_redeemed
+        # Claim the request atomically so the refund can only happen once
+        claimed = WithdrawalRequest.query.filter_by(id=withdrawal_id, status='pending').update({
+            'status': 'rejected',
+            'updated_at': datetime.utcnow()
+        })
+        if not claimed:
+            db.session.rollback()
+            return jsonify({'error': 'طلب السحب تم معالجته بالفعل'}), 400
         
-        withdrawal.status = 'rejected'
-        withdrawal.updated_at = datetime.utcnow()
+        # Return points to user
+        adjust_balance(withdrawal.user_id, withdrawal.points_redeemed)
         
         db.session.commit()
         
@@ -286,8 +341,77 @@ def reject_withdrawal(withdrawal_id):
         
     except Exception as e:
         db.session.rollback()
+        if is_sqlite_busy(e):
+            raise
         return jsonify({'error': 'حدث خطأ أثناء رفض طلب السحب'}), 500
 
+@admin_bp.route('/admin/withdrawals/batch', methods=['POST'])
+@admin_required
+@retry_on_busy
+def batch_process_withdrawals():
+    """Approve or reject many pending withdrawal requests at once"""
+    try:
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({'error': 'بيانات غير صالحة'}), 400
+        action = data.get('action')
+        ids = data.get('ids')
+        filters = data.get('filter') or {}
+        
+        if action not in WithdrawalBatch.ACTIONS:
+            return jsonify({'error': 'الإجراء يجب أن يكون approve أو reject'}), 400
+        
+        if ids is not None and not (isinstance(ids, list) and all(
+                (isinstance(withdrawal_id, int) and not isinstance(withdrawal_id, bool))
+                or (isinstance(withdrawal_id, str) and withdrawal_id.isdigit()) for withdrawal_id in ids)):
+            return jsonify({'error': 'أرقام طلبات السحب يجب أن تكون قائمة أرقام'}), 400
+        
+        if not isinstance(filters, dict):
+            return jsonify({'error': 'معايير التصفية غير صالحة'}), 400
+        
+        if ids is None and not filters:
+            return jsonify({'error': 'يجب تحديد طلبات السحب أو معايير التصفية'}), 400
+        
+        if filters.get('status', 'pending') != 'pending':
+            return jsonify({'error': 'يمكن معالجة الطلبات المعلقة فقط'}), 400
+        
+        transaction_ids = data.get('transaction_ids')
+        if transaction_ids is not None and not isinstance(transaction_ids, dict):
+            return jsonify({'error': 'أرقام المعاملات يجب أن تكون كائناً يربط رقم الطلب برقم المعاملة'}), 400
+        
+        created_before = None
+        if filters.get('created_before'):
+            try:
+                created_before = datetime.fromisoformat(filters['created_before'])
+            except (TypeError, ValueError):
+                return jsonify({'error': 'تاريخ غير صالح'}), 400
+        
+        try:
+            report = WithdrawalBatch.process(
+                action,
+                ids=ids,
+                payment_method=filters.get('payment_method'),
+                created_before=created_before,
+                transaction_id=data.get('transaction_id'),
+                transaction_ids=transaction_ids
+            )
+        except (TypeError, ValueError):
+            db.session.rollback()
+            return jsonify({'error': 'أرقام طلبات السحب غير صالحة'}), 400
+        
+        db.session.commit()
+        
+        return jsonify({
+            'message': f"تمت معالجة {report['processed']} طلب سحب",
+            **report
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        if is_sqlite_busy(e):
+            raise
+        return jsonify({'error': 'حدث خطأ أثناء معالجة طلبات السحب'}), 500
+
 @admin_bp.route('/admin/games/upload', methods=['POST'])
 @admin_required
 def upload_game():
@@ -320,69 +444,117 @@ def upload_game():
 @admin_bp.route('/admin/suspicious-activity', methods=['GET'])
 @admin_required
 def get_suspicious_activity():
-    """Get suspicious user activity patterns"""
+    """Get suspicious user activity patterns (from the materialized snapshot)"""
     try:
-        # Users with too many points in one day
-        today = datetime.utcnow().date()
-        suspicious_users = db.session.query(
-            PointLog.user_id,
-            db.func.sum(PointLog.points_earned).label('daily_points'),
-            db.func.count(PointLog.id).label('activities_count')
-        ).filter(
-            db.func.date(PointLog.created_at) == today
-        ).group_by(PointLog.user_id).having(
-            db.func.sum(PointLog.points_earned) > 100  # Suspicious if more than 100 points per day
-        ).all()
-        
-        # Users with same IP
-        duplicate_ips = db.session.query(
-            User.ip_address,
-            db.func.count(User.id).label('user_count')
-        ).group_by(User.ip_address).having(
-            db.func.count(User.id) > 3  # Suspicious if more than 3 users per IP
-        ).all()
-        
-        # Users with rapid point earning
-        rapid_earners = db.session.query(
-            PointLog.user_id,
-            db.func.count(PointLog.id).label('activities_count')
-        ).filter(
-            PointLog.created_at >= datetime.utcnow() - timedelta(hours=1)
-        ).group_by(PointLog.user_id).having(
-            db.func.count(PointLog.id) > 20  # More than 20 activities per hour
-        ).all()
+        kind = request.args.get('kind', 'all')
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+        
+        sections = {
+            'high_daily_points': 'high_daily_points',
+            'duplicate_ips': 'duplicate_ip',
+            'rapid_earners': 'rapid_earner'
+        }
+        if kind != 'all' and kind not in sections:
+            return jsonify({'error': 'نوع النشاط غير صحيح'}), 400
         
-        return jsonify({
-            'high_daily_points': [
-                {
-                    'user_id': item.user_id,
-                    'daily_points': item.daily_points,
-                    'activities_count': item.activities_count,
-                    'user': User.query.get(item.user_id).to_dict()
-                }
-                for item in suspicious_users
-            ],
-            'duplicate_ips': [
-                {
-                    'ip_address': item.ip_address,
-                    'user_count': item.user_count,
-                    'users': [user.to_dict() for user in User.query.filter_by(ip_address=item.ip_address).all()]
-                }
-                for item in duplicate_ips
-            ],
-            'rapid_earners': [
-                {
-                    'user_id': item.user_id,
-                    'activities_count': item.activities_count,
-                    'user': User.query.get(item.user_id).to_dict()
-                }
-                for item in rapid_earners
-            ]
-        })
+        SuspiciousActivityReport.ensure_fresh()
+        
+        result = {'totals': {}, 'current_page': page}
+        for section, snapshot_kind in sections.items():
+            if kind != 'all' and kind != section:
+                continue
+            items, total = SuspiciousActivityReport.page(snapshot_kind, page, per_page)
+            result[section] = items
+            result['totals'][section] = total
+        
+        generated_at = SuspiciousActivityReport.generated_at()
+        result['generated_at'] = generated_at.isoformat() if generated_at else None
+        
+        return jsonify(result)
         
     except Exception as e:
         return jsonify({'error': 'حدث خطأ في جلب الأنشطة المشبوهة'}), 500
 
+@admin_bp.route('/admin/suspicious-activity/refresh', methods=['POST'])
+@admin_required
+def refresh_suspicious_activity():
+    """Rebuild the suspicious activity snapshot now"""
+    try:
+        rows = SuspiciousActivityReport.refresh()
+        return jsonify({'message': 'تم تحديث تقرير الأنشطة المشبوهة', 'rows': rows})
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'حدث خطأ أثناء تحديث تقرير الأنشطة المشبوهة'}), 500
+
+@admin_bp.route('/admin/referrals/top', methods=['GET'])
+@admin_required
+def get_top_referrers():
+    """Top referrers by direct referrals or by referral tree size"""
+    try:
+        by = request.args.get('by', 'direct')
+        if by not in ('direct', 'descendants'):
+            return jsonify({'error': 'معيار الترتيب غير صحيح'}), 400
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        
+        return jsonify({'by': by, 'referrers': ReferralGraph.top(by=by, limit=limit)})
+        
+    except Exception as e:
+        return jsonify({'error': 'حدث خطأ في جلب أفضل المحيلين'}), 500
+
+@admin_bp.route('/admin/referrals/users/<int:user_id>', methods=['GET'])
+@admin_required
+def get_user_referrals(user_id):
+    """Referral counts and referrer chain of a user"""
+    try:
+        if not User.query.get(user_id):
+            return jsonify({'error': 'المستخدم غير موجود'}), 404
+        
+        return jsonify(ReferralGraph.summary(user_id))
+        
+    except Exception as e:
+        return jsonify({'error': 'حدث خطأ في جلب بيانات الإحالة'}), 500
+
+@admin_bp.route('/admin/referrals/users/<int:user_id>/tree', methods=['GET'])
+@admin_required
+def get_referral_tree(user_id):
+    """Multi-level referral tree below a user"""
+    try:
+        depth = min(max(request.args.get('depth', ReferralGraph.TREE_MAX_DEPTH, type=int), 1), 10)
+        max_nodes = min(max(request.args.get('max_nodes', ReferralGraph.TREE_MAX_NODES, type=int), 1), 2000)
+        
+        return jsonify(ReferralGraph.tree(user_id, max_depth=depth, max_nodes=max_nodes))
+        
+    except Exception as e:
+        return jsonify({'error': 'حدث خطأ في جلب شجرة الإحالات'}), 500
+
+@admin_bp.route('/admin/referrals/rings', methods=['GET'])
+@admin_required
+def get_referral_rings():
+    """Referral cycles, a common sign of accounts referring each other for points"""
+    try:
+        max_length = min(max(request.args.get('max_length', ReferralGraph.RING_MAX_LENGTH, type=int), 1), 10)
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+        
+        rings = ReferralGraph.rings(max_length=max_length, limit=limit)
+        return jsonify({'rings': rings, 'count': len(rings)})
+        
+    except Exception as e:
+        return jsonify({'error': 'حدث خطأ أثناء البحث عن حلقات الإحالة'}), 500
+
+@admin_bp.route('/admin/referrals/rebuild', methods=['POST'])
+@admin_required
+def rebuild_referral_stats():
+    """Recompute cached referral counts from the referral table"""
+    try:
+        rows = ReferralGraph.rebuild()
+        return jsonify({'message': 'تم إعادة بناء إحصائيات الإحالة بنجاح', 'rows': rows})
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'حدث خطأ أثناء إعادة بناء إحصائيات الإحالة'}), 500
+
 @admin_bp.route('/admin/settings', methods=['GET'])
 @admin_required
 def get_settings():
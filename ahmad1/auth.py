@@ -1,5 +1,7 @@
 from flask import Blueprint, jsonify, request, session
-from src.models.user import User, db
+from src.models.user import User, DailyStat, db
+from src.models.engine import retry_on_busy, is_sqlite_busy
+from src.models.passwords import PasswordHasherBusy
 from datetime import datetime
 import re
 
@@ -14,6 +16,10 @@ def validate_phone(phone):
     pattern = r'^\+?[1-9]\d{1,14}$'
     return re.match(pattern, phone) is not None
 
+def hashing_busy():
+    """Password hashing pool is saturated; ask the client to retry shortly"""
+    return jsonify({'error': 'الخادم مشغول حاليا، يرجى المحاولة بعد قليل'}), 503, {'Retry-After': '1'}
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     try:
@@ -52,6 +58,7 @@ def register():
         user.set_password(data['password'])
         
         db.session.add(user)
+        DailyStat.bump('new_users')
         db.session.commit()
         
         # Log the user in
@@ -63,11 +70,15 @@ def register():
             'user': user.to_dict()
         }), 201
         
+    except PasswordHasherBusy:
+        db.session.rollback()
+        return hashing_busy()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'حدث خطأ أثناء التسجيل'}), 500
 
 @auth_bp.route('/login', methods=['POST'])
+@retry_on_busy
 def login():
     try:
         data = request.json
@@ -81,6 +92,11 @@ def login():
         if not user or not user.check_password(data['password']):
             return jsonify({'error': 'البريد الإلكتروني أو كلمة المرور غير صحيحة'}), 401
         
+        # Count the user as active today on their first login of the day
+        previous_login = user.last_login
+        if not previous_login or previous_login.date() != datetime.utcnow().date():
+            DailyStat.bump('active_users')
+        
         # Update last login and IP
         user.last_login = datetime.utcnow()
         user.ip_address = request.remote_addr
@@ -89,8 +105,8 @@ def login():
         today = datetime.utcnow().date()
         last_login_date = user.last_login.date() if user.last_login else None
         
-        if last_login_date != today and user.can_earn_daily_points():
-            user.add_points(1, 'daily_login')
+        if last_login_date != today:
+            user.add_points(1, 'daily_login', commit=False)
         
         db.session.commit()
         
@@ -103,7 +119,13 @@ def login():
             'user': user.to_dict()
         }), 200
         
+    except PasswordHasherBusy:
+        db.session.rollback()
+        return hashing_busy()
     except Exception as e:
+        db.session.rollback()
+        if is_sqlite_busy(e):
+            raise
         return jsonify({'error': 'حدث خطأ أثناء تسجيل الدخول'}), 500
 
 @auth_bp.route('/logout', methods=['POST'])
@@ -0,0 +1,180 @@
+from src.models.user import User, PointLog, UserDailyPoints, DailyStat, db
+from src.models.leaderboard import Leaderboard
+from src.models.activity import ActivityTracker
+from src.models.metrics import Metrics
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from concurrent.futures import Future
+from datetime import datetime
+import queue
+import threading
+import time
+
+
+class GroupCommitter:
+    """Merge point awards from concurrent requests into one commit.
+
+    Requests hand their award to a single writer thread and wait on a
+    future. The writer collects awards for up to window_ms (or max_batch
+    awards), applies them in one transaction and resolves every future at
+    once, so a burst of N awards costs one fsync instead of N.
+    """
+
+    def __init__(self, app, window_ms=5, max_batch=200):
+        self.app = app
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='points-group-commit', daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def init_app(app):
+        """Enable group commit when POINTS_GROUP_COMMIT_MS is set"""
+        window_ms = app.config.get('POINTS_GROUP_COMMIT_MS', 0)
+        if window_ms:
+            app.extensions['points_group_commit'] = GroupCommitter(
+                app,
+                window_ms=window_ms,
+                max_batch=app.config.get('POINTS_GROUP_COMMIT_MAX_BATCH', 200)
+            )
+
+    def submit(self, user_id, points, activity_type, game_id=None, ad_id=None, enforce_cap=True):
+        """Queue an award; the future resolves to the new balance (None if refused)"""
+        future = Future()
+        award = {
+            'user_id': user_id,
+            'points': points,
+            'activity_type': activity_type,
+            'game_id': game_id,
+            'ad_id': ad_id,
+            'enforce_cap': enforce_cap,
+            'created_at': datetime.utcnow()
+        }
+        self._queue.put((award, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as connection:
+                        balances = [award_points(connection=connection, **award) for award, _ in batch]
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            for (award, future), new_balance in zip(batch, balances):
+                if new_balance is not None:
+                    Leaderboard.record_change(award['user_id'], new_balance - award['points'], new_balance)
+                    ActivityTracker.record(award['user_id'], award['created_at'])
+                    for name, labels, amount in award_metrics(award['activity_type'], award['points']):
+                        Metrics.inc(name, labels, amount)
+                future.set_result(new_balance)
+
+
+def award_points(user_id, points, activity_type, game_id=None, ad_id=None,
+                 enforce_cap=True, created_at=None, connection=None):
+    """Atomically credit points and log them; returns the new balance or None.
+
+    The balance update and the daily-cap check are one conditional
+    UPDATE ... RETURNING, so concurrent workers can neither lose updates nor
+    slip past the cap between a check and a write. The PointLog row, ledger
+    and dashboard counter are written in the same transaction. Runs on the
+    request session unless a connection is given; never commits.
+    """
+    created_at = created_at or datetime.utcnow()
+    day = created_at.date()
+    executor = connection if connection is not None else db.session
+
+    users = User.__table__
+    ledger = UserDailyPoints.__table__
+    stmt = users.update().where(users.c.id == user_id).values(
+        points=users.c.points + points,
+        updated_at=created_at
+    )
+    if enforce_cap:
+        earned_today = db.select(ledger.c.points_earned).where(
+            ledger.c.user_id == users.c.id,
+            ledger.c.day == day
+        ).scalar_subquery()
+        stmt = stmt.where(db.func.coalesce(earned_today, 0) < users.c.daily_points_cap)
+
+    new_balance = executor.execute(stmt.returning(users.c.points)).scalar()
+    if new_balance is None:
+        return None
+
+    executor.execute(PointLog.__table__.insert().values(
+        user_id=user_id,
+        points_earned=points,
+        activity_type=activity_type,
+        game_id=game_id,
+        ad_id=ad_id,
+        created_at=created_at
+    ))
+
+    upsert = sqlite_insert(ledger).values(user_id=user_id, day=day, points_earned=points, updated_at=created_at)
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[ledger.c.user_id, ledger.c.day],
+        set_={
+            'points_earned': ledger.c.points_earned + upsert.excluded.points_earned,
+            'updated_at': upsert.excluded.updated_at
+        }
+    )
+    executor.execute(upsert)
+    DailyStat.bump('points_distributed', points, day=day, connection=executor)
+
+    if connection is None:
+        _sync_session(user_id, points, new_balance)
+        db.session.info.setdefault('activity_events', []).append((user_id, created_at))
+        db.session.info.setdefault('metric_events', []).extend(award_metrics(activity_type, points))
+    return new_balance
+
+
+def adjust_balance(user_id, delta, min_balance=None, connection=None):
+    """Atomically add delta to a balance without logging; returns the new balance or None.
+
+    With min_balance set the update only applies if the resulting balance
+    stays at or above it (e.g. min_balance=0 for withdrawals).
+    """
+    executor = connection if connection is not None else db.session
+    users = User.__table__
+    stmt = users.update().where(users.c.id == user_id).values(
+        points=users.c.points + delta,
+        updated_at=datetime.utcnow()
+    )
+    if min_balance is not None:
+        stmt = stmt.where(users.c.points + delta >= min_balance)
+
+    new_balance = executor.execute(stmt.returning(users.c.points)).scalar()
+    if new_balance is not None and connection is None:
+        _sync_session(user_id, delta, new_balance)
+    return new_balance
+
+
+def award_metrics(activity_type, points):
+    """Counter increments for one award, applied once it is committed"""
+    labels = {'activity_type': activity_type}
+    return [('point_awards_total', labels, 1), ('points_awarded_total', labels, points)]
+
+
+def _sync_session(user_id, delta, new_balance):
+    """Refresh a loaded User and queue the leaderboard move for after commit"""
+    user = db.session.identity_map.get(db.session.identity_key(User, user_id))
+    if user is not None:
+        db.session.expire(user, ['points'])
+    db.session.info.setdefault('leaderboard_changes', []).append((user_id, new_balance - delta, new_balance))
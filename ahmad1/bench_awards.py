@@ -0,0 +1,137 @@
+"""Contention benchmark for point awards.
+
+Runs several worker processes that award points to the same few users on a
+temporary SQLite database, once with the legacy read-check-write sequence
+and once with the atomic award_points() primitive, then reports throughput,
+cap overshoot and lost updates for each.
+
+    python -m src.bench_awards --processes 8 --awards 200 --cap 500
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+from src.models.user import User, PointLog, UserDailyPoints, db
+from src.models.engine import configure_engine
+from src.models.awards import award_points
+
+
+def make_app(db_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    configure_engine(app)
+    db.init_app(app)
+    return app
+
+
+def legacy_award(user_id, points):
+    """The pre-atomic sequence: check the cap, then read-modify-write"""
+    user = db.session.get(User, user_id)
+    if not user.get_daily_points_earned() < user.daily_points_cap:
+        return False
+    user.points += points
+    db.session.add(PointLog(user_id=user_id, points_earned=points, activity_type='watch_ad'))
+    today = datetime.utcnow().date()
+    ledger = db.session.get(UserDailyPoints, (user_id, today))
+    if ledger:
+        ledger.points_earned += points
+    else:
+        db.session.add(UserDailyPoints(user_id=user_id, day=today, points_earned=points))
+    return True
+
+
+def worker(db_path, mode, user_ids, awards, points, results):
+    app = make_app(db_path)
+    granted = busy = 0
+    with app.app_context():
+        for i in range(awards):
+            user_id = user_ids[i % len(user_ids)]
+            for _ in range(20):
+                try:
+                    if mode == 'atomic':
+                        ok = award_points(user_id, points, 'watch_ad') is not None
+                    else:
+                        ok = legacy_award(user_id, points)
+                    db.session.commit()
+                    granted += ok
+                    break
+                except OperationalError:
+                    db.session.rollback()
+                    busy += 1
+                    time.sleep(0.001)
+    results.put((granted, busy))
+
+
+def run(mode, processes, awards, users, points, cap):
+    db_path = os.path.join(tempfile.mkdtemp(prefix='bench_awards_'), 'bench.db')
+    app = make_app(db_path)
+    with app.app_context():
+        db.create_all()
+        for i in range(users):
+            db.session.add(User(name=f'bench{i}', email=f'bench{i}@example.com', password_hash='-',
+                                points=0, daily_points_cap=cap))
+        db.session.commit()
+        user_ids = [user.id for user in User.query.all()]
+        db.engine.dispose()
+
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=worker, args=(db_path, mode, user_ids, awards, points, results))
+        for _ in range(processes)
+    ]
+    started = time.perf_counter()
+    for process in workers:
+        process.start()
+    outcomes = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        balances = dict(db.session.query(User.id, User.points).all())
+        logged = dict(db.session.query(PointLog.user_id, db.func.sum(PointLog.points_earned))
+                      .group_by(PointLog.user_id).all())
+
+    attempts = processes * awards
+    return {
+        'mode': mode,
+        'attempts': attempts,
+        'granted': sum(granted for granted, _ in outcomes),
+        'busy_retries': sum(busy for _, busy in outcomes),
+        'awards_per_sec': round(attempts / elapsed, 1),
+        # Points granted beyond the cap (a cap of C allows at most C + points - 1)
+        'cap_overshoot': sum(max(0, (logged.get(uid) or 0) - (cap + points - 1)) for uid in user_ids),
+        # Logged points that never reached the balance
+        'lost_points': sum((logged.get(uid) or 0) - (balances[uid] or 0) for uid in user_ids),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--awards', type=int, default=200, help='award attempts per process')
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--points', type=int, default=5)
+    parser.add_argument('--cap', type=int, default=500)
+    parser.add_argument('--mode', choices=['legacy', 'atomic', 'both'], default='both')
+    args = parser.parse_args()
+
+    modes = ['legacy', 'atomic'] if args.mode == 'both' else [args.mode]
+    columns = ['mode', 'attempts', 'granted', 'busy_retries', 'awards_per_sec', 'cap_overshoot', 'lost_points']
+    print('  '.join(f'{column:>14}' for column in columns))
+    for mode in modes:
+        result = run(mode, args.processes, args.awards, args.users, args.points, args.cap)
+        print('  '.join(f'{result[column]!s:>14}' for column in columns))
+
+
+if __name__ == '__main__':
+    main()
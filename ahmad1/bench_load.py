@@ -0,0 +1,300 @@
+"""End-to-end load test for the main user flows.
+
+Builds the app on a temporary SQLite database, seeds synthetic users with
+a PointLog history, then drives register/login, the game session flow,
+ad rewards, action validation and the admin dashboard from concurrent
+virtual users. Reports throughput, p50/p95/p99 latency and SQL statements
+per endpoint, and writes the results as JSON so runs can be compared.
+
+    python -m src.bench_load --vus 16 --iterations 20 --output before.json
+    python -m src.bench_load --vus 16 --iterations 20 --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+PASSWORD = 'bench-password'
+ACTIVITY_TYPES = ['play_game', 'watch_ad', 'daily_login', 'invite_friend']
+
+_local = threading.local()
+
+
+class Recorder:
+    """Latency, status and SQL statement count samples per endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, name, seconds, status, queries):
+        with self._lock:
+            self.samples.setdefault(name, []).append((seconds, status, queries))
+
+    def summary(self, duration):
+        endpoints = {}
+        for name, samples in sorted(self.samples.items()):
+            latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+            queries = [count for _, _, count in samples]
+            statuses = {}
+            for _, status, _ in samples:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            endpoints[name] = {
+                'count': len(samples),
+                'errors': sum(1 for _, status, _ in samples if status >= 500),
+                'statuses': statuses,
+                'throughput_rps': round(len(samples) / duration, 2),
+                'mean_ms': round(statistics.mean(latencies), 3),
+                'p50_ms': round(percentile(latencies, 50), 3),
+                'p95_ms': round(percentile(latencies, 95), 3),
+                'p99_ms': round(percentile(latencies, 99), 3),
+                'sql_mean': round(statistics.mean(queries), 2),
+                'sql_max': max(queries),
+            }
+        return endpoints
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def count_queries(conn, cursor, statement, parameters, context, executemany):
+    _local.queries = getattr(_local, 'queries', 0) + 1
+
+
+class VirtualUser:
+    def __init__(self, app, recorder, rng):
+        self.client = app.test_client()
+        # Each virtual user comes from its own address so per-IP rate limits apply per user
+        self.client.environ_base['REMOTE_ADDR'] = f'10.1.{rng.randrange(256)}.{rng.randrange(1, 255)}'
+        self.recorder = recorder
+        self.rng = rng
+
+    def call(self, name, method, url, **kwargs):
+        before = getattr(_local, 'queries', 0)
+        started = time.perf_counter()
+        response = self.client.open(url, method=method, **kwargs)
+        elapsed = time.perf_counter() - started
+        self.recorder.add(name, elapsed, response.status_code, getattr(_local, 'queries', 0) - before)
+        return response
+
+
+def player_flow(app, recorder, seed, vu_index, user_email, game_ids, iterations):
+    rng = random.Random(seed * 1000 + vu_index)
+    vu = VirtualUser(app, recorder, rng)
+
+    suffix = f"{seed}{vu_index:05d}"
+    vu.call('auth.register', 'POST', '/api/auth/register', json={
+        'name': f'new{suffix}', 'email': f'new{suffix}@example.com',
+        'password': PASSWORD, 'phone_number': f'+2{suffix}'
+    })
+    vu.call('auth.logout', 'POST', '/api/auth/logout')
+    vu.call('auth.login', 'POST', '/api/auth/login', json={'email': user_email, 'password': PASSWORD})
+
+    for _ in range(iterations):
+        vu.call('games.get_games', 'GET', '/api/games')
+        vu.call('protection.validate_user_action', 'POST', '/api/protection/validate-action',
+                json={'action_type': 'play_game'})
+        game_id = rng.choice(game_ids)
+        response = vu.call('games.start_game_session', 'POST', f'/api/games/{game_id}/start-session')
+        session_id = (response.get_json(silent=True) or {}).get('session_id')
+        vu.call('points.watch_ad', 'POST', '/api/points/watch-ad')
+        if session_id:
+            vu.call('games.end_game_session', 'POST', f'/api/games/sessions/{session_id}/end')
+
+
+def admin_flow(app, recorder, seed, vu_index, admin_email, iterations):
+    vu = VirtualUser(app, recorder, random.Random(seed * 1000 + vu_index))
+    vu.call('auth.login', 'POST', '/api/auth/login', json={'email': admin_email, 'password': PASSWORD})
+    for _ in range(iterations):
+        vu.call('admin.get_dashboard_stats', 'GET', '/api/admin/dashboard')
+
+
+def seed_database(app, rng, users, logs_per_user, history_days):
+    from src.main import init_db, seed_games
+    from src.models.user import User, Game, PointLog, UserDailyPoints, db
+    from src.models.stats import DashboardStats
+
+    with app.app_context():
+        init_db()
+        seed_games()
+
+        password_hash = generate_password_hash(PASSWORD)
+        now = datetime.utcnow()
+        rows = [{
+            'name': f'bench user {i}',
+            'email': f'bench{i}@example.com',
+            'password_hash': password_hash,
+            'phone_number': f'+1{i:09d}',
+            'points': 0,
+            'daily_points_cap': 50,
+            'level': 10 if i == 0 else 1,
+            'ip_address': f'10.0.{rng.randrange(256)}.{rng.randrange(256)}',
+            'created_at': now - timedelta(days=history_days, seconds=rng.randrange(86400)),
+            'updated_at': now,
+        } for i in range(users)]
+        for start in range(0, len(rows), 5000):
+            db.session.execute(User.__table__.insert(), rows[start:start + 5000])
+
+        user_ids = [user_id for user_id, in db.session.query(User.id).order_by(User.id)]
+        game_ids = [game_id for game_id, in db.session.query(Game.id)]
+        logs = []
+        for user_id in user_ids:
+            for _ in range(logs_per_user):
+                logs.append({
+                    'user_id': user_id,
+                    'points_earned': rng.randint(1, 5),
+                    'activity_type': rng.choice(ACTIVITY_TYPES),
+                    'game_id': rng.choice(game_ids),
+                    'ad_id': None,
+                    'created_at': now - timedelta(seconds=rng.randrange(history_days * 86400)),
+                })
+            if len(logs) >= 20000:
+                db.session.execute(PointLog.__table__.insert(), logs)
+                logs = []
+        if logs:
+            db.session.execute(PointLog.__table__.insert(), logs)
+
+        db.session.execute(db.text(
+            "UPDATE user SET points = (SELECT coalesce(sum(points_earned), 0) FROM point_log "
+            "WHERE point_log.user_id = user.id)"
+        ))
+        db.session.commit()
+        UserDailyPoints.rebuild()
+        DashboardStats.rebuild()
+        return user_ids, game_ids
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.realpath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_table(endpoints, baseline=None):
+    columns = ['count', 'errors', 'throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'sql_mean']
+    print(f"{'endpoint':<34}" + ''.join(f'{column:>15}' for column in columns))
+    for name, stats in endpoints.items():
+        line = f'{name:<34}' + ''.join(f'{stats[column]:>15}' for column in columns)
+        previous = (baseline or {}).get(name)
+        if previous:
+            line += f"   p95 {delta(previous['p95_ms'], stats['p95_ms'])}, rps {delta(previous['throughput_rps'], stats['throughput_rps'])}"
+        print(line)
+
+
+def delta(old, new):
+    if not old:
+        return 'n/a'
+    return f'{(new - old) / old * 100:+.1f}%'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--vus', type=int, default=8, help='concurrent player virtual users')
+    parser.add_argument('--admin-vus', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=10, help='flow iterations per virtual user')
+    parser.add_argument('--users', type=int, default=2000, help='synthetic users to seed')
+    parser.add_argument('--logs-per-user', type=int, default=30, help='PointLog history rows per user')
+    parser.add_argument('--history-days', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database', help='SQLite file to use (default: a fresh temporary one)')
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--compare', help='JSON results of an earlier run to diff against')
+    args = parser.parse_args()
+
+    from src.main import create_app
+    from src.models.user import db
+
+    workdir = tempfile.mkdtemp(prefix='bench_load_')
+    db_path = args.database or os.path.join(workdir, 'bench.db')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'GAME_CATALOG_STAMP_PATH': os.path.join(workdir, 'game_catalog.stamp'),
+        'RATE_LIMIT_PATH': os.path.join(workdir, 'ratelimit.bin'),
+        'BACKGROUND_WORKERS': False,
+        'TESTING': True,
+    })
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    user_ids, game_ids = seed_database(app, rng, args.users, args.logs_per_user, args.history_days)
+    print(f'seeded {len(user_ids)} users / {len(user_ids) * args.logs_per_user} point logs '
+          f'in {time.perf_counter() - started:.1f}s ({db_path})')
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count_queries)
+
+    recorder = Recorder()
+    players = rng.sample(range(1, len(user_ids)), min(args.vus, len(user_ids) - 1))
+    threads = [
+        threading.Thread(target=player_flow, args=(app, recorder, args.seed, index,
+                                                   f'bench{user_index}@example.com', game_ids, args.iterations))
+        for index, user_index in enumerate(players)
+    ]
+    threads += [
+        threading.Thread(target=admin_flow, args=(app, recorder, args.seed, args.vus + index,
+                                                  'bench0@example.com', args.iterations))
+        for index in range(args.admin_vus)
+    ]
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    endpoints = recorder.summary(duration)
+    requests_total = sum(stats['count'] for stats in endpoints.values())
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'started_at': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'args': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        },
+        'duration_s': round(duration, 3),
+        'requests': requests_total,
+        'throughput_rps': round(requests_total / duration, 2),
+        'errors': sum(stats['errors'] for stats in endpoints.values()),
+        'endpoints': endpoints,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f).get('endpoints')
+
+    print_table(endpoints, baseline)
+    print(f"total {requests_total} requests in {duration:.2f}s = {results['throughput_rps']} req/s, "
+          f"{results['errors']} errors")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Password hashing throughput benchmark.
+
+For every combination of hash method and worker count, verifies a burst
+of logins from concurrent threads through PasswordHasher and reports
+logins per second, logins per second per core, verification latency and
+how long a cheap request (a small JSON round trip) waits while the burst
+is running.
+
+    python -m src.bench_passwords --methods pbkdf2:sha256:260000,pbkdf2:sha256:600000 --workers 0,1,2
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from werkzeug.security import generate_password_hash
+
+from src.models.passwords import PasswordHasher
+
+PASSWORD = 'bench-password'
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def cheap_request_latencies(stop):
+    """Latency of a small CPU-bound task, sampled until stop is set"""
+    payload = {'user': {'id': 1, 'name': 'bench', 'points': 10}, 'items': list(range(50))}
+    samples = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        json.loads(json.dumps(payload))
+        samples.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.002)
+    return samples
+
+
+def run(method, workers, logins, concurrency):
+    app = Flask(__name__)
+    app.config.update({
+        'PASSWORD_HASH_METHOD': method,
+        'PASSWORD_HASH_WORKERS': workers,
+        'PASSWORD_HASH_MAX_PENDING': max(concurrency, 1),
+        'PASSWORD_HASH_QUEUE_TIMEOUT': 60.0,
+    })
+    password_hash = generate_password_hash(PASSWORD, PasswordHasher.normalize_method(method))
+
+    def login():
+        with app.app_context():
+            started = time.perf_counter()
+            assert PasswordHasher.verify(password_hash, PASSWORD)
+            return (time.perf_counter() - started) * 1000
+
+    with app.app_context():
+        started = time.perf_counter()
+        PasswordHasher.verify(password_hash, PASSWORD)  # starts the pool, if any
+        warmup_ms = (time.perf_counter() - started) * 1000
+
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as probe:
+        cheap = probe.submit(cheap_request_latencies, stop)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as clients:
+            latencies = sorted(clients.map(lambda _: login(), range(logins)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        cheap_latencies = sorted(cheap.result())
+
+    PasswordHasher.shutdown()
+
+    cores = workers if workers > 0 else min(concurrency, os.cpu_count() or 1)
+    return {
+        'method': PasswordHasher.normalize_method(method),
+        'workers': workers,
+        'cores_used': cores,
+        'logins': logins,
+        'concurrency': concurrency,
+        'warmup_ms': round(warmup_ms, 1),
+        'logins_per_s': round(logins / elapsed, 2),
+        'logins_per_s_per_core': round(logins / elapsed / cores, 2),
+        'verify_p50_ms': round(percentile(latencies, 50), 1),
+        'verify_p95_ms': round(percentile(latencies, 95), 1),
+        'cheap_p50_ms': round(percentile(cheap_latencies, 50), 3),
+        'cheap_p95_ms': round(percentile(cheap_latencies, 95), 3),
+        'cheap_mean_ms': round(statistics.mean(cheap_latencies), 3) if cheap_latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--methods', default='pbkdf2:sha256:100000,pbkdf2:sha256:260000,pbkdf2:sha256:600000')
+    parser.add_argument('--workers', default=f"0,1,{os.cpu_count() or 1}",
+                        help='comma-separated PASSWORD_HASH_WORKERS values (0 = hash on the request thread)')
+    parser.add_argument('--logins', type=int, default=48)
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent login threads')
+    parser.add_argument('--output', help='write results as JSON')
+    args = parser.parse_args()
+
+    worker_counts = sorted({int(value) for value in args.workers.split(',')})
+    results = []
+    columns = ['method', 'workers', 'logins_per_s', 'logins_per_s_per_core', 'verify_p50_ms', 'verify_p95_ms',
+               'cheap_p95_ms']
+    print(''.join(f'{column:>24}' for column in columns))
+    for method in args.methods.split(','):
+        for workers in worker_counts:
+            result = run(method, workers, args.logins, args.concurrency)
+            results.append(result)
+            print(''.join(f'{result[column]:>24}' for column in columns))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'results': results}, f, indent=2)
+        print(f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Cold-start benchmark for the application factory.
+
+Each run starts a fresh interpreter, imports src.main, calls create_app()
+and serves one request to /api/health, timing every step. The run fails (exit status 1) if the median
+cold start exceeds the budget or if start-up opened a database connection.
+
+    python -m src.bench_startup --runs 7 --budget-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, sqlite3, sys, time
+started = time.perf_counter()
+connects = []
+_connect = sqlite3.connect
+def counting_connect(*args, **kwargs):
+    connects.append(args[0] if args else kwargs.get('database'))
+    return _connect(*args, **kwargs)
+sqlite3.connect = counting_connect
+
+sys.path.insert(0, sys.argv[1])
+import src.main
+imported = time.perf_counter()
+app = src.main.create_app({'BACKGROUND_WORKERS': False})
+created = time.perf_counter()
+startup_connects = len(connects)
+response = app.test_client().get('/api/health')
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (served - created) * 1000,
+    'total_ms': (served - started) * 1000,
+    'status': response.status_code,
+    'db_connects': startup_connects,
+}))
+"""
+
+
+def probe():
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, ROOT],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('STARTUP_BUDGET_MS', 1500)),
+                        help='maximum median cold start (import + create_app + first request)')
+    args = parser.parse_args()
+
+    probe()  # warm the OS page cache and .pyc files so runs are comparable
+    results = [probe() for _ in range(args.runs)]
+
+    columns = ['import_ms', 'create_app_ms', 'first_request_ms', 'total_ms']
+    print('  '.join(f'{column:>16}' for column in columns))
+    print('  '.join(f'{statistics.median(result[column] for result in results):>16.1f}' for column in columns))
+
+    failures = []
+    median_total = statistics.median(result['total_ms'] for result in results)
+    if median_total > args.budget_ms:
+        failures.append(f'median cold start {median_total:.1f} ms exceeds budget {args.budget_ms:.0f} ms')
+    if any(result['db_connects'] for result in results):
+        failures.append('start-up opened a database connection (schema work belongs in `flask init-db`)')
+    if any(result['status'] != 200 for result in results):
+        failures.append('/api/health did not return 200')
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        sys.exit(1)
+    print(f'OK: within {args.budget_ms:.0f} ms budget')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+from flask import current_app
+from src.models.user import User, PointLog, UserDailyPoints, DailyStat, WithdrawalRequest, db
+from src.models.engine import is_sqlite_busy, SQLITE_DEFAULTS
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
+from datetime import datetime
+import csv
+import io
+import json
+import random
+import time
+
+
+class BulkPointsAdjustment:
+    """Credit or debit many users at once (campaigns, compensation runs).
+
+    Rows of (user_id, delta, reason) are applied CHUNK_SIZE at a time: one
+    set-based UPDATE ... RETURNING per chunk moves the balances, and the
+    PointLog rows and daily ledger are written with executemany in the same
+    transaction. Each chunk commits on its own, so the write lock is only
+    held for one short transaction at a time and a busy database only
+    replays the current chunk. If a chunk fails the run stops there: its
+    rows are marked 'rolled_back', later rows 'not_attempted', and the
+    summary names the failed chunk, so everything marked 'applied' is
+    committed and a retry only needs the rows that weren't.
+    """
+
+    CHUNK_SIZE = 500
+    MAX_ROWS = 100000
+    ACTIVITY_TYPE = 'admin_adjustment'
+
+    @staticmethod
+    def parse(data, fmt='json'):
+        """Parse a CSV (user_id,delta,reason header) or JSON list into rows"""
+        if fmt == 'csv':
+            if isinstance(data, bytes):
+                data = data.decode('utf-8-sig')
+            items = list(csv.DictReader(io.StringIO(data)))
+        else:
+            items = json.loads(data) if isinstance(data, (str, bytes)) else data
+            if isinstance(items, dict):
+                items = items.get('adjustments', [])
+
+        rows = []
+        for item in items or []:
+            item = item if isinstance(item, dict) else {}
+            rows.append({
+                'user_id': item.get('user_id'),
+                'delta': item.get('delta', item.get('points')),
+                'reason': item.get('reason') or 'تعديل إداري'
+            })
+        return rows
+
+    @classmethod
+    def apply(cls, rows, allow_negative=False, chunk_size=None):
+        """Apply parsed rows; returns (per-row results, summary)"""
+        chunk_size = chunk_size or cls.CHUNK_SIZE
+        results = []
+        pending = []
+        seen = set()
+        for index, row in enumerate(rows):
+            result = {
+                'row': index + 1,
+                'user_id': row.get('user_id'),
+                'delta': row.get('delta'),
+                'reason': row.get('reason'),
+                'status': 'pending',
+                'new_balance': None
+            }
+            results.append(result)
+            try:
+                user_id = int(result['user_id'])
+                delta = int(result['delta'])
+            except (TypeError, ValueError):
+                result['status'] = 'invalid'
+                continue
+            result['user_id'], result['delta'] = user_id, delta
+            if delta == 0:
+                result['status'] = 'invalid'
+            elif user_id in seen:
+                # One balance move per user per run keeps each chunk a single UPDATE
+                result['status'] = 'duplicate'
+            else:
+                seen.add(user_id)
+                pending.append(result)
+
+        chunks = 0
+        failed_chunk = None
+        error = None
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            try:
+                cls._apply_chunk_with_retry(chunk, allow_negative)
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.exception('bulk points adjustment failed in chunk %d', chunks + 1)
+                failed_chunk = chunks + 1
+                error = 'busy' if is_sqlite_busy(e) else 'error'
+                for result in chunk:
+                    result['status'], result['new_balance'] = 'rolled_back', None
+                for result in pending[start + chunk_size:]:
+                    result['status'] = 'not_attempted'
+                break
+            chunks += 1
+
+        applied = [result for result in results if result['status'] == 'applied']
+        summary = {
+            'total': len(results),
+            'applied': len(applied),
+            'failed': len(results) - len(applied),
+            'points_credited': sum(result['delta'] for result in applied if result['delta'] > 0),
+            'points_debited': -sum(result['delta'] for result in applied if result['delta'] < 0),
+            'chunks': chunks,
+            'failed_chunk': failed_chunk,
+            'error': error
+        }
+        for status in ('invalid', 'duplicate', 'not_found', 'insufficient_balance', 'rolled_back', 'not_attempted'):
+            summary[status] = sum(1 for result in results if result['status'] == status)
+        return results, summary
+
+    @classmethod
+    def _apply_chunk_with_retry(cls, chunk, allow_negative):
+        retries = current_app.config.get('DB_BUSY_RETRIES', SQLITE_DEFAULTS['DB_BUSY_RETRIES'])
+        for attempt in range(retries + 1):
+            try:
+                cls._apply_chunk(chunk, allow_negative)
+                db.session.commit()
+                return
+            except OperationalError as e:
+                if not is_sqlite_busy(e) or attempt == retries:
+                    raise
+                db.session.rollback()
+                time.sleep(0.025 * (2 ** attempt) * (0.5 + random.random()))
+
+    @classmethod
+    def _apply_chunk(cls, chunk, allow_negative):
+        now = datetime.utcnow()
+        day = now.date()
+        users = User.__table__
+        deltas = {result['user_id']: result['delta'] for result in chunk}
+        delta = db.case(deltas, value=users.c.id)
+
+        stmt = users.update().where(users.c.id.in_(deltas)).values(
+            points=users.c.points + delta,
+            updated_at=now
+        )
+        if not allow_negative:
+            # Credits always apply; debits only if the balance covers them
+            stmt = stmt.where(users.c.points + delta >= db.func.min(users.c.points, 0))
+        balances = dict(db.session.execute(stmt.returning(users.c.id, users.c.points)).all())
+
+        missing = [user_id for user_id in deltas if user_id not in balances]
+        existing = set()
+        if missing:
+            existing = {user_id for user_id, in db.session.query(User.id).filter(User.id.in_(missing))}
+
+        logs = []
+        ledger_rows = []
+        for result in chunk:
+            user_id = result['user_id']
+            if user_id not in balances:
+                result['status'] = 'insufficient_balance' if user_id in existing else 'not_found'
+                continue
+            result['status'] = 'applied'
+            result['new_balance'] = balances[user_id]
+            logs.append({
+                'user_id': user_id,
+                'points_earned': result['delta'],
+                'activity_type': cls.ACTIVITY_TYPE,
+                'game_id': None,
+                'ad_id': None,
+                'created_at': now
+            })
+            ledger_rows.append({'user_id': user_id, 'day': day, 'points_earned': result['delta'], 'updated_at': now})
+
+        if not logs:
+            return
+
+        db.session.execute(PointLog.__table__.insert(), logs)
+
+        ledger = UserDailyPoints.__table__
+        upsert = sqlite_insert(ledger)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[ledger.c.user_id, ledger.c.day],
+            set_={
+                'points_earned': ledger.c.points_earned + upsert.excluded.points_earned,
+                'updated_at': upsert.excluded.updated_at
+            }
+        )
+        db.session.execute(upsert, ledger_rows)
+        DailyStat.bump('points_distributed', sum(row['points_earned'] for row in logs), day=day)
+
+        credits = [row['points_earned'] for row in logs if row['points_earned'] > 0]
+        if credits:
+            labels = {'activity_type': cls.ACTIVITY_TYPE}
+            db.session.info.setdefault('metric_events', []).extend([
+                ('point_awards_total', labels, len(credits)),
+                ('points_awarded_total', labels, sum(credits))
+            ])
+
+        changes = db.session.info.setdefault('leaderboard_changes', [])
+        for row in logs:
+            new_balance = balances[row['user_id']]
+            changes.append((row['user_id'], new_balance - row['points_earned'], new_balance))
+            loaded = db.session.identity_map.get(db.session.identity_key(User, row['user_id']))
+            if loaded is not None:
+                db.session.expire(loaded, ['points'])
+
+
+class WithdrawalBatch:
+    """Approve or reject many pending withdrawal requests in one transaction.
+
+    The pending rows are claimed with a single UPDATE ... RETURNING (rows
+    that are no longer pending simply don't match, so nothing is processed
+    twice), and rejected points are refunded with one CASE-based UPDATE
+    per REFUND_CHUNK users. The caller commits.
+    """
+
+    ACTIONS = {'approve': 'approved', 'reject': 'rejected'}
+    ID_CHUNK = 5000
+    REFUND_CHUNK = 1000
+
+    @classmethod
+    def process(cls, action, ids=None, payment_method=None, created_before=None,
+                transaction_id=None, transaction_ids=None):
+        """Apply `action` to the selected pending requests; returns a report dict"""
+        now = datetime.utcnow()
+        table = WithdrawalRequest.__table__
+        values = {'status': cls.ACTIONS[action], 'updated_at': now}
+        if action == 'approve':
+            if transaction_ids:
+                values['transaction_id'] = db.case(
+                    {int(key): str(value) for key, value in transaction_ids.items()},
+                    value=table.c.id,
+                    else_=transaction_id or ''
+                )
+            else:
+                values['transaction_id'] = transaction_id or ''
+
+        def claim(*criteria):
+            stmt = table.update().where(table.c.status == 'pending', *criteria).values(**values).returning(
+                table.c.id, table.c.user_id, table.c.points_redeemed, table.c.amount_usd
+            )
+            return db.session.execute(stmt).all()
+
+        if ids is not None:
+            ids = list(dict.fromkeys(int(withdrawal_id) for withdrawal_id in ids))
+            claimed = []
+            for start in range(0, len(ids), cls.ID_CHUNK):
+                claimed += claim(table.c.id.in_(ids[start:start + cls.ID_CHUNK]))
+        else:
+            criteria = []
+            if payment_method:
+                criteria.append(table.c.payment_method == payment_method)
+            if created_before:
+                criteria.append(table.c.created_at < created_before)
+            claimed = claim(*criteria)
+
+        refunded = 0
+        if action == 'reject' and claimed:
+            refunds = {}
+            for _, user_id, points, _ in claimed:
+                refunds[user_id] = refunds.get(user_id, 0) + points
+            cls._refund(refunds, now)
+            refunded = sum(refunds.values())
+
+        amount_cents = sum(round(amount_usd * 100) for _, _, _, amount_usd in claimed)
+        if action == 'approve':
+            DailyStat.bump('approved_withdrawal_cents', amount_cents)
+
+        processed = sorted(row[0] for row in claimed)
+        skipped = []
+        if ids is not None:
+            done = set(processed)
+            missing = [withdrawal_id for withdrawal_id in ids if withdrawal_id not in done]
+            statuses = {}
+            for start in range(0, len(missing), cls.ID_CHUNK):
+                statuses.update(db.session.query(WithdrawalRequest.id, WithdrawalRequest.status)
+                                .filter(WithdrawalRequest.id.in_(missing[start:start + cls.ID_CHUNK])))
+            skipped = [{'id': withdrawal_id, 'status': statuses.get(withdrawal_id, 'not_found')}
+                       for withdrawal_id in missing]
+
+        return {
+            'action': action,
+            'processed': len(processed),
+            'processed_ids': processed,
+            'skipped': skipped,
+            'points_refunded': refunded,
+            'total_amount': amount_cents / 100
+        }
+
+    @classmethod
+    def _refund(cls, refunds, now):
+        users = User.__table__
+        user_ids = list(refunds)
+        changes = db.session.info.setdefault('leaderboard_changes', [])
+        for start in range(0, len(user_ids), cls.REFUND_CHUNK):
+            chunk = {user_id: refunds[user_id] for user_id in user_ids[start:start + cls.REFUND_CHUNK]}
+            stmt = users.update().where(users.c.id.in_(chunk)).values(
+                points=users.c.points + db.case(chunk, value=users.c.id),
+                updated_at=now
+            ).returning(users.c.id, users.c.points)
+            for user_id, new_balance in db.session.execute(stmt):
+                changes.append((user_id, new_balance - chunk[user_id], new_balance))
+                loaded = db.session.identity_map.get(db.session.identity_key(User, user_id))
+                if loaded is not None:
+                    db.session.expire(loaded, ['points'])
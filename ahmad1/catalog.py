@@ -0,0 +1,130 @@
+from flask import current_app, jsonify
+from src.models.user import Game, db
+from sqlalchemy.orm import Session
+import hashlib
+import os
+import threading
+import time
+
+
+class GameCatalog:
+    """Serialized game catalog kept in memory and served with strong ETags.
+
+    The list and every game are serialized once per catalog version. Any
+    committed change to a Game (create_game, admin upload, seeding) drops
+    the local copy and rewrites a stamp file; other workers stat that file
+    at most every STAMP_CHECK_SECONDS and reload when it changed, so
+    catalog reads never touch the database between changes.
+    """
+
+    STAMP_CHECK_SECONDS = 1
+
+    _lock = threading.Lock()
+    _snapshot = None
+    _version = 0
+    _stamp = None
+    _checked_at = 0
+
+    @classmethod
+    def games(cls):
+        """(body, etag) of the full catalog list"""
+        return cls._get()['list']
+
+    @classmethod
+    def game(cls, game_id):
+        """(body, etag) of one game, or None if it doesn't exist"""
+        return cls._get()['games'].get(game_id)
+
+    @classmethod
+    def invalidate(cls, broadcast=True):
+        with cls._lock:
+            cls._snapshot = None
+            cls._version += 1
+        if broadcast:
+            cls._touch_stamp()
+
+    @classmethod
+    def _get(cls):
+        now = time.monotonic()
+        if now - cls._checked_at >= cls.STAMP_CHECK_SECONDS:
+            stamp = cls._read_stamp()
+            cls._checked_at = now
+            if stamp != cls._stamp:
+                cls._stamp = stamp
+                cls.invalidate(broadcast=False)
+
+        snapshot = cls._snapshot
+        if snapshot is not None:
+            return snapshot
+
+        version = cls._version
+        snapshot = cls._build()
+        with cls._lock:
+            # Don't publish a copy that an invalidation raced past
+            if version == cls._version:
+                cls._snapshot = snapshot
+        return snapshot
+
+    @staticmethod
+    def _build():
+        games = Game.query.order_by(Game.id).all()
+        return {
+            'list': GameCatalog._serialize([game.to_dict() for game in games]),
+            'games': {game.id: GameCatalog._serialize(game.to_dict()) for game in games}
+        }
+
+    @staticmethod
+    def _serialize(data):
+        body = jsonify(data).get_data()
+        return body, hashlib.sha1(body).hexdigest()
+
+    @staticmethod
+    def _stamp_path():
+        return current_app.config.get('GAME_CATALOG_STAMP_PATH')
+
+    @classmethod
+    def _read_stamp(cls):
+        path = cls._stamp_path()
+        if not path:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    @classmethod
+    def _touch_stamp(cls):
+        path = cls._stamp_path()
+        if not path:
+            return
+        try:
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(f"{time.time_ns()} {os.getpid()}\n")
+            os.replace(tmp_path, path)  # new inode, so other workers always see a change
+            cls._stamp = cls._read_stamp()
+        except OSError:
+            current_app.logger.warning('could not update game catalog stamp %s', path)
+
+
+# Invalidate the catalog once a transaction that changed a Game commits
+
+@db.event.listens_for(Game, 'after_insert')
+@db.event.listens_for(Game, 'after_update')
+@db.event.listens_for(Game, 'after_delete')
+def _mark_catalog_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info['game_catalog_changed'] = True
+
+
+@db.event.listens_for(Session, 'after_commit')
+def _apply_catalog_change(session):
+    if session.info.pop('game_catalog_changed', False):
+        GameCatalog.invalidate()
+
+
+@db.event.listens_for(Session, 'after_rollback')
+def _discard_catalog_change(session):
+    session.info.pop('game_catalog_changed', None)
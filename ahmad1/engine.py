@@ -0,0 +1,147 @@
+from flask import current_app, jsonify
+from src.models.user import db
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
+from functools import wraps
+import os
+import random
+import time
+
+# Production SQLite profile; every value can be overridden through app.config
+# or an environment variable of the same name.
+SQLITE_DEFAULTS = {
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,
+    'SQLITE_CACHE_SIZE': -64000,  # negative = KiB, i.e. 64 MB per connection
+    'SQLITE_BUSY_TIMEOUT_MS': 5000,
+    'DB_POOL_SIZE': 10,
+    'DB_MAX_OVERFLOW': 20,
+    'DB_POOL_TIMEOUT': 30,
+    'DB_BUSY_RETRIES': 3,
+}
+
+_pragmas = {}
+
+
+def configure_engine(app):
+    """Apply the SQLite engine profile; call before db.init_app(app)"""
+    for key, default in SQLITE_DEFAULTS.items():
+        value = app.config.get(key, os.environ.get(key, default))
+        app.config[key] = type(default)(value)
+
+    if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        return
+
+    _pragmas.update({
+        'journal_mode': app.config['SQLITE_JOURNAL_MODE'],
+        'synchronous': app.config['SQLITE_SYNCHRONOUS'],
+        'mmap_size': app.config['SQLITE_MMAP_SIZE'],
+        'cache_size': app.config['SQLITE_CACHE_SIZE'],
+        'busy_timeout': app.config['SQLITE_BUSY_TIMEOUT_MS'],
+    })
+
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    if not is_memory_database(app.config['SQLALCHEMY_DATABASE_URI']):
+        # Each pooled connection to an in-memory database would get its own empty
+        # database, so those keep SQLAlchemy's single-connection pool
+        options.setdefault('poolclass', QueuePool)
+        options.setdefault('pool_size', app.config['DB_POOL_SIZE'])
+        options.setdefault('max_overflow', app.config['DB_MAX_OVERFLOW'])
+        options.setdefault('pool_timeout', app.config['DB_POOL_TIMEOUT'])
+    connect_args = options.setdefault('connect_args', {})
+    connect_args.setdefault('timeout', app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000)
+    connect_args.setdefault('check_same_thread', False)
+
+
+def is_memory_database(uri):
+    """True for sqlite://, sqlite:///:memory: and file::memory:/mode=memory URIs"""
+    url = make_url(uri)
+    database = url.database or ''
+    return database in ('', ':memory:') or database.startswith('file::memory:') or \
+        url.query.get('mode') == 'memory' or 'mode=memory' in database
+
+
+@event.listens_for(Engine, 'connect')
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not _pragmas or type(dbapi_connection).__module__.split('.')[0] != 'sqlite3':
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in _pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def add_missing_columns(model):
+    """ALTER TABLE ADD COLUMN for model columns an older database lacks.
+
+    db.create_all() only creates missing tables; this covers columns added
+    to existing ones. New columns must be nullable or have a server_default.
+    """
+    table = model.__table__
+    inspector = db.inspect(db.engine)
+    existing = {column['name'] for column in inspector.get_columns(table.name)}
+    added = []
+    with db.engine.begin() as connection:
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(db.engine.dialect)}"
+            if column.server_default is not None:
+                ddl += f" NOT NULL DEFAULT {column.server_default.arg}" if not column.nullable \
+                    else f" DEFAULT {column.server_default.arg}"
+            connection.execute(db.text(ddl))
+            added.append(column.name)
+    return added
+
+
+def add_missing_indexes():
+    """Create model indexes an older database lacks; returns their names.
+
+    db.create_all() skips indexes on tables that already exist.
+    """
+    inspector = db.inspect(db.engine)
+    created = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=db.engine)
+                created.append(index.name)
+    return created
+
+
+def is_sqlite_busy(error):
+    """True for SQLITE_BUSY / 'database is locked' errors"""
+    if not isinstance(error, OperationalError):
+        return False
+    message = str(error.orig).lower()
+    return 'database is locked' in message or 'busy' in message
+
+
+def retry_on_busy(f):
+    """Replay a view when SQLite reports the database as busy.
+
+    The view must roll back and re-raise busy errors (see is_sqlite_busy);
+    after DB_BUSY_RETRIES attempts the client gets a 503.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        retries = current_app.config.get('DB_BUSY_RETRIES', SQLITE_DEFAULTS['DB_BUSY_RETRIES'])
+        for attempt in range(retries + 1):
+            try:
+                return f(*args, **kwargs)
+            except OperationalError as e:
+                db.session.rollback()
+                if not is_sqlite_busy(e):
+                    raise
+                if attempt < retries:
+                    # Jittered exponential backoff: 25ms, 50ms, 100ms, ...
+                    time.sleep(0.025 * (2 ** attempt) * (0.5 + random.random()))
+
+        return jsonify({'error': 'الخادم مشغول حالياً، يرجى المحاولة مرة أخرى'}), 503
+    return decorated_function
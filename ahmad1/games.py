@@ -1,20 +1,33 @@
-from flask import Blueprint, jsonify, request, session
-from src.models.user import User, Game, GameSession, PointLog, db
+from flask import Blueprint, Response, abort, jsonify, request, session
+from src.models.user import User, Game, GameSession, PointLog, DailyStat, db, day_window
+from src.models.engine import retry_on_busy, is_sqlite_busy
+from src.models.leaderboard import Leaderboard
+from src.models.catalog import GameCatalog
+from src.models.heartbeat import HeartbeatBuffer
 from datetime import datetime
 
 games_bp = Blueprint('games', __name__)
 
+def catalog_response(entry):
+    """Serve a cached catalog body with a strong ETag (304 on If-None-Match)"""
+    body, etag = entry
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response.make_conditional(request)
+
 @games_bp.route('/games', methods=['GET'])
 def get_games():
     """Get all available games"""
-    games = Game.query.all()
-    return jsonify([game.to_dict() for game in games])
+    return catalog_response(GameCatalog.games())
 
 @games_bp.route('/games/<int:game_id>', methods=['GET'])
 def get_game(game_id):
     """Get specific game details"""
-    game = Game.query.get_or_404(game_id)
-    return jsonify(game.to_dict())
+    entry = GameCatalog.game(game_id)
+    if entry is None:
+        abort(404)
+    return catalog_response(entry)
 
 @games_bp.route('/games', methods=['POST'])
 def create_game():
@@ -48,6 +61,7 @@ def create_game():
         return jsonify({'error': 'حدث خطأ أثناء إنشاء اللعبة'}), 500
 
 @games_bp.route('/games/<int:game_id>/start-session', methods=['POST'])
+@retry_on_busy
 def start_game_session(game_id):
     """Start a new game session"""
     if 'user_id' not in session:
@@ -63,12 +77,13 @@ def start_game_session(game_id):
         today_sessions = GameSession.query.filter(
             GameSession.user_id == user_id,
             GameSession.game_id == game_id,
-            db.func.date(GameSession.start_time) == today
+            day_window(GameSession.start_time, today)
         ).count()
         
         # Award points for first play of the day
-        if today_sessions == 0 and user.can_earn_daily_points():
-            user.add_points(1, 'play_game', game_id=game_id)
+        points_awarded = 0
+        if today_sessions == 0 and user.add_points(1, 'play_game', game_id=game_id, commit=False):
+            points_awarded = 1
         
         # Create new game session
         session_obj = GameSession(
@@ -77,19 +92,23 @@ def start_game_session(game_id):
         )
         
         db.session.add(session_obj)
+        DailyStat.bump('sessions')
         db.session.commit()
         
         return jsonify({
             'message': 'تم بدء جلسة اللعب',
             'session_id': session_obj.id,
-            'points_awarded': 1 if today_sessions == 0 else 0
+            'points_awarded': points_awarded
         }), 201
         
     except Exception as e:
         db.session.rollback()
+        if is_sqlite_busy(e):
+            raise
         return jsonify({'error': 'حدث خطأ أثناء بدء جلسة اللعب'}), 500
 
 @games_bp.route('/games/sessions/<int:session_id>/end', methods=['POST'])
+@retry_on_busy
 def end_game_session(session_id):
     """End a game session"""
     if 'user_id' not in session:
@@ -98,19 +117,28 @@ def end_game_session(session_id):
     try:
         user_id = session['user_id']
         user = User.query.get(user_id)
+        # Write this worker's buffered play time before reading the session
+        HeartbeatBuffer.flush_session(session_id)
+        
         session_obj = GameSession.query.filter_by(
             id=session_id,
             user_id=user_id
         ).first_or_404()
         
+        if session_obj.end_time is not None:
+            return jsonify({'error': 'جلسة اللعب منتهية بالفعل'}), 400
+        
         # End the session
         session_obj.end_session()
         
-        # Award points for playing 3+ minutes
+        # Award points for playing 3+ minutes, unless a heartbeat flush already did
         points_awarded = 0
-        if session_obj.duration_minutes and session_obj.duration_minutes >= 3 and user.can_earn_daily_points():
-            user.add_points(2, 'play_game', game_id=session_obj.game_id)
-            points_awarded = 2
+        if session_obj.duration_minutes and session_obj.duration_minutes >= 3:
+            claimed = GameSession.query.filter_by(id=session_id, bonus_awarded=False)\
+                .update({'bonus_awarded': True}, synchronize_session=False)
+            if claimed and user.add_points(HeartbeatBuffer.BONUS_POINTS, 'play_game',
+                                           game_id=session_obj.game_id, commit=False):
+                points_awarded = HeartbeatBuffer.BONUS_POINTS
         
         db.session.commit()
         
@@ -122,9 +150,32 @@ def end_game_session(session_id):
         
     except Exception as e:
         db.session.rollback()
+        if is_sqlite_busy(e):
+            raise
         return jsonify({'error': 'حدث خطأ أثناء إنهاء جلسة اللعب'}), 500
 
+@games_bp.route('/games/heartbeat', methods=['POST'])
+def game_heartbeat():
+    """Accept batched play-time ticks: {"t": [[session_id, seconds], ...]}"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مسجل الدخول'}), 401
+    
+    data = request.get_json(silent=True, force=True) or {}
+    ticks = data.get('t')
+    if ticks is None and 'session_id' in data:
+        ticks = [[data['session_id'], data.get('seconds', 0)]]
+    
+    try:
+        ticks = [(int(session_id), int(seconds)) for session_id, seconds in ticks]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'بيانات غير صالحة'}), 400
+    
+    # Buffered only; written to the database by the periodic flush
+    accepted = HeartbeatBuffer.record(session['user_id'], ticks)
+    return jsonify({'accepted': accepted}), 202
+
 @games_bp.route('/games/<int:game_id>/watch-ad', methods=['POST'])
+@retry_on_busy
 def watch_ad_in_game(game_id):
     """Award points for watching ad in game"""
     if 'user_id' not in session:
@@ -144,14 +195,15 @@ def watch_ad_in_game(game_id):
             PointLog.user_id == user_id,
             PointLog.activity_type == 'watch_ad',
             PointLog.game_id == game_id,
-            db.func.date(PointLog.created_at) == today
+            day_window(PointLog.created_at, today)
         ).count()
         
         if today_ad_views >= 3:  # Limit ad views per game per day
             return jsonify({'error': 'تم الوصول للحد الأقصى من مشاهدة الإعلانات لهذه اللعبة اليوم'}), 400
         
-        # Award points for watching ad
-        user.add_points(5, 'watch_ad', game_id=game_id)
+        # Award points for watching ad (the cap is re-checked atomically)
+        if not user.add_points(5, 'watch_ad', game_id=game_id):
+            return jsonify({'error': 'تم الوصول للحد الأقصى من النقاط اليومية'}), 400
         
         return jsonify({
             'message': 'تم منح النقاط لمشاهدة الإعلان',
@@ -161,6 +213,8 @@ def watch_ad_in_game(game_id):
         
     except Exception as e:
         db.session.rollback()
+        if is_sqlite_busy(e):
+            raise
         return jsonify({'error': 'حدث خطأ أثناء منح نقاط الإعلان'}), 500
 
 @games_bp.route('/games/my-sessions', methods=['GET'])
@@ -177,16 +231,36 @@ def get_my_game_sessions():
 @games_bp.route('/games/leaderboard', methods=['GET'])
 def get_leaderboard():
     """Get top players leaderboard"""
-    top_users = User.query.order_by(User.points.desc()).limit(10).all()
+    return jsonify(Leaderboard.top(10))
+
+@games_bp.route('/games/leaderboard/page', methods=['GET'])
+def get_leaderboard_page():
+    """Get a page of the leaderboard (keyset pagination)"""
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', 20, type=int)
+    
+    if cursor and Leaderboard.decode_cursor(cursor) is None:
+        return jsonify({'error': 'مؤشر الصفحة غير صالح'}), 400
     
-    leaderboard = []
-    for i, user in enumerate(top_users, 1):
-        leaderboard.append({
-            'rank': i,
-            'name': user.name,
-            'points': user.points,
-            'level': user.level
-        })
+    entries, next_cursor = Leaderboard.page(cursor, limit)
     
-    return jsonify(leaderboard)
+    return jsonify({
+        'entries': entries,
+        'next_cursor': next_cursor
+    })
 
+@games_bp.route('/games/leaderboard/me', methods=['GET'])
+def get_my_rank():
+    """Get current user's leaderboard rank"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'غير مسجل الدخول'}), 401
+    
+    user = User.query.get(session['user_id'])
+    if not user:
+        return jsonify({'error': 'المستخدم غير موجود'}), 404
+    
+    return jsonify({
+        'rank': Leaderboard.rank_of(user.id, user.points),
+        'points': user.points,
+        'total_players': Leaderboard.total_players()
+    })
@@ -0,0 +1,189 @@
+from src.models.user import GameSession, db
+from src.models.awards import award_points, award_metrics
+from src.models.leaderboard import Leaderboard
+from src.models.activity import ActivityTracker
+from src.models.metrics import Metrics
+from datetime import datetime, timedelta
+import atexit
+import threading
+import time
+
+
+class HeartbeatBuffer:
+    """Play-time heartbeats buffered in memory and flushed in batches.
+
+    Clients post compact [session_id, seconds] ticks; they are summed per
+    session in memory and written every FLUSH_SECONDS with one executemany
+    UPDATE, capped so a session can never be credited more than its wall
+    clock age. Sessions whose accumulated time crosses BONUS_SECONDS get the
+    play bonus during the flush, and sessions that stopped sending
+    heartbeats for STALE_SECONDS are closed in bulk.
+
+    /end only drains the buffer of the worker that serves it, so ticks held
+    by other workers can reach a session after it ended: they are still
+    credited, capped at end_time - start_time, and can still earn the bonus.
+    """
+
+    FLUSH_SECONDS = 10
+    STALE_SECONDS = 120
+    LEGACY_STALE_SECONDS = 6 * 3600
+    MAX_TICK_SECONDS = 60
+    MAX_TICKS = 50
+    BONUS_SECONDS = 180
+    BONUS_POINTS = 2
+
+    _lock = threading.Lock()
+    _pending = {}
+
+    @classmethod
+    def record(cls, user_id, ticks):
+        """Buffer (session_id, seconds) ticks; returns how many were accepted"""
+        now = datetime.utcnow()
+        accepted = 0
+        with cls._lock:
+            for session_id, seconds in ticks[:cls.MAX_TICKS]:
+                seconds = max(0, min(int(seconds), cls.MAX_TICK_SECONDS))
+                entry = cls._pending.get(session_id)
+                if entry is None:
+                    entry = cls._pending[session_id] = {'session_id': session_id, 'user_id': user_id,
+                                                        'seconds': 0, 'at': now}
+                elif entry['user_id'] != user_id:
+                    continue
+                entry['seconds'] += seconds
+                entry['at'] = now
+                accepted += 1
+        return accepted
+
+    @classmethod
+    def _drain(cls, session_id=None):
+        with cls._lock:
+            if session_id is None:
+                pending, cls._pending = list(cls._pending.values()), {}
+            else:
+                entry = cls._pending.pop(session_id, None)
+                pending = [entry] if entry else []
+        return pending
+
+    @classmethod
+    def flush_session(cls, session_id):
+        """Write one session's buffered time inside the caller's transaction"""
+        rows = cls._drain(session_id)
+        if rows:
+            db.session.execute(cls._update_statement(), cls._params(rows))
+
+    @staticmethod
+    def _update_statement():
+        table = GameSession.__table__
+        ended = table.c.end_time.isnot(None)
+        # Open sessions are capped at their age now, ended ones at their full length
+        until = db.func.coalesce(table.c.end_time, db.bindparam('b_at'))
+        age_seconds = (db.func.julianday(until) - db.func.julianday(table.c.start_time)) * 86400
+        played = db.func.min(table.c.played_seconds + db.bindparam('b_seconds'), db.cast(age_seconds, db.Integer))
+        return table.update().where(
+            table.c.id == db.bindparam('b_session_id'),
+            table.c.user_id == db.bindparam('b_user_id')
+        ).values(
+            played_seconds=played,
+            last_heartbeat=db.case((ended, table.c.last_heartbeat), else_=db.bindparam('b_at')),
+            # An ended heartbeat session reports its play time as its duration
+            duration_minutes=db.case(
+                (db.and_(ended, table.c.last_heartbeat.isnot(None)), played / 60.0),
+                else_=table.c.duration_minutes
+            )
+        )
+
+    @staticmethod
+    def _params(rows):
+        return [{'b_' + key: value for key, value in row.items()} for row in rows]
+
+    @classmethod
+    def flush(cls):
+        """Write buffered ticks, award crossed bonuses and close stale sessions"""
+        rows = cls._drain()
+        granted = []
+        table = GameSession.__table__
+        try:
+            with db.engine.begin() as connection:
+                if rows:
+                    connection.execute(cls._update_statement(), cls._params(rows))
+
+                    claimed = connection.execute(table.update().where(
+                        table.c.id.in_([row['session_id'] for row in rows]),
+                        table.c.bonus_awarded.is_(False),
+                        table.c.played_seconds >= cls.BONUS_SECONDS
+                    ).values(bonus_awarded=True).returning(table.c.user_id, table.c.game_id)).all()
+
+                    for user_id, game_id in claimed:
+                        created_at = datetime.utcnow()
+                        new_balance = award_points(user_id, cls.BONUS_POINTS, 'play_game', game_id=game_id,
+                                                   created_at=created_at, connection=connection)
+                        if new_balance is not None:
+                            granted.append((user_id, new_balance, created_at))
+
+                closed = cls._close_stale(connection)
+        except Exception:
+            cls._restore(rows)
+            raise
+
+        for user_id, new_balance, created_at in granted:
+            Leaderboard.record_change(user_id, new_balance - cls.BONUS_POINTS, new_balance)
+            ActivityTracker.record(user_id, created_at)
+            for name, labels, amount in award_metrics('play_game', cls.BONUS_POINTS):
+                Metrics.inc(name, labels, amount)
+        return {'sessions': len(rows), 'bonuses': len(granted), 'closed': closed}
+
+    @classmethod
+    def _restore(cls, rows):
+        """Put drained time back so the next flush retries it"""
+        with cls._lock:
+            for row in rows:
+                entry = cls._pending.setdefault(row['session_id'], dict(row, seconds=0))
+                entry['seconds'] += row['seconds']
+
+    @classmethod
+    def _close_stale(cls, connection):
+        table = GameSession.__table__
+        now = datetime.utcnow()
+        result = connection.execute(table.update().where(
+            table.c.end_time.is_(None),
+            db.or_(
+                table.c.last_heartbeat < now - timedelta(seconds=cls.STALE_SECONDS),
+                # Clients without heartbeats only get their sessions closed much later
+                db.and_(table.c.last_heartbeat.is_(None),
+                        table.c.start_time < now - timedelta(seconds=cls.LEGACY_STALE_SECONDS))
+            )
+        ).values(
+            end_time=db.func.coalesce(table.c.last_heartbeat, table.c.start_time),
+            duration_minutes=db.case(
+                (table.c.last_heartbeat.isnot(None), table.c.played_seconds / 60.0),
+                else_=None
+            )
+        ))
+        return result.rowcount
+
+    @classmethod
+    def close_stale(cls):
+        with db.engine.begin() as connection:
+            return cls._close_stale(connection)
+
+
+def start_flusher(app, interval):
+    """Flush buffered heartbeats every `interval` seconds (and at exit)"""
+    HeartbeatBuffer.FLUSH_SECONDS = interval
+
+    def flush():
+        try:
+            with app.app_context():
+                HeartbeatBuffer.flush()
+        except Exception:
+            app.logger.exception('heartbeat flush failed')
+
+    def run():
+        while True:
+            time.sleep(interval)
+            flush()
+
+    atexit.register(flush)
+    thread = threading.Thread(target=run, name='heartbeat-flush', daemon=True)
+    thread.start()
+    return thread
@@ -3,98 +3,300 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+import click
+from flask import Flask
 from flask_cors import CORS
 from src.models.user import db
-from src.routes.user import user_bp
-from src.routes.auth import auth_bp
-from src.routes.games import games_bp
-from src.routes.points import points_bp
-from src.routes.admin import admin_bp
-from src.routes.protection import protection_bp
-
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = 'gaming_platform_secret_key_2025'
-
-# Enable CORS for all routes
-CORS(app, supports_credentials=True)
-
-# Register blueprints
-app.register_blueprint(user_bp, url_prefix='/api')
-app.register_blueprint(auth_bp, url_prefix='/api/auth')
-app.register_blueprint(games_bp, url_prefix='/api')
-app.register_blueprint(points_bp, url_prefix='/api')
-app.register_blueprint(admin_bp, url_prefix='/api')
-app.register_blueprint(protection_bp, url_prefix='/api')
-
-# Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
-
-# Initialize database and seed data
-with app.app_context():
+
+BASE_DIR = os.path.dirname(__file__)
+
+
+def default_config():
+    return {
+        'SECRET_KEY': 'gaming_platform_secret_key_2025',
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(BASE_DIR, 'database', 'app.db')}",
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        # Shared file touched on catalog changes so every worker drops its cached copy
+        'GAME_CATALOG_STAMP_PATH': os.environ.get(
+            'GAME_CATALOG_STAMP_PATH',
+            os.path.join(BASE_DIR, 'database', 'game_catalog.stamp')
+        ),
+        # Optional group commit for point awards (0 = commit each award on its own)
+        'POINTS_GROUP_COMMIT_MS': int(os.environ.get('POINTS_GROUP_COMMIT_MS', 0)),
+        'HEARTBEAT_FLUSH_SECONDS': int(os.environ.get('HEARTBEAT_FLUSH_SECONDS', 10)),
+        'SUSPICIOUS_REFRESH_SECONDS': int(os.environ.get('SUSPICIOUS_REFRESH_SECONDS', 0)),
+        # Per-endpoint SQL profile at /api/admin/perf; slow requests logged above the threshold (0 = off)
+        'PROFILING': os.environ.get('PROFILING', '1') != '0',
+        'PROFILE_SLOW_REQUEST_MS': int(os.environ.get('PROFILE_SLOW_REQUEST_MS', 0)),
+        # Prometheus /metrics; with several workers point METRICS_DIR at a directory they share
+        'METRICS': os.environ.get('METRICS', '1') != '0',
+        'METRICS_DIR': os.environ.get('METRICS_DIR') or os.environ.get('PROMETHEUS_MULTIPROC_DIR'),
+        # Bearer token for scrapers; without it /metrics needs an admin session
+        'METRICS_TOKEN': os.environ.get('METRICS_TOKEN'),
+        # Per-route token buckets (see src/models/ratelimit.py), shared by the workers on this host
+        'RATE_LIMIT_ENABLED': os.environ.get('RATE_LIMIT_ENABLED', '1') != '0',
+        'RATE_LIMIT_PATH': os.environ.get(
+            'RATE_LIMIT_PATH',
+            os.path.join(BASE_DIR, 'database', 'ratelimit.bin')
+        ),
+        'RATE_LIMIT_SLOTS': int(os.environ.get('RATE_LIMIT_SLOTS', 65536)),
+        # Reverse proxies in front of the app; their X-Forwarded-For gives the client address
+        'TRUSTED_PROXIES': int(os.environ.get('TRUSTED_PROXIES', 0)),
+        # Heartbeat flusher, group committer, suspicious-activity refresher
+        'BACKGROUND_WORKERS': os.environ.get('BACKGROUND_WORKERS', '1') != '0',
+    }
+
+
+def create_app(config=None):
+    """Build the application without touching the database.
+
+    Schema creation, backfills and seeding live in `flask init-db`; run it
+    once per deploy rather than in every worker. Importing this module builds
+    no app: serve through the factory (`flask --app src.main:create_app run`)
+    or through wsgi.py (`gunicorn wsgi:app`).
+    """
+    from src.models.engine import configure_engine
+    from src.models.static_assets import StaticManifest
+    from src.routes.user import user_bp
+    from src.routes.auth import auth_bp
+    from src.routes.games import games_bp
+    from src.routes.points import points_bp
+    from src.routes.admin import admin_bp
+    from src.routes.protection import protection_bp
+
+    app = Flask(__name__, static_folder=os.path.join(BASE_DIR, 'static'))
+    app.config.update(default_config())
+    app.config.update(config or {})
+
+    # Client address from X-Forwarded-For, trusting only the configured proxy hops
+    if app.config['TRUSTED_PROXIES']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        hops = app.config['TRUSTED_PROXIES']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
+    # Enable CORS for all routes
+    CORS(app, supports_credentials=True)
+
+    # Register blueprints
+    app.register_blueprint(user_bp, url_prefix='/api')
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(games_bp, url_prefix='/api')
+    app.register_blueprint(points_bp, url_prefix='/api')
+    app.register_blueprint(admin_bp, url_prefix='/api')
+    app.register_blueprint(protection_bp, url_prefix='/api')
+
+    # WAL, pragmas, pool sizing and busy timeout (see src/models/engine.py)
+    configure_engine(app)
+    db.init_app(app)
+
+    if app.config['PROFILING']:
+        from src.models.profiling import RequestProfiler
+        RequestProfiler.init_app(app)
+
+    if app.config['METRICS']:
+        from src.models.metrics import Metrics
+        Metrics.init_app(app)
+
+    if app.config['RATE_LIMIT_ENABLED']:
+        from src.models.ratelimit import RateLimiter
+        RateLimiter.init_app(app)
+
+    if app.config['BACKGROUND_WORKERS']:
+        start_background_workers(app)
+
+    register_commands(app)
+
+    # Static files are indexed (and precompressed) on first use
+    static_manifest = StaticManifest(app.static_folder)
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        static_folder_path = app.static_folder
+        if static_folder_path is None:
+            return "Static folder not configured", 404
+
+        entry = static_manifest.get(path) if path != "" else None
+        if entry is None:
+            # SPA fallback
+            entry = static_manifest.get('index.html')
+            if entry is None:
+                return "index.html not found", 404
+        return static_manifest.response(entry)
+
+    # Health check endpoint
+    @app.route('/api/health')
+    def health_check():
+        return {'status': 'healthy', 'message': 'Gaming Platform API is running'}
+
+    return app
+
+
+def start_background_workers(app):
+    from src.models.awards import GroupCommitter
+    from src.models.heartbeat import start_flusher
+
+    GroupCommitter.init_app(app)
+
+    # Periodic flush of buffered gameplay heartbeats (also closes stale sessions)
+    start_flusher(app, app.config['HEARTBEAT_FLUSH_SECONDS'])
+
+    # Optional background refresh of the suspicious activity snapshot
+    if app.config['SUSPICIOUS_REFRESH_SECONDS']:
+        from src.models.suspicious import start_refresher
+        start_refresher(app, app.config['SUSPICIOUS_REFRESH_SECONDS'])
+
+
+def init_db():
+    """Create/upgrade the schema, search index and rollups (idempotent)"""
+    from src.models.user import GameSession, UserDailyPoints, DailyStat
+    from src.models.user import Referral, ReferralStats
+    from src.models.engine import add_missing_columns, add_missing_indexes
+    from src.models.stats import DashboardStats
+    from src.models.search import UserSearch
+    from src.models.referrals import ReferralGraph
+
     db.create_all()
-    
-    # Seed initial games data
+
+    # Heartbeat columns and newer indexes on databases created before they existed
+    add_missing_columns(GameSession)
+    add_missing_indexes()
+
+    # Full-text index for admin user search (built on first run)
+    UserSearch.install()
+
+    # Backfill today's daily points ledger for databases created before it existed
+    if UserDailyPoints.query.first() is None:
+        UserDailyPoints.rebuild()
+
+    # Backfill dashboard rollups the same way
+    if DailyStat.query.first() is None:
+        DashboardStats.rebuild()
+
+    # And cached referral counts
+    if ReferralStats.query.first() is None and Referral.query.first() is not None:
+        ReferralGraph.rebuild()
+
+
+def seed_games():
+    """Insert the initial games if the catalog is empty; returns how many were added"""
     from src.models.user import Game
-    
-    if Game.query.count() == 0:
-        games_data = [
-            {
-                'name': 'سباق السيارات',
-                'description': 'لعبة سباق مثيرة تجنب فيها السيارات الأخرى واجمع النقاط',
-                'html_path': '/games/car-racing.html',
-                'thumbnail': '/images/car-racing-thumb.jpg'
-            },
-            {
-                'name': 'تحدي الذاكرة',
-                'description': 'اختبر ذاكرتك مع لعبة الكروت المطابقة',
-                'html_path': '/games/memory-cards.html',
-                'thumbnail': '/images/memory-cards-thumb.jpg'
-            },
-            {
-                'name': 'القفز والجري',
-                'description': 'اقفز فوق العوائق واجمع العملات الذهبية',
-                'html_path': '/games/jump-run.html',
-                'thumbnail': '/images/jump-run-thumb.jpg'
-            },
-            {
-                'name': 'تركيب الصور',
-                'description': 'حل الألغاز وركب القطع في مكانها الصحيح',
-                'html_path': '/games/puzzle-jigsaw.html',
-                'thumbnail': '/images/puzzle-jigsaw-thumb.jpg'
-            }
-        ]
-        
-        for game_data in games_data:
-            game = Game(**game_data)
-            db.session.add(game)
-        
-        db.session.commit()
-        print("تم إنشاء الألعاب الأولية بنجاح")
-
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-        return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
-            return "index.html not found", 404
-
-# Health check endpoint
-@app.route('/api/health')
-def health_check():
-    return {'status': 'healthy', 'message': 'Gaming Platform API is running'}
+
+    if Game.query.count() > 0:
+        return 0
+
+    games_data = [
+        {
+            'name': 'سباق السيارات',
+            'description': 'لعبة سباق مثيرة تجنب فيها السيارات الأخرى واجمع النقاط',
+            'html_path': '/games/car-racing.html',
+            'thumbnail': '/images/car-racing-thumb.jpg'
+        },
+        {
+            'name': 'تحدي الذاكرة',
+            'description': 'اختبر ذاكرتك مع لعبة الكروت المطابقة',
+            'html_path': '/games/memory-cards.html',
+            'thumbnail': '/images/memory-cards-thumb.jpg'
+        },
+        {
+            'name': 'القفز والجري',
+            'description': 'اقفز فوق العوائق واجمع العملات الذهبية',
+            'html_path': '/games/jump-run.html',
+            'thumbnail': '/images/jump-run-thumb.jpg'
+        },
+        {
+            'name': 'تركيب الصور',
+            'description': 'حل الألغاز وركب القطع في مكانها الصحيح',
+            'html_path': '/games/puzzle-jigsaw.html',
+            'thumbnail': '/images/puzzle-jigsaw-thumb.jpg'
+        }
+    ]
+
+    for game_data in games_data:
+        game = Game(**game_data)
+        db.session.add(game)
+
+    db.session.commit()
+    return len(games_data)
+
+
+def register_commands(app):
+    @app.cli.command('init-db')
+    @click.option('--seed/--no-seed', default=True, help='Insert the initial games into an empty catalog')
+    def init_db_command(seed):
+        """Create the schema and backfill derived tables"""
+        init_db()
+        print("تم تهيئة قاعدة البيانات")
+        if seed and seed_games():
+            print("تم إنشاء الألعاب الأولية بنجاح")
+
+    @app.cli.command('seed')
+    def seed_command():
+        """Insert the initial games into an empty catalog"""
+        if seed_games():
+            print("تم إنشاء الألعاب الأولية بنجاح")
+
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups():
+        """Recompute the admin dashboard rollups from the base tables"""
+        from src.models.stats import DashboardStats
+        rows = DashboardStats.rebuild()
+        print(f"تم إعادة بناء {rows} صف من الإحصائيات")
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index():
+        """Repopulate the admin user search index from the user table"""
+        from src.models.search import UserSearch
+        if not UserSearch.install():
+            print("فهرس البحث غير متاح في إصدار SQLite الحالي")
+            return
+        UserSearch.rebuild()
+        print("تم إعادة بناء فهرس البحث")
+
+    @app.cli.command('rebuild-referral-stats')
+    def rebuild_referral_stats():
+        """Recompute cached referral counts from the referral table"""
+        from src.models.referrals import ReferralGraph
+        rows = ReferralGraph.rebuild()
+        print(f"تم إعادة بناء إحصائيات الإحالة لـ {rows} مستخدم")
+
+    @app.cli.command('close-stale-sessions')
+    def close_stale_sessions():
+        """Close game sessions that stopped sending heartbeats"""
+        from src.models.heartbeat import HeartbeatBuffer
+        closed = HeartbeatBuffer.close_stale()
+        print(f"تم إغلاق {closed} جلسة لعب")
+
+    @app.cli.command('bulk-adjust-points')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--allow-negative', is_flag=True, help='Allow debits to take balances below zero')
+    @click.option('--chunk-size', type=int, default=None, help='Rows per transaction')
+    @click.option('--output', type=click.Path(dir_okay=False), default=None, help='Write per-row results to a CSV file')
+    def bulk_adjust_points(path, allow_negative, chunk_size, output):
+        """Apply a CSV/JSON file of (user_id, delta, reason) point adjustments"""
+        import csv
+        import json
+        from src.models.bulk import BulkPointsAdjustment
+        fmt = 'json' if path.lower().endswith('.json') else 'csv'
+        with open(path, encoding='utf-8-sig') as f:
+            rows = BulkPointsAdjustment.parse(f.read(), fmt)
+
+        results, summary = BulkPointsAdjustment.apply(rows, allow_negative=allow_negative, chunk_size=chunk_size)
+
+        if output:
+            with open(output, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=['row', 'user_id', 'delta', 'reason', 'status', 'new_balance'])
+                writer.writeheader()
+                writer.writerows(results)
+        print(json.dumps(summary, ensure_ascii=False))
+        if summary['failed_chunk']:
+            raise SystemExit(1)
+
 
 if __name__ == '__main__':
+    # Local development: make sure the database exists before serving
+    app = create_app()
+    with app.app_context():
+        init_db()
+        seed_games()
     app.run(host='0.0.0.0', port=5000, debug=True)
-
@@ -0,0 +1,435 @@
+from flask import Response, current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import Pool
+import hmac
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # dead-worker files are then folded without a lock
+    fcntl = None
+
+
+class ValueFile:
+    """Float values keyed by string in a memory-mapped file, one file per process.
+
+    Layout: an 8-byte header holding the number of used bytes, then entries
+    of [key length (4 bytes)][utf-8 key, padded to 8-byte alignment][double].
+    An entry is written before the header is advanced, so a reader in
+    another process only ever sees complete entries, and updating a value
+    is a single aligned 8-byte store into the mapping.
+    """
+
+    INITIAL_SIZE = 64 * 1024
+    HEADER = struct.Struct('<Q')
+    KEY_LENGTH = struct.Struct('<I')
+    VALUE = struct.Struct('<d')
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(self.INITIAL_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._used = self.HEADER.unpack_from(self._map, 0)[0] or self.HEADER.size
+        self._positions = {key: offset for key, _, offset in self._entries(self._map, self._used)}
+
+    @classmethod
+    def _entries(cls, data, used):
+        offset = cls.HEADER.size
+        while offset < used:
+            length = cls.KEY_LENGTH.unpack_from(data, offset)[0]
+            key_end = offset + cls.KEY_LENGTH.size + length
+            value_offset = key_end + (-key_end % 8)
+            key = bytes(data[offset + cls.KEY_LENGTH.size:key_end]).decode('utf-8')
+            yield key, cls.VALUE.unpack_from(data, value_offset)[0], value_offset
+            offset = value_offset + cls.VALUE.size
+
+    @classmethod
+    def read(cls, path):
+        """(key, value) pairs of a file written by any process"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < cls.HEADER.size:
+            return []
+        return [(key, value) for key, value, _ in cls._entries(data, cls.HEADER.unpack_from(data, 0)[0])]
+
+    def _offset(self, key):
+        offset = self._positions.get(key)
+        if offset is not None:
+            return offset
+
+        encoded = key.encode('utf-8')
+        key_end = self._used + self.KEY_LENGTH.size + len(encoded)
+        offset = key_end + (-key_end % 8)
+        if offset + self.VALUE.size > len(self._map):
+            size = len(self._map)
+            while offset + self.VALUE.size > size:
+                size *= 2
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), 0)
+
+        self.KEY_LENGTH.pack_into(self._map, self._used, len(encoded))
+        self._map[self._used + self.KEY_LENGTH.size:key_end] = encoded
+        self.VALUE.pack_into(self._map, offset, 0.0)
+        self._used = offset + self.VALUE.size
+        self.HEADER.pack_into(self._map, 0, self._used)
+        self._positions[key] = offset
+        return offset
+
+    def get(self, key):
+        offset = self._positions.get(key)
+        return self.VALUE.unpack_from(self._map, offset)[0] if offset is not None else 0.0
+
+    def set(self, key, value):
+        self.VALUE.pack_into(self._map, self._offset(key), value)
+
+    def items(self):
+        return [(key, self.VALUE.unpack_from(self._map, offset)[0]) for key, offset in self._positions.items()]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class MemoryValues(dict):
+    """In-process stand-in for ValueFile when no metrics directory is configured"""
+
+    def get(self, key):
+        return dict.get(self, key, 0.0)
+
+    def set(self, key, value):
+        self[key] = value
+
+
+class Metrics:
+    """Prometheus metrics, aggregated across worker processes.
+
+    Each process records into its own ValueFile under METRICS_DIR (the
+    same directory for every worker of a deployment); /metrics reads every
+    file and sums counters and histograms, and sums gauges over processes
+    that are still alive. At start-up the counters of workers that have
+    exited are folded into a single archive file and their files removed,
+    so the directory doesn't grow with every restart. Without METRICS_DIR
+    values live in memory and only describe the answering process.
+
+    Withdrawal counts and amounts by status are read from the database at
+    scrape time, so they are exact regardless of which worker answers.
+    Since they are business figures, /metrics is never public: scrapers
+    send `Authorization: Bearer <METRICS_TOKEN>`, anyone else needs an
+    admin session.
+    """
+
+    DEFINITIONS = {
+        'http_requests_total': ('counter', 'HTTP requests by blueprint, method and status code'),
+        'http_request_duration_seconds': ('histogram', 'HTTP request latency by blueprint and method'),
+        'db_pool_checked_out_connections': ('gauge', 'Database connections currently checked out of the pool'),
+        'db_pool_checkouts_total': ('counter', 'Database connection checkouts'),
+        'points_awarded_total': ('counter', 'Points credited, by activity type'),
+        'point_awards_total': ('counter', 'Point awards, by activity type'),
+        'suspicious_evaluations_total': ('counter', 'Suspicious pattern evaluations, by whether the verdict was cached'),
+        'suspicious_checks_total': ('counter', 'Suspicious pattern checks run, by check and result (hit/pass)'),
+        'rate_limited_requests_total': ('counter', 'Requests rejected by the rate limiter, by endpoint and scope'),
+        'withdrawal_requests': ('gauge', 'Withdrawal requests by status'),
+        'withdrawal_requests_usd': ('gauge', 'Withdrawal request amounts in USD by status'),
+    }
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    ARCHIVE = 'metrics_archive.db'
+
+    directory = None
+    _lock = threading.Lock()
+    _values = None
+    _pid = None
+    _pool_events = False
+    _admin_response = None
+
+    @classmethod
+    def init_app(cls, app):
+        from src.routes.admin import admin_required
+
+        cls.directory = app.config.get('METRICS_DIR') or None
+        if cls.directory:
+            os.makedirs(cls.directory, exist_ok=True)
+            cls.fold_dead_processes()
+        cls._values = None
+        cls._pid = None
+        cls._store()
+
+        app.before_request(cls._start_request)
+        app.after_request(cls._finish_request)
+        cls._admin_response = admin_required(cls.response)
+        app.add_url_rule('/metrics', 'metrics', cls.authorized_response)
+
+        if not cls._pool_events:
+            event.listen(Pool, 'checkout', cls._checkout)
+            event.listen(Pool, 'checkin', cls._checkin)
+            cls._pool_events = True
+
+    @classmethod
+    def _store(cls):
+        """This process's value store; reopened after a fork (e.g. gunicorn --preload)"""
+        pid = os.getpid()
+        if cls._pid != pid:
+            with cls._lock:
+                if cls._pid != pid:
+                    if cls.directory:
+                        values = ValueFile(os.path.join(cls.directory, f'metrics_{pid}.db'))
+                        # A reused pid inherits counters, but gauges describe the live process
+                        for key, _ in values.items():
+                            if cls._kind(json.loads(key)[0]) == 'gauge':
+                                values.set(key, 0.0)
+                    else:
+                        values = MemoryValues()
+                    cls._values, cls._pid = values, pid
+        return cls._values
+
+    @classmethod
+    def _process_files(cls):
+        """(pid, path) of every per-process value file in the metrics directory"""
+        files = []
+        for filename in os.listdir(cls.directory):
+            if filename.startswith('metrics_') and filename.endswith('.db') and filename != cls.ARCHIVE:
+                try:
+                    files.append((int(filename[len('metrics_'):-len('.db')]), os.path.join(cls.directory, filename)))
+                except ValueError:
+                    continue
+        return files
+
+    @classmethod
+    def fold_dead_processes(cls):
+        """Move the counters of exited workers into the archive file and delete their files"""
+        lock_file = open(os.path.join(cls.directory, 'metrics.lock'), 'a+b')
+        try:
+            if fcntl is not None:
+                fcntl.lockf(lock_file.fileno(), fcntl.LOCK_EX)
+            dead = [(pid, path) for pid, path in cls._process_files()
+                    if pid != os.getpid() and not cls._pid_alive(pid)]
+            if not dead:
+                return 0
+            archive = ValueFile(os.path.join(cls.directory, cls.ARCHIVE))
+            try:
+                for _, path in dead:
+                    for key, value in ValueFile.read(path):
+                        # Gauges only describe a live process
+                        if cls._kind(json.loads(key)[0]) != 'gauge':
+                            archive.set(key, archive.get(key) + value)
+                    os.remove(path)
+            finally:
+                archive.close()
+            return len(dead)
+        finally:
+            lock_file.close()  # also releases the lock
+
+    @classmethod
+    def _metric(cls, name):
+        """Metric a stored series belongs to (histogram series carry a suffix)"""
+        if name not in cls.DEFINITIONS and name.rsplit('_', 1)[0] in cls.DEFINITIONS:
+            return name.rsplit('_', 1)[0]
+        return name
+
+    @classmethod
+    def _kind(cls, name):
+        return cls.DEFINITIONS.get(cls._metric(name), ('counter',))[0]
+
+    @staticmethod
+    def _key(name, labels):
+        return json.dumps([name, sorted(labels.items())] if labels else [name, []], ensure_ascii=False)
+
+    @classmethod
+    def inc(cls, name, labels=None, amount=1):
+        if cls._pid is None:
+            return  # metrics not enabled
+        key = cls._key(name, labels)
+        values = cls._store()
+        with cls._lock:
+            values.set(key, values.get(key) + amount)
+
+    @classmethod
+    def observe(cls, name, labels, value):
+        if cls._pid is None:
+            return
+        bucket = next((str(bound) for bound in cls.BUCKETS if value <= bound), '+Inf')
+        values = cls._store()
+        keys = [
+            (cls._key(name + '_bucket', dict(labels, le=bucket)), 1),
+            (cls._key(name + '_sum', labels), value),
+            (cls._key(name + '_count', labels), 1),
+        ]
+        with cls._lock:
+            for key, amount in keys:
+                values.set(key, values.get(key) + amount)
+
+    # Request and pool hooks
+
+    @staticmethod
+    def _start_request():
+        g.metrics_started = time.perf_counter()
+
+    @classmethod
+    def _finish_request(cls, response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            labels = {'blueprint': request.blueprint or 'app', 'method': request.method}
+            cls.observe('http_request_duration_seconds', labels, time.perf_counter() - started)
+            cls.inc('http_requests_total', dict(labels, status=str(response.status_code)))
+        return response
+
+    @classmethod
+    def _checkout(cls, dbapi_connection, connection_record, connection_proxy):
+        cls.inc('db_pool_checked_out_connections')
+        cls.inc('db_pool_checkouts_total')
+
+    @classmethod
+    def _checkin(cls, dbapi_connection, connection_record):
+        cls.inc('db_pool_checked_out_connections', amount=-1)
+
+    # Exposition
+
+    @staticmethod
+    def _pid_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    @classmethod
+    def collect(cls):
+        """{(name, labels): value} summed over every process"""
+        sources = []
+        if cls.directory:
+            files = cls._process_files() + [(None, os.path.join(cls.directory, cls.ARCHIVE))]
+            for pid, path in files:
+                try:
+                    sources.append((pid, ValueFile.read(path)))
+                except OSError:
+                    continue
+        elif cls._values is not None:
+            sources.append((os.getpid(), list(cls._values.items())))
+
+        totals = {}
+        for pid, items in sources:
+            alive = None
+            for key, value in items:
+                name, labels = json.loads(key)
+                if cls._kind(name) == 'gauge':
+                    if pid is None:
+                        continue
+                    if alive is None:
+                        alive = cls._pid_alive(pid)
+                    if not alive:
+                        continue
+                series = (name, tuple(tuple(label) for label in labels))
+                totals[series] = totals.get(series, 0.0) + value
+        return totals
+
+    @classmethod
+    def _withdrawal_series(cls):
+        from src.models.user import WithdrawalRequest, db
+
+        rows = db.session.query(
+            WithdrawalRequest.status,
+            db.func.count(WithdrawalRequest.id),
+            db.func.coalesce(db.func.sum(WithdrawalRequest.amount_usd), 0)
+        ).group_by(WithdrawalRequest.status).all()
+        db.session.rollback()
+        series = {}
+        for status, count, amount in rows:
+            series[('withdrawal_requests', (('status', status),))] = count
+            series[('withdrawal_requests_usd', (('status', status),))] = amount
+        return series
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ''
+        escaped = (
+            f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+            for name, value in labels
+        )
+        return '{' + ','.join(escaped) + '}'
+
+    @staticmethod
+    def _format_value(value):
+        return repr(float(value)) if value != int(value) else str(int(value))
+
+    @classmethod
+    def render(cls, totals):
+        by_metric = {}
+        for (name, labels), value in totals.items():
+            by_metric.setdefault(cls._metric(name), {})[(name, labels)] = value
+
+        lines = []
+        for metric, (kind, description) in cls.DEFINITIONS.items():
+            series = by_metric.get(metric)
+            if not series:
+                continue
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} {kind}')
+            if kind != 'histogram':
+                for (name, labels), value in sorted(series.items()):
+                    lines.append(f'{name}{cls._format_labels(labels)} {cls._format_value(value)}')
+                continue
+
+            # Buckets are stored per bucket; exposition wants them cumulative
+            groups = {}
+            for (name, labels), value in series.items():
+                plain = tuple(label for label in labels if label[0] != 'le')
+                le = dict(labels).get('le')
+                group = groups.setdefault(plain, {'buckets': {}, 'sum': 0.0, 'count': 0.0})
+                if name.endswith('_bucket'):
+                    group['buckets'][le] = value
+                elif name.endswith('_sum'):
+                    group['sum'] = value
+                else:
+                    group['count'] = value
+            for labels, group in sorted(groups.items()):
+                cumulative = 0.0
+                for bound in [str(bound) for bound in cls.BUCKETS] + ['+Inf']:
+                    cumulative += group['buckets'].get(bound, 0.0)
+                    lines.append(f'{metric}_bucket{cls._format_labels(labels + (("le", bound),))} '
+                                 f'{cls._format_value(cumulative)}')
+                lines.append(f'{metric}_sum{cls._format_labels(labels)} {cls._format_value(group["sum"])}')
+                lines.append(f'{metric}_count{cls._format_labels(labels)} {cls._format_value(group["count"])}')
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def authorized_response(cls):
+        """/metrics for a scraper holding METRICS_TOKEN, or for an admin session"""
+        token = current_app.config.get('METRICS_TOKEN')
+        if token and hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'),
+                                         f'Bearer {token}'.encode('utf-8')):
+            return cls.response()
+        return cls._admin_response()
+
+    @classmethod
+    def response(cls):
+        totals = cls.collect()
+        try:
+            totals.update(cls._withdrawal_series())
+        except Exception:
+            current_app.logger.exception('could not read withdrawal metrics')
+        return Response(cls.render(totals), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Business counters are applied once their transaction commits
+
+@event.listens_for(Session, 'after_commit')
+def _apply_metric_events(session):
+    for name, labels, amount in session.info.pop('metric_events', []):
+        Metrics.inc(name, labels, amount)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_metric_events(session):
+    session.info.pop('metric_events', None)
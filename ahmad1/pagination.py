@@ -0,0 +1,80 @@
+from flask import request
+from src.models.user import db
+from datetime import datetime
+import base64
+
+MAX_PER_PAGE = 100
+
+
+def encode_cursor(created_at, row_id):
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded).decode().split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_paginate(query, model, cursor=None, page=None, per_page=20, include_total=None):
+    """Newest-first page of `query` ordered by (created_at, id).
+
+    With a cursor the page starts right after the row it encodes, so every
+    page costs the same no matter how deep it is and no COUNT is issued
+    unless include_total is set. Without a cursor the legacy page/per_page
+    OFFSET paging is used, and the total is included by default so older
+    clients keep working. Either way per_page is capped at MAX_PER_PAGE and
+    the response carries a next_cursor for the following page.
+    """
+    per_page = max(1, min(per_page or 20, MAX_PER_PAGE))
+    if include_total is None:
+        include_total = not cursor
+
+    total = query.order_by(None).count() if include_total else None
+    ordered = query.order_by(model.created_at.desc(), model.id.desc())
+
+    after = decode_cursor(cursor) if cursor else None
+    if cursor and after is None:
+        raise ValueError('invalid cursor')
+    if after:
+        created_at, row_id = after
+        ordered = ordered.filter(db.or_(
+            model.created_at < created_at,
+            db.and_(model.created_at == created_at, model.id < row_id)
+        ))
+    elif page and page > 1:
+        ordered = ordered.offset((page - 1) * per_page)
+
+    items = ordered.limit(per_page + 1).all()
+    has_more = len(items) > per_page
+    items = items[:per_page]
+
+    result = {
+        'items': items,
+        'per_page': per_page,
+        'has_more': has_more,
+        'next_cursor': encode_cursor(items[-1].created_at, items[-1].id) if has_more else None
+    }
+    if total is not None:
+        result['total'] = total
+        result['pages'] = -(-total // per_page)
+    if not cursor:
+        result['current_page'] = page or 1
+    return result
+
+
+def paginate_request(query, model, per_page=20):
+    """keyset_paginate() driven by the cursor/page/per_page/include_total query args"""
+    include_total = request.args.get('include_total')
+    return keyset_paginate(
+        query,
+        model,
+        cursor=request.args.get('cursor') or None,
+        page=request.args.get('page', type=int),
+        per_page=request.args.get('per_page', per_page, type=int),
+        include_total=None if include_total is None else include_total.lower() in ('1', 'true')
+    )
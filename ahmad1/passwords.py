@@ -0,0 +1,136 @@
+from flask import current_app, has_app_context
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+import threading
+
+
+class PasswordHasherBusy(Exception):
+    """Every hashing slot stayed taken for PASSWORD_HASH_QUEUE_TIMEOUT seconds"""
+
+
+class PasswordHasher:
+    """Password hashing on a bounded process pool with configurable cost.
+
+    Hashing and verification run in PASSWORD_HASH_WORKERS worker processes
+    (per app process), so a login burst is capped at that many cores while
+    the request threads wait without holding CPU. At most
+    PASSWORD_HASH_MAX_PENDING operations may be queued or running; callers
+    beyond that wait up to PASSWORD_HASH_QUEUE_TIMEOUT seconds and then get
+    PasswordHasherBusy, which the routes turn into a 503 with Retry-After.
+
+    PASSWORD_HASH_METHOD is a werkzeug method string such as
+    'pbkdf2:sha256:600000'; hashes made with any other method or cost are
+    reported by needs_rehash() and upgraded on the next successful login.
+    PASSWORD_HASH_WORKERS=0 hashes on the calling thread.
+
+    Workers are started with forkserver (spawn where unavailable), which
+    re-imports the entry script: scripts that hash passwords need the usual
+    `if __name__ == '__main__':` guard.
+    """
+
+    DEFAULTS = {
+        'PASSWORD_HASH_METHOD': f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}',
+        'PASSWORD_HASH_WORKERS': 2,
+        'PASSWORD_HASH_MAX_PENDING': 32,
+        'PASSWORD_HASH_QUEUE_TIMEOUT': 5.0,
+    }
+
+    _lock = threading.Lock()
+    _executor = None
+    _executor_pid = None
+    _slots = None
+    _slots_size = None
+
+    @classmethod
+    def setting(cls, key):
+        default = cls.DEFAULTS[key]
+        if has_app_context():
+            value = current_app.config.get(key, os.environ.get(key, default))
+        else:
+            value = os.environ.get(key, default)
+        return type(default)(value)
+
+    @staticmethod
+    def normalize_method(method):
+        """Spell out werkzeug's implicit pbkdf2 parameters so hashes can be compared"""
+        parts = method.split(':')
+        if parts[0] != 'pbkdf2':
+            return method
+        hash_name = parts[1] if len(parts) > 1 and parts[1] else 'sha256'
+        iterations = int(parts[2]) if len(parts) > 2 and parts[2] else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+
+    @classmethod
+    def method(cls):
+        return cls.normalize_method(cls.setting('PASSWORD_HASH_METHOD'))
+
+    @classmethod
+    def _pool(cls):
+        """The worker pool of this process, created on first use (and again after a fork)"""
+        workers = cls.setting('PASSWORD_HASH_WORKERS')
+        if workers <= 0:
+            return None
+        pid = os.getpid()
+        if cls._executor is None or cls._executor_pid != pid:
+            with cls._lock:
+                if cls._executor is None or cls._executor_pid != pid:
+                    # forkserver: children don't inherit the app's threads, locks or DB connections
+                    methods = multiprocessing.get_all_start_methods()
+                    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                    cls._executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+                    cls._executor_pid = pid
+        return cls._executor
+
+    @classmethod
+    def _acquire(cls):
+        size = cls.setting('PASSWORD_HASH_MAX_PENDING')
+        if cls._slots is None or cls._slots_size != size:
+            with cls._lock:
+                if cls._slots is None or cls._slots_size != size:
+                    cls._slots = threading.BoundedSemaphore(size)
+                    cls._slots_size = size
+        slots = cls._slots
+        if not slots.acquire(timeout=cls.setting('PASSWORD_HASH_QUEUE_TIMEOUT')):
+            raise PasswordHasherBusy()
+        return slots
+
+    @classmethod
+    def _run(cls, function, *args):
+        pool = cls._pool()
+        if pool is None:
+            return function(*args)
+        slots = cls._acquire()
+        try:
+            try:
+                return pool.submit(function, *args).result()
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM-killed); replace the pool and try once more
+                with cls._lock:
+                    if cls._executor is pool:
+                        cls._executor = None
+                return cls._pool().submit(function, *args).result()
+        finally:
+            slots.release()
+
+    @classmethod
+    def hash(cls, password):
+        return cls._run(generate_password_hash, password, cls.method())
+
+    @classmethod
+    def verify(cls, password_hash, password):
+        return cls._run(check_password_hash, password_hash, password)
+
+    @classmethod
+    def needs_rehash(cls, password_hash):
+        return password_hash.split('$', 1)[0] != cls.method()
+
+    @classmethod
+    def shutdown(cls):
+        with cls._lock:
+            if cls._executor is not None and cls._executor_pid == os.getpid():
+                cls._executor.shutdown(wait=True)
+            cls._executor = None
+            cls._executor_pid = None
@@ -1,5 +1,9 @@
 from flask import Blueprint, jsonify, request, session
-from src.models.user import User, PointLog, WithdrawalRequest, Referral, db
+from src.models.user import User, PointLog, WithdrawalRequest, Referral, DailyStat, db, day_window, day_start
+from src.models.engine import retry_on_busy, is_sqlite_busy
+from src.models.awards import adjust_balance
+from src.models.pagination import paginate_request
+from src.models.referrals import ReferralGraph
 from datetime import datetime, timedelta
 
 points_bp = Blueprint('points', __name__)
@@ -28,21 +32,17 @@ def get_points_history():
         return jsonify({'error': 'غير مسجل الدخول'}), 401
     
     user_id = session['user_id']
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
     
-    point_logs = PointLog.query.filter_by(user_id=user_id)\
-        .order_by(PointLog.created_at.desc())\
-        .paginate(page=page, per_page=per_page, error_out=False)
+    try:
+        result = paginate_request(PointLog.query.filter_by(user_id=user_id), PointLog)
+    except ValueError:
+        return jsonify({'error': 'مؤشر الصفحة غير صالح'}), 400
     
-    return jsonify({
-        'logs': [log.to_dict() for log in point_logs.items],
-        'total': point_logs.total,
-        'pages': point_logs.pages,
-        'current_page': page
-    })
+    result['logs'] = [log.to_dict() for log in result.pop('items')]
+    return jsonify(result)
 
 @points_bp.route('/points/watch-ad', methods=['POST'])
+@retry_on_busy
 def watch_ad():
     """Award points for watching standalone ad"""
     if 'user_id' not in session:
@@ -61,14 +61,15 @@ def watch_ad():
             PointLog.user_id == user_id,
             PointLog.activity_type == 'watch_ad',
             PointLog.game_id.is_(None),  # Standalone ads
-            db.func.date(PointLog.created_at) == today
+            day_window(PointLog.created_at, today)
         ).count()
         
         if today_ad_views >= 10:
             return jsonify({'error': 'تم الوصول للحد الأقصى من مشاهدة الإعلانات اليوم'}), 400
         
-        # Award points for watching ad
-        user.add_points(5, 'watch_ad')
+        # Award points for watching ad (the cap is re-checked atomically)
+        if not user.add_points(5, 'watch_ad'):
+            return jsonify({'error': 'تم الوصول للحد الأقصى من النقاط اليومية'}), 400
         
         return jsonify({
             'message': 'تم منح النقاط لمشاهدة الإعلان',
@@ -78,9 +79,12 @@ def watch_ad():
         
     except Exception as e:
         db.session.rollback()
+        if is_sqlite_busy(e):
+            raise
         return jsonify({'error': 'حدث خطأ أثناء منح نقاط الإعلان'}), 500
 
 @points_bp.route('/points/refer-friend', methods=['POST'])
+@retry_on_busy
 def refer_friend():
     """Create referral link or process referral"""
     if 'user_id' not in session:
@@ -123,24 +127,28 @@ def refer_friend():
                 referred_id=referred_user.id
             )
             db.session.add(referral)
+            DailyStat.bump('referrals')
+            ReferralGraph.record(referrer_id, referred_user.id)
             
             # Award points to referrer
             referrer = User.query.get(referrer_id)
-            if referrer.can_earn_daily_points():
-                referrer.add_points(10, 'invite_friend')
+            points_awarded = 10 if referrer.add_points(10, 'invite_friend', commit=False) else 0
             
             db.session.commit()
             
             return jsonify({
                 'message': 'تم منح نقاط الإحالة بنجاح',
-                'points_awarded': 10
+                'points_awarded': points_awarded
             }), 200
         
     except Exception as e:
         db.session.rollback()
+        if is_sqlite_busy(e):
+            raise
         return jsonify({'error': 'حدث خطأ أثناء معالجة الإحالة'}), 500
 
 @points_bp.route('/points/withdraw', methods=['POST'])
+@retry_on_busy
 def request_withdrawal():
     """Request points withdrawal"""
     if 'user_id' not in session:
@@ -174,21 +182,27 @@ def request_withdrawal():
             payment_method=payment_method
         )
         
-        # Deduct points from user
-        user.points -= points_to_redeem
+        # Deduct points atomically; fails if a concurrent request spent them first
+        remaining_points = adjust_balance(user_id, -points_to_redeem, min_balance=0)
+        if remaining_points is None:
+            db.session.rollback()
+            return jsonify({'error': 'رصيد النقاط غير كافي'}), 400
         
         db.session.add(withdrawal)
+        DailyStat.bump('withdrawals')
         db.session.commit()
         
         return jsonify({
             'message': 'تم إرسال طلب السحب بنجاح',
             'withdrawal_id': withdrawal.id,
             'amount_usd': amount_usd,
-            'remaining_points': user.points
+            'remaining_points': remaining_points
         }), 201
         
     except Exception as e:
         db.session.rollback()
+        if is_sqlite_busy(e):
+            raise
         return jsonify({'error': 'حدث خطأ أثناء طلب السحب'}), 500
 
 @points_bp.route('/points/withdrawals', methods=['GET'])
@@ -198,10 +212,25 @@ def get_withdrawals():
         return jsonify({'error': 'غير مسجل الدخول'}), 401
     
     user_id = session['user_id']
-    withdrawals = WithdrawalRequest.query.filter_by(user_id=user_id)\
-        .order_by(WithdrawalRequest.created_at.desc()).all()
+    query = WithdrawalRequest.query.filter_by(user_id=user_id)
+    
+    # Clients that don't ask for a page (WithdrawPage) still get the full history
+    if not any(arg in request.args for arg in ('cursor', 'page', 'per_page')):
+        withdrawals = query.order_by(WithdrawalRequest.created_at.desc(), WithdrawalRequest.id.desc()).all()
+        return jsonify([withdrawal.to_dict() for withdrawal in withdrawals])
+    
+    try:
+        result = paginate_request(query, WithdrawalRequest)
+    except ValueError:
+        return jsonify({'error': 'مؤشر الصفحة غير صالح'}), 400
     
-    return jsonify([withdrawal.to_dict() for withdrawal in withdrawals])
+    # The body stays a plain list; the cursor for the next page travels in a header
+    response = jsonify([withdrawal.to_dict() for withdrawal in result['items']])
+    if result['next_cursor']:
+        response.headers['X-Next-Cursor'] = result['next_cursor']
+    if 'total' in result:
+        response.headers['X-Total-Count'] = str(result['total'])
+    return response
 
 @points_bp.route('/points/stats', methods=['GET'])
 def get_points_stats():
@@ -218,17 +247,17 @@ def get_points_stats():
     
     today_points = db.session.query(db.func.sum(PointLog.points_earned)).filter(
         PointLog.user_id == user_id,
-        db.func.date(PointLog.created_at) == today
+        day_window(PointLog.created_at, today)
     ).scalar() or 0
     
     week_points = db.session.query(db.func.sum(PointLog.points_earned)).filter(
         PointLog.user_id == user_id,
-        db.func.date(PointLog.created_at) >= week_ago
+        PointLog.created_at >= day_start(week_ago)
     ).scalar() or 0
     
     month_points = db.session.query(db.func.sum(PointLog.points_earned)).filter(
         PointLog.user_id == user_id,
-        db.func.date(PointLog.created_at) >= month_ago
+        PointLog.created_at >= day_start(month_ago)
     ).scalar() or 0
     
     total_points = db.session.query(db.func.sum(PointLog.points_earned)).filter(
@@ -0,0 +1,260 @@
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import re
+import threading
+import time
+
+
+class RequestProfiler:
+    """Per-endpoint SQL and wall-time profile, aggregated in memory.
+
+    Cursor events count every statement a request issues and time it;
+    request hooks fold the totals into per-endpoint histograms (wall time
+    and query count buckets), the slowest statement seen, and the
+    statements repeated most within a single request, which is how N+1
+    loops show up. Statements are reduced to fingerprints (whitespace and
+    literal values collapsed, IN lists shortened) so variants group
+    together. Requests slower than SLOW_REQUEST_MS are logged with their
+    fingerprints when that threshold is set.
+
+    The aggregate is per process; reset() starts a fresh window.
+    """
+
+    TIME_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+    QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+    MAX_FINGERPRINTS = 20  # per endpoint, by total SQL time
+    SLOW_REQUEST_MS = 0  # 0 = don't log slow requests
+    SORT_KEYS = ('sql_ms_total', 'sql_ms_avg', 'wall_ms_total', 'wall_ms_avg', 'wall_ms_max',
+                 'queries_total', 'queries_avg', 'queries_max', 'requests', 'errors')
+
+    _lock = threading.Lock()
+    _listening = False
+    _endpoints = {}
+    _since = time.time()
+
+    FINGERPRINT_RULES = [
+        (re.compile(r"'(?:[^']|'')*'"), '?'),
+        (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+        (re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)'), '(?, ...)'),
+        (re.compile(r'\s+'), ' '),
+        (re.compile(r'(\w+\.\w+) AS \w+'), r'\1'),  # drop ORM column labels
+    ]
+
+    @classmethod
+    def init_app(cls, app):
+        cls.SLOW_REQUEST_MS = app.config.get('PROFILE_SLOW_REQUEST_MS', cls.SLOW_REQUEST_MS)
+        app.before_request(cls._start)
+        app.after_request(cls._status)
+        app.teardown_request(cls._finish)
+
+        # Cursor hooks are only installed when profiling is enabled
+        with cls._lock:
+            if not cls._listening:
+                event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+                event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+                event.listen(Engine, 'handle_error', _handle_error)
+                cls._listening = True
+
+    @classmethod
+    def enabled(cls):
+        return cls._listening
+
+    @classmethod
+    def fingerprint(cls, statement):
+        for pattern, replacement in cls.FINGERPRINT_RULES:
+            statement = pattern.sub(replacement, statement)
+        return statement.strip()[:300]
+
+    @staticmethod
+    def _start():
+        g.sql_profile = {'started': time.perf_counter(), 'queries': 0, 'sql_ms': 0.0, 'statements': {}}
+
+    @staticmethod
+    def _status(response):
+        profile = g.get('sql_profile')
+        if profile is not None:
+            profile['status'] = response.status_code
+        return response
+
+    @staticmethod
+    def _current():
+        if not has_request_context():
+            return None
+        return g.get('sql_profile')
+
+    @classmethod
+    def _statement(cls, statement, elapsed_ms):
+        profile = cls._current()
+        if profile is None:
+            return
+        profile['queries'] += 1
+        profile['sql_ms'] += elapsed_ms
+        entry = profile['statements'].get(statement)
+        if entry is None:
+            entry = profile['statements'][statement] = [0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += elapsed_ms
+        entry[2] = max(entry[2], elapsed_ms)
+
+    @classmethod
+    def _finish(cls, exc=None):
+        profile = g.pop('sql_profile', None)
+        if profile is None:
+            return
+        wall_ms = (time.perf_counter() - profile['started']) * 1000
+
+        # Fingerprint once per distinct statement text, not per execution
+        fingerprints = {}
+        for statement, (count, sql_ms, slowest_ms) in profile['statements'].items():
+            fingerprint = cls.fingerprint(statement)
+            entry = fingerprints.setdefault(fingerprint, [0, 0.0, 0.0])
+            entry[0] += count
+            entry[1] += sql_ms
+            entry[2] = max(entry[2], slowest_ms)
+
+        endpoint = request.endpoint or 'unmatched'
+        failed = exc is not None or profile.get('status', 500) >= 500
+        cls._record(endpoint, wall_ms, profile['queries'], profile['sql_ms'], fingerprints, failed)
+
+        if cls.SLOW_REQUEST_MS and wall_ms >= cls.SLOW_REQUEST_MS:
+            from flask import current_app
+            top = sorted(fingerprints.items(), key=lambda item: item[1][1], reverse=True)[:5]
+            current_app.logger.warning(
+                'slow request %s %s (%s): %.1f ms, %d queries, %.1f ms SQL\n%s',
+                request.method, request.path, endpoint, wall_ms, profile['queries'], profile['sql_ms'],
+                '\n'.join(f'  {count}x {sql_ms:.1f} ms  {fingerprint}'
+                          for fingerprint, (count, sql_ms, _) in top)
+            )
+
+    @staticmethod
+    def _bucket(buckets, value):
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                return index
+        return len(buckets)
+
+    @classmethod
+    def _record(cls, endpoint, wall_ms, queries, sql_ms, fingerprints, failed):
+        with cls._lock:
+            stats = cls._endpoints.get(endpoint)
+            if stats is None:
+                stats = cls._endpoints[endpoint] = {
+                    'requests': 0, 'errors': 0,
+                    'wall_ms_total': 0.0, 'wall_ms_max': 0.0,
+                    'queries_total': 0, 'queries_max': 0,
+                    'sql_ms_total': 0.0,
+                    'wall_histogram': [0] * (len(cls.TIME_BUCKETS_MS) + 1),
+                    'query_histogram': [0] * (len(cls.QUERY_BUCKETS) + 1),
+                    'slowest_statement': None,
+                    'fingerprints': {},
+                }
+            stats['requests'] += 1
+            stats['errors'] += failed
+            stats['wall_ms_total'] += wall_ms
+            stats['wall_ms_max'] = max(stats['wall_ms_max'], wall_ms)
+            stats['queries_total'] += queries
+            stats['queries_max'] = max(stats['queries_max'], queries)
+            stats['sql_ms_total'] += sql_ms
+            stats['wall_histogram'][cls._bucket(cls.TIME_BUCKETS_MS, wall_ms)] += 1
+            stats['query_histogram'][cls._bucket(cls.QUERY_BUCKETS, queries)] += 1
+
+            for fingerprint, (count, fp_ms, slowest_ms) in fingerprints.items():
+                entry = stats['fingerprints'].get(fingerprint)
+                if entry is None:
+                    entry = stats['fingerprints'][fingerprint] = {
+                        'executions': 0, 'sql_ms_total': 0.0, 'max_per_request': 0
+                    }
+                entry['executions'] += count
+                entry['sql_ms_total'] += fp_ms
+                entry['max_per_request'] = max(entry['max_per_request'], count)
+
+                slowest = stats['slowest_statement']
+                if slowest is None or slowest_ms > slowest['ms']:
+                    stats['slowest_statement'] = {'ms': round(slowest_ms, 3), 'statement': fingerprint}
+
+            if len(stats['fingerprints']) > cls.MAX_FINGERPRINTS * 2:
+                keep = sorted(stats['fingerprints'].items(), key=lambda item: item[1]['sql_ms_total'],
+                              reverse=True)[:cls.MAX_FINGERPRINTS]
+                stats['fingerprints'] = dict(keep)
+
+    @classmethod
+    def _percentile(cls, histogram, total, pct):
+        """Upper bound of the bucket holding the pct-th request (None if beyond the last bucket)"""
+        target = total * pct / 100
+        seen = 0
+        for index, count in enumerate(histogram):
+            seen += count
+            if seen >= target:
+                return cls.TIME_BUCKETS_MS[index] if index < len(cls.TIME_BUCKETS_MS) else None
+        return None
+
+    @classmethod
+    def snapshot(cls, sort='sql_ms_total', limit=50):
+        """Per-endpoint profile, heaviest first"""
+        with cls._lock:
+            endpoints = []
+            for endpoint, stats in cls._endpoints.items():
+                requests = stats['requests']
+                fingerprints = sorted(stats['fingerprints'].items(), key=lambda item: item[1]['sql_ms_total'],
+                                      reverse=True)[:cls.MAX_FINGERPRINTS]
+                endpoints.append({
+                    'endpoint': endpoint,
+                    'requests': requests,
+                    'errors': stats['errors'],
+                    'wall_ms_total': round(stats['wall_ms_total'], 3),
+                    'wall_ms_avg': round(stats['wall_ms_total'] / requests, 3),
+                    'wall_ms_max': round(stats['wall_ms_max'], 3),
+                    'wall_ms_p50': cls._percentile(stats['wall_histogram'], requests, 50),
+                    'wall_ms_p95': cls._percentile(stats['wall_histogram'], requests, 95),
+                    'wall_ms_p99': cls._percentile(stats['wall_histogram'], requests, 99),
+                    'queries_total': stats['queries_total'],
+                    'queries_avg': round(stats['queries_total'] / requests, 2),
+                    'queries_max': stats['queries_max'],
+                    'sql_ms_total': round(stats['sql_ms_total'], 3),
+                    'sql_ms_avg': round(stats['sql_ms_total'] / requests, 3),
+                    'wall_histogram': dict(zip([str(b) for b in cls.TIME_BUCKETS_MS] + ['+Inf'],
+                                               stats['wall_histogram'])),
+                    'query_histogram': dict(zip([str(b) for b in cls.QUERY_BUCKETS] + ['+Inf'],
+                                                stats['query_histogram'])),
+                    'slowest_statement': stats['slowest_statement'],
+                    'statements': [
+                        {
+                            'statement': fingerprint,
+                            'executions': entry['executions'],
+                            'per_request': round(entry['executions'] / requests, 2),
+                            'max_per_request': entry['max_per_request'],
+                            'sql_ms_total': round(entry['sql_ms_total'], 3),
+                        }
+                        for fingerprint, entry in fingerprints
+                    ],
+                })
+            since = cls._since
+
+        if sort not in cls.SORT_KEYS:
+            sort = 'sql_ms_total'
+        endpoints.sort(key=lambda item: item[sort], reverse=True)
+        return {'since': since, 'endpoints': endpoints[:limit]}
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._endpoints = {}
+            cls._since = time.time()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('profile_started')
+    if not started:
+        return
+    RequestProfiler._statement(statement, (time.perf_counter() - started.pop()) * 1000)
+
+
+def _handle_error(context):
+    started = context.connection.info.get('profile_started') if context.connection is not None else None
+    if started:
+        started.pop()
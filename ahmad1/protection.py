@@ -1,25 +1,108 @@
 from flask import Blueprint, jsonify, request, session
-from src.models.user import User, PointLog, db
-from datetime import datetime, timedelta
+from src.models.user import User, PointLog, UserDailyPoints, db, day_window
+from src.models.activity import ActivityTracker
+from src.models.metrics import Metrics
+from datetime import datetime
 from collections import defaultdict
 import hashlib
+import threading
+import time
 
 protection_bp = Blueprint('protection', __name__)
 
 class SuspiciousPatternDetector:
     """Class to detect suspicious user patterns"""
     
+    VERDICT_TTL_SECONDS = 10
+    MAX_CACHED_VERDICTS = 10000
+    
+    _verdict_lock = threading.Lock()
+    _verdicts = {}
+    
+    @classmethod
+    def evaluate(cls, user_id, ip_address, user_agent, daily_cap_multiplier=2, max_accounts=3):
+        """Run every check in one pass and return a structured verdict.
+
+        User, daily ledger and same-IP account count come from a single
+        query; rapid clicking and bot behavior come from the in-memory
+        activity window. Verdicts are cached for VERDICT_TTL_SECONDS and
+        dropped as soon as a new award is seen for the user; the window is
+        synced first, so awards committed by other workers count too.
+        """
+        key = (user_id, ip_address, hashlib.md5(user_agent.encode()).hexdigest())
+        version = ActivityTracker.sync(user_id)
+        cached = cls._verdicts.get(key)
+        if cached and cached['version'] == version and time.monotonic() < cached['expires_at']:
+            Metrics.inc('suspicious_evaluations_total', {'cached': 'true'})
+            return dict(cached['verdict'], cached=True)
+        
+        timings = {}
+        started = time.perf_counter()
+        
+        today = datetime.utcnow().date()
+        same_ip = db.aliased(User)
+        daily_points = db.session.query(UserDailyPoints.points_earned).filter(
+            UserDailyPoints.user_id == User.id,
+            UserDailyPoints.day == today
+        ).scalar_subquery()
+        accounts_on_ip = db.session.query(db.func.count(same_ip.id)).filter(
+            same_ip.ip_address == ip_address
+        ).scalar_subquery()
+        row = db.session.query(User.daily_points_cap, daily_points, accounts_on_ip)\
+            .filter(User.id == user_id).first()
+        timings['load'] = time.perf_counter() - started
+        
+        checks = {}
+        
+        started = time.perf_counter()
+        checks['rapid_clicking'] = cls.detect_rapid_clicking(user_id)
+        timings['rapid_clicking'] = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        if row:
+            daily_points_cap, earned_today, _ = row
+            checks['unusual_earning'] = (earned_today or 0) > (daily_points_cap * daily_cap_multiplier)
+        else:
+            checks['unusual_earning'] = False
+        timings['unusual_earning'] = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        checks['bot_behavior'] = cls.detect_bot_behavior(user_id)
+        timings['bot_behavior'] = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        checks['device_abuse'] = bool(row) and row[2] > max_accounts
+        timings['device_abuse'] = time.perf_counter() - started
+        
+        Metrics.inc('suspicious_evaluations_total', {'cached': 'false'})
+        for name, hit in checks.items():
+            Metrics.inc('suspicious_checks_total', {'check': name, 'result': 'hit' if hit else 'pass'})
+        
+        verdict = {
+            'user_id': user_id,
+            'checks': checks,
+            'suspicious_count': sum(checks.values()),
+            'timings_ms': {name: round(seconds * 1000, 3) for name, seconds in timings.items()},
+            'evaluated_at': datetime.utcnow().isoformat(),
+            'cached': False
+        }
+        
+        with cls._verdict_lock:
+            if len(cls._verdicts) >= cls.MAX_CACHED_VERDICTS:
+                cls._verdicts.clear()
+            cls._verdicts[key] = {
+                'verdict': verdict,
+                'version': version,
+                'expires_at': time.monotonic() + cls.VERDICT_TTL_SECONDS
+            }
+        return verdict
+    
     @staticmethod
     def detect_rapid_clicking(user_id, time_window_minutes=5, max_actions=20):
         """Detect if user is clicking too rapidly"""
-        time_threshold = datetime.utcnow() - timedelta(minutes=time_window_minutes)
-        
-        recent_actions = PointLog.query.filter(
-            PointLog.user_id == user_id,
-            PointLog.created_at >= time_threshold
-        ).count()
+        recent_actions = ActivityTracker.recent(user_id, time_window_minutes * 60)
         
-        return recent_actions > max_actions
+        return len(recent_actions) > max_actions
     
     @staticmethod
     def detect_device_fingerprint_abuse(ip_address, user_agent, max_accounts=3):
@@ -48,21 +131,16 @@ class SuspiciousPatternDetector:
     @staticmethod
     def detect_bot_behavior(user_id, time_window_hours=1):
         """Detect bot-like behavior patterns"""
-        time_threshold = datetime.utcnow() - timedelta(hours=time_window_hours)
+        # Get recent activity timestamps (sorted, from the in-memory window)
+        recent_times = ActivityTracker.recent(user_id, time_window_hours * 3600)
         
-        # Get recent point logs
-        recent_logs = PointLog.query.filter(
-            PointLog.user_id == user_id,
-            PointLog.created_at >= time_threshold
-        ).order_by(PointLog.created_at).all()
-        
-        if len(recent_logs) < 5:
+        if len(recent_times) < 5:
             return False
         
         # Check for too regular intervals (bot-like)
         intervals = []
-        for i in range(1, len(recent_logs)):
-            interval = (recent_logs[i].created_at - recent_logs[i-1].created_at).total_seconds()
+        for i in range(1, len(recent_times)):
+            interval = (recent_times[i] - recent_times[i-1]).total_seconds()
             intervals.append(interval)
         
         # If all intervals are very similar (within 2 seconds), it's suspicious
@@ -85,21 +163,16 @@ def validate_user_action():
         user_id = session['user_id']
         action_type = data.get('action_type')  # 'watch_ad', 'play_game', etc.
         
-        detector = SuspiciousPatternDetector()
-        
-        # Run various checks
-        checks = {
-            'rapid_clicking': detector.detect_rapid_clicking(user_id),
-            'unusual_earning': detector.detect_unusual_earning_pattern(user_id),
-            'bot_behavior': detector.detect_bot_behavior(user_id),
-            'device_abuse': detector.detect_device_fingerprint_abuse(
-                request.remote_addr,
-                request.headers.get('User-Agent', '')
-            )
-        }
+        # Run all checks in a single pass
+        verdict = SuspiciousPatternDetector.evaluate(
+            user_id,
+            request.remote_addr,
+            request.headers.get('User-Agent', '')
+        )
+        checks = verdict['checks']
         
         # Determine if action should be blocked
-        suspicious_count = sum(checks.values())
+        suspicious_count = verdict['suspicious_count']
         
         if suspicious_count >= 2:  # Block if 2 or more suspicious patterns
             return jsonify({
@@ -196,13 +269,13 @@ def check_daily_limits():
         today_ads = PointLog.query.filter(
             PointLog.user_id == user_id,
             PointLog.activity_type == 'watch_ad',
-            db.func.date(PointLog.created_at) == today
+            day_window(PointLog.created_at, today)
         ).count()
         
         today_games = PointLog.query.filter(
             PointLog.user_id == user_id,
             PointLog.activity_type == 'play_game',
-            db.func.date(PointLog.created_at) == today
+            day_window(PointLog.created_at, today)
         ).count()
         
         return jsonify({
@@ -274,24 +347,25 @@ def auto_block_check():
         user_id = session['user_id']
         user = User.query.get(user_id)
         
-        detector = SuspiciousPatternDetector()
+        # Run comprehensive checks in a single pass
+        checks = SuspiciousPatternDetector.evaluate(
+            user_id,
+            request.remote_addr,
+            request.headers.get('User-Agent', '')
+        )['checks']
         
-        # Run comprehensive checks
         issues = []
         
-        if detector.detect_rapid_clicking(user_id):
+        if checks['rapid_clicking']:
             issues.append('نقرات سريعة مشبوهة')
         
-        if detector.detect_unusual_earning_pattern(user_id):
+        if checks['unusual_earning']:
             issues.append('نمط كسب نقاط غير عادي')
         
-        if detector.detect_bot_behavior(user_id):
+        if checks['bot_behavior']:
             issues.append('سلوك يشبه البوت')
         
-        if detector.detect_device_fingerprint_abuse(
-            request.remote_addr,
-            request.headers.get('User-Agent', '')
-        ):
+        if checks['device_abuse']:
             issues.append('استخدام عدة حسابات من نفس الجهاز')
         
         # Auto-block if multiple issues detected
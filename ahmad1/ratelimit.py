@@ -0,0 +1,216 @@
+from flask import jsonify, request, session
+from src.models.metrics import Metrics
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # no cross-process locking; buckets are kept per process
+    fcntl = None
+
+
+class BucketTable:
+    """Token buckets in a memory-mapped file shared by every worker.
+
+    The file is a fixed-size open-addressing hash table of
+    [key hash (8 bytes)][tokens (double)][updated_at (double)] slots, split
+    into STRIPES ranges. A key only ever lives in its stripe; taking a token
+    locks that byte range with fcntl (and a thread lock, since fcntl locks
+    don't exclude threads of the same process), so workers contend only on
+    keys that share a stripe. When a stripe's probe window is full the least
+    recently used bucket is evicted; a bucket idle long enough to refill is
+    indistinguishable from a new one, so this only forgets idle keys.
+
+    An existing file with another layout (slot count, format version) is a
+    ValueError rather than being rebuilt: other workers may still have it
+    mapped, and shrinking or clearing it under them breaks their buckets.
+    """
+
+    MAGIC = b'TBKT0001'
+    HEADER = struct.Struct('<8sQ')
+    SLOT = struct.Struct('<Qdd')
+    STRIPES = 64
+    PROBES = 16
+
+    def __init__(self, path, slots):
+        self.slots_per_stripe = max(self.PROBES, slots // self.STRIPES)
+        self.slots = self.slots_per_stripe * self.STRIPES
+        self.size = self.HEADER.size + self.slots * self.SLOT.size
+        self._thread_locks = [threading.Lock() for _ in range(self.STRIPES)]
+
+        if path and fcntl is not None:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._file = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b')
+            fcntl.lockf(self._file.fileno(), fcntl.LOCK_EX)
+            try:
+                self._file.seek(0)
+                header = self._file.read(self.HEADER.size)
+                expected = self.HEADER.pack(self.MAGIC, self.slots)
+                if not header.strip(b'\0'):
+                    # New file: nobody can have mapped it before the header is written
+                    self._file.truncate(self.size)
+                    self._file.seek(0)
+                    self._file.write(expected)
+                    self._file.flush()
+                    compatible = True
+                else:
+                    compatible = header == expected and os.fstat(self._file.fileno()).st_size == self.size
+            finally:
+                fcntl.lockf(self._file.fileno(), fcntl.LOCK_UN)
+            if not compatible:
+                self._file.close()
+                raise ValueError(f"{path} was created with a different layout; "
+                                 "stop the workers and delete it, or match RATE_LIMIT_SLOTS")
+            self._map = mmap.mmap(self._file.fileno(), self.size)
+            self.shared = True
+        else:
+            self._file = None
+            self._map = mmap.mmap(-1, self.size)
+            self.shared = False
+
+    @staticmethod
+    def key_hash(key):
+        value = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+        return value or 1  # 0 marks an empty slot
+
+    def take(self, key, rate, burst, cost=1.0, now=None):
+        """Take cost tokens from key's bucket; returns (allowed, seconds until allowed)"""
+        now = time.time() if now is None else now
+        hashed = self.key_hash(key)
+        stripe = hashed % self.STRIPES
+        first = self.HEADER.size + stripe * self.slots_per_stripe * self.SLOT.size
+        start = (hashed // self.STRIPES) % self.slots_per_stripe
+
+        with self._thread_locks[stripe]:
+            if self.shared:
+                fcntl.lockf(self._file.fileno(), fcntl.LOCK_EX,
+                            self.slots_per_stripe * self.SLOT.size, first, os.SEEK_SET)
+            try:
+                offset, tokens, updated = self._find(hashed, first, start)
+                if updated is None:
+                    tokens = burst
+                else:
+                    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+
+                if tokens >= cost:
+                    tokens -= cost
+                    allowed, retry_after = True, 0.0
+                else:
+                    allowed, retry_after = False, (cost - tokens) / rate
+                self.SLOT.pack_into(self._map, offset, hashed, tokens, now)
+            finally:
+                if self.shared:
+                    fcntl.lockf(self._file.fileno(), fcntl.LOCK_UN,
+                                self.slots_per_stripe * self.SLOT.size, first, os.SEEK_SET)
+        return allowed, retry_after
+
+    def _find(self, hashed, first, start):
+        """(offset, tokens, updated) of the key's slot; updated is None for a new bucket"""
+        free = None
+        oldest = None
+        for probe in range(self.PROBES):
+            offset = first + ((start + probe) % self.slots_per_stripe) * self.SLOT.size
+            slot_hash, tokens, updated = self.SLOT.unpack_from(self._map, offset)
+            if slot_hash == hashed:
+                return offset, tokens, updated
+            if slot_hash == 0:
+                if free is None:
+                    free = offset
+            elif oldest is None or updated < oldest[1]:
+                oldest = (offset, updated)
+        return (free if free is not None else oldest[0]), 0.0, None
+
+    def reset(self):
+        self._map[self.HEADER.size:] = bytes(self.size - self.HEADER.size)
+
+
+class RateLimiter:
+    """Per-route token-bucket limits checked before the view runs.
+
+    RULES maps an endpoint to (scope, limit, period_seconds) rules: 'ip'
+    buckets are keyed by the client address, 'user' buckets by
+    session['user_id'] (skipped for anonymous requests, which the views
+    reject anyway). Behind a reverse proxy set TRUSTED_PROXIES so the client
+    address comes from X-Forwarded-For instead of the proxy's own. Each rule allows bursts of `limit` requests refilled at
+    limit/period per second. A request over any limit gets a 429 with
+    Retry-After before it reaches the database or the fraud checks.
+
+    app.config['RATE_LIMITS'] overrides rules per endpoint (an empty list
+    turns limiting off for that endpoint). Buckets live in a BucketTable at
+    RATE_LIMIT_PATH so all workers on the host share them. init_app() must
+    run after the blueprints are registered: a rule for an endpoint the app
+    doesn't have is a ValueError rather than a silently missing limit.
+    """
+
+    RULES = {
+        'auth.login': [('ip', 10, 60), ('ip', 100, 3600)],
+        'auth.register': [('ip', 5, 3600)],
+        'points.watch_ad': [('user', 10, 60), ('ip', 30, 60)],
+        'games.watch_ad_in_game': [('user', 10, 60), ('ip', 30, 60)],
+        'games.start_game_session': [('user', 30, 60)],
+        'games.game_heartbeat': [('user', 120, 60)],
+        'points.refer_friend': [('user', 10, 3600)],
+        'points.request_withdrawal': [('user', 5, 3600)],
+        'protection.validate_user_action': [('user', 60, 60)],
+    }
+
+    table = None
+    rules = {}
+    _lock = threading.Lock()
+    _config = None
+
+    @classmethod
+    def init_app(cls, app):
+        cls.rules = dict(cls.RULES)
+        cls.rules.update(app.config.get('RATE_LIMITS') or {})
+        unknown = sorted(endpoint for endpoint in cls.rules if endpoint not in app.view_functions)
+        if unknown:
+            raise ValueError(f"Rate limit rules for unknown endpoints: {', '.join(unknown)}")
+        cls._config = (app.config.get('RATE_LIMIT_PATH'), app.config.get('RATE_LIMIT_SLOTS', 65536))
+        cls.table = None
+        app.before_request(cls.check)
+
+    @classmethod
+    def _table(cls):
+        # Opened on first use so start-up stays free of file work
+        if cls.table is None:
+            with cls._lock:
+                if cls.table is None:
+                    path, slots = cls._config
+                    cls.table = BucketTable(path, slots)
+        return cls.table
+
+    @classmethod
+    def check(cls):
+        rules = cls.rules.get(request.endpoint)
+        if not rules or request.method == 'OPTIONS':
+            return None
+
+        retry_after = 0.0
+        limited_scope = None
+        table = cls._table()
+        for scope, limit, period in rules:
+            if scope == 'user':
+                subject = session.get('user_id')
+                if subject is None:
+                    continue
+            else:
+                subject = request.remote_addr
+            allowed, wait = table.take(f'{request.endpoint}|{scope}:{subject}|{limit}/{period}',
+                                       limit / period, limit)
+            if not allowed and wait > retry_after:
+                retry_after, limited_scope = wait, scope
+
+        if limited_scope is None:
+            return None
+
+        Metrics.inc('rate_limited_requests_total', {'endpoint': request.endpoint, 'scope': limited_scope})
+        response = jsonify({'error': 'عدد كبير من الطلبات، يرجى المحاولة بعد قليل'})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
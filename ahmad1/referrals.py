@@ -0,0 +1,232 @@
+from src.models.user import User, Referral, ReferralStats, db
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import datetime
+
+
+class ReferralGraph:
+    """Referral trees, top referrers and referral rings.
+
+    ReferralStats keeps each user's direct referral count and the size of
+    their subtree in the primary-referrer forest (a user hangs under the
+    first referrer whose referral doesn't close a ring). record() updates
+    both in the referral's transaction: one upsert for the referrer and one
+    UPDATE over the ancestors found by a recursive CTE. Trees and rings are
+    walked with recursive CTEs over the indexed referral columns.
+    """
+
+    MAX_DEPTH = 100  # safety bound for ancestor walks
+    TREE_MAX_DEPTH = 5
+    TREE_MAX_NODES = 500
+    RING_MAX_LENGTH = 6
+
+    ANCESTORS = """
+        WITH RECURSIVE ancestors(user_id, depth) AS (
+            SELECT :user_id, 0
+            UNION
+            SELECT s.referrer_id, a.depth + 1
+            FROM referral_stats s JOIN ancestors a ON s.user_id = a.user_id
+            WHERE s.referrer_id IS NOT NULL AND a.depth < :max_depth
+        )
+    """
+
+    @classmethod
+    def record(cls, referrer_id, referred_id, now=None):
+        """Count a new referral; returns True if the referred user joined the referrer's tree.
+
+        Runs on the request session and never commits. The referrer upsert
+        comes first so the transaction holds SQLite's write lock before the
+        ring check reads the ancestors.
+        """
+        now = now or datetime.utcnow()
+        stats = ReferralStats.__table__
+
+        upsert = sqlite_insert(stats).values(user_id=referrer_id, direct_count=1, descendant_count=0, updated_at=now)
+        db.session.execute(upsert.on_conflict_do_update(
+            index_elements=[stats.c.user_id],
+            set_={'direct_count': stats.c.direct_count + 1, 'updated_at': now}
+        ))
+        db.session.execute(sqlite_insert(stats).values(
+            user_id=referred_id, direct_count=0, descendant_count=0, updated_at=now
+        ).on_conflict_do_nothing(index_elements=[stats.c.user_id]))
+
+        referred = db.session.execute(
+            db.select(stats.c.referrer_id, stats.c.descendant_count).where(stats.c.user_id == referred_id)
+        ).first()
+        if referred.referrer_id is not None or referred_id == referrer_id:
+            return False
+
+        ancestors = [row[0] for row in db.session.execute(
+            text(cls.ANCESTORS + "SELECT DISTINCT user_id FROM ancestors"),
+            {'user_id': referrer_id, 'max_depth': cls.MAX_DEPTH}
+        )]
+        if referred_id in ancestors:
+            return False  # would close a ring; rings() reports it
+
+        db.session.execute(stats.update().where(stats.c.user_id == referred_id)
+                           .values(referrer_id=referrer_id, updated_at=now))
+        db.session.execute(stats.update().where(stats.c.user_id.in_(ancestors)).values(
+            descendant_count=stats.c.descendant_count + referred.descendant_count + 1,
+            updated_at=now
+        ))
+        return True
+
+    @staticmethod
+    def rebuild():
+        """Recompute ReferralStats from the referral table (backfill/repair)"""
+        edges = db.session.query(Referral.referrer_id, Referral.referred_id)\
+            .order_by(Referral.created_at, Referral.id).all()
+
+        direct = {}
+        parent = {}
+        for referrer_id, referred_id in edges:
+            direct[referrer_id] = direct.get(referrer_id, 0) + 1
+            if referred_id in parent or referred_id == referrer_id:
+                continue
+            node = referrer_id
+            while node is not None and node != referred_id:
+                node = parent.get(node)
+            if node is None:
+                parent[referred_id] = referrer_id
+
+        descendants = {}
+        for user_id in parent:
+            node = parent[user_id]
+            while node is not None:
+                descendants[node] = descendants.get(node, 0) + 1
+                node = parent.get(node)
+
+        now = datetime.utcnow()
+        user_ids = set(direct) | set(parent) | set(parent.values())
+        rows = [{
+            'user_id': user_id,
+            'referrer_id': parent.get(user_id),
+            'direct_count': direct.get(user_id, 0),
+            'descendant_count': descendants.get(user_id, 0),
+            'updated_at': now
+        } for user_id in user_ids]
+
+        ReferralStats.query.delete()
+        if rows:
+            db.session.execute(ReferralStats.__table__.insert(), rows)
+        db.session.commit()
+        return len(rows)
+
+    @staticmethod
+    def _users(user_ids):
+        if not user_ids:
+            return {}, {}
+        users = {user.id: user.to_dict_lite() for user in User.query.filter(User.id.in_(user_ids))}
+        stats = {row.user_id: row for row in ReferralStats.query.filter(ReferralStats.user_id.in_(user_ids))}
+        return users, stats
+
+    @staticmethod
+    def _counts(stats, user_id):
+        row = stats.get(user_id)
+        return {
+            'direct_count': row.direct_count if row else 0,
+            'descendant_count': row.descendant_count if row else 0
+        }
+
+    @classmethod
+    def top(cls, by='direct', limit=20):
+        """Users with the most direct referrals (or the largest subtrees)"""
+        column = ReferralStats.descendant_count if by == 'descendants' else ReferralStats.direct_count
+        rows = db.session.query(ReferralStats, User)\
+            .join(User, User.id == ReferralStats.user_id)\
+            .filter(column > 0)\
+            .order_by(column.desc(), ReferralStats.user_id)\
+            .limit(limit).all()
+        return [dict(stats.to_dict(), user=user.to_dict_lite()) for stats, user in rows]
+
+    @classmethod
+    def tree(cls, user_id, max_depth=None, max_nodes=None):
+        """Who the user referred, and who they referred, down to max_depth levels"""
+        max_depth = max_depth or cls.TREE_MAX_DEPTH
+        max_nodes = max_nodes or cls.TREE_MAX_NODES
+        rows = db.session.execute(text("""
+            WITH RECURSIVE tree(user_id, parent_id, depth, path) AS (
+                SELECT :user_id, NULL, 0, ',' || :user_id || ','
+                UNION ALL
+                SELECT r.referred_id, r.referrer_id, t.depth + 1, t.path || r.referred_id || ','
+                FROM tree t JOIN referral r ON r.referrer_id = t.user_id
+                WHERE t.depth < :max_depth AND instr(t.path, ',' || r.referred_id || ',') = 0
+            )
+            SELECT user_id, parent_id, depth FROM tree LIMIT :limit
+        """), {'user_id': user_id, 'max_depth': max_depth, 'limit': max_nodes + 1}).all()
+
+        truncated = len(rows) > max_nodes
+        rows = rows[:max_nodes]
+        children = {}
+        for child_id, parent_id, _ in rows:
+            if parent_id is not None:
+                siblings = children.setdefault(parent_id, [])
+                if child_id not in siblings:
+                    siblings.append(child_id)
+
+        users, stats = cls._users({row[0] for row in rows})
+        expanded = set()
+
+        def node(node_id, depth):
+            # A user referred more than once is expanded under their first referrer only
+            item = dict(cls._counts(stats, node_id), user_id=node_id, user=users.get(node_id), depth=depth)
+            if node_id in expanded:
+                item['repeat'] = True
+                return item
+            expanded.add(node_id)
+            item['children'] = [node(child_id, depth + 1) for child_id in children.get(node_id, [])]
+            return item
+
+        return {'tree': node(user_id, 0), 'nodes': len(rows), 'truncated': truncated}
+
+    @classmethod
+    def summary(cls, user_id):
+        """A user's counts and their chain of primary referrers up to the root"""
+        chain = db.session.execute(
+            text(cls.ANCESTORS + "SELECT user_id, min(depth) FROM ancestors WHERE depth > 0 "
+                                 "GROUP BY user_id ORDER BY min(depth)"),
+            {'user_id': user_id, 'max_depth': cls.MAX_DEPTH}
+        ).all()
+        users, stats = cls._users({user_id} | {row[0] for row in chain})
+        return dict(
+            cls._counts(stats, user_id),
+            user_id=user_id,
+            user=users.get(user_id),
+            referrer_id=stats[user_id].referrer_id if user_id in stats else None,
+            referrers=[dict(cls._counts(stats, ancestor_id), user_id=ancestor_id, user=users.get(ancestor_id),
+                            depth=depth)
+                       for ancestor_id, depth in chain]
+        )
+
+    @classmethod
+    def rings(cls, max_length=None, limit=50):
+        """Referral cycles (A refers B ... refers A) of up to max_length users"""
+        max_length = max_length or cls.RING_MAX_LENGTH
+        paths = db.session.execute(text("""
+            WITH RECURSIVE walk(start_id, node_id, depth, path) AS (
+                SELECT r.referrer_id, r.referred_id, 1, ',' || r.referrer_id || ',' || r.referred_id || ','
+                FROM referral r
+                WHERE r.referrer_id IN (SELECT referred_id FROM referral)
+                UNION ALL
+                SELECT w.start_id, r.referred_id, w.depth + 1, w.path || r.referred_id || ','
+                FROM walk w JOIN referral r ON r.referrer_id = w.node_id
+                WHERE w.node_id != w.start_id AND w.depth < :max_length
+                  AND (r.referred_id = w.start_id OR instr(w.path, ',' || r.referred_id || ',') = 0)
+            )
+            SELECT path FROM walk WHERE node_id = start_id LIMIT :row_limit
+        """), {'max_length': max_length, 'row_limit': limit * max_length * 4}).scalars().all()
+
+        # Every member finds the same ring; keep one rotation (smallest id first)
+        rings = {}
+        for path in paths:
+            members = [int(member) for member in path.strip(',').split(',')[:-1]]
+            start = members.index(min(members))
+            rings.setdefault(tuple(members[start:] + members[:start]), None)
+        found = sorted(rings, key=lambda ring: (len(ring), ring))[:limit]
+
+        users, _ = cls._users({member for ring in found for member in ring})
+        return [{
+            'length': len(ring),
+            'user_ids': list(ring),
+            'users': [users.get(member) for member in ring]
+        } for ring in found]
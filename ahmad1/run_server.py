@@ -1,12 +1,12 @@
-from flask import Flask, render_template
 import os
+import sys
 
-app = Flask(__name__)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-@app.route('/')
-def home():
-    return render_template('index.html')
+from src.main import create_app
 
 if __name__ == '__main__':
+    # Built here rather than at import: password hashing workers re-import this script
+    app = create_app()
     port = int(os.environ.get("PORT", 10000))
     app.run(host='0.0.0.0', port=port)
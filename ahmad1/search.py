@@ -0,0 +1,149 @@
+from src.models.user import User, db
+from src.models.pagination import MAX_PER_PAGE
+from sqlalchemy import text
+
+
+class UserSearch:
+    """Admin user search backed by an FTS5 trigram index.
+
+    user_fts is an external-content FTS5 table over user.name, email and
+    phone_number, kept in sync by triggers, so substring searches (partial
+    emails, phone fragments) are answered from the index and ranked with
+    bm25 instead of scanning the user table with leading-wildcard LIKEs.
+    Terms shorter than the three-character trigram can't use the index:
+    they are checked with LIKE against the rows the longer terms matched,
+    and a search made only of short terms falls back to LIKE, as does
+    everything when the SQLite build lacks FTS5/trigram.
+    """
+
+    MIN_TERM_LENGTH = 3
+
+    available = None  # unknown until install() or the first search
+
+    DDL = [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS user_fts USING fts5(
+            name, email, phone_number,
+            content='user', content_rowid='id', tokenize='trigram'
+        )""",
+        """CREATE TRIGGER IF NOT EXISTS user_fts_ai AFTER INSERT ON user BEGIN
+            INSERT INTO user_fts(rowid, name, email, phone_number)
+            VALUES (new.id, new.name, new.email, new.phone_number);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS user_fts_ad AFTER DELETE ON user BEGIN
+            INSERT INTO user_fts(user_fts, rowid, name, email, phone_number)
+            VALUES ('delete', old.id, old.name, old.email, old.phone_number);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS user_fts_au AFTER UPDATE OF name, email, phone_number ON user BEGIN
+            INSERT INTO user_fts(user_fts, rowid, name, email, phone_number)
+            VALUES ('delete', old.id, old.name, old.email, old.phone_number);
+            INSERT INTO user_fts(rowid, name, email, phone_number)
+            VALUES (new.id, new.name, new.email, new.phone_number);
+        END""",
+    ]
+
+    @classmethod
+    def install(cls):
+        """Create the index and triggers if missing; call after db.create_all()"""
+        if db.engine.dialect.name != 'sqlite':
+            return False
+        try:
+            exists = db.session.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_fts'"
+            )).first() is not None
+            for statement in cls.DDL:
+                db.session.execute(text(statement))
+            if not exists:
+                cls._rebuild()
+            db.session.commit()
+        except Exception:
+            # No FTS5 or no trigram tokenizer (SQLite < 3.34): keep using LIKE
+            db.session.rollback()
+            cls.available = False
+            return False
+
+        cls.available = True
+        return True
+
+    @classmethod
+    def is_available(cls):
+        """Whether user_fts exists (created by `flask init-db`)"""
+        if cls.available is None:
+            try:
+                cls.available = db.session.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_fts'"
+                )).first() is not None
+            except Exception:
+                cls.available = False
+        return cls.available
+
+    @classmethod
+    def rebuild(cls):
+        """Repopulate the index from the user table"""
+        cls._rebuild()
+        db.session.commit()
+
+    @staticmethod
+    def _rebuild():
+        db.session.execute(text("INSERT INTO user_fts(user_fts) VALUES ('rebuild')"))
+
+    @staticmethod
+    def match_expression(search):
+        """Each word long enough for trigrams as a quoted phrase, ANDed; None if there is none"""
+        words = [word for word in search.split() if len(word) >= UserSearch.MIN_TERM_LENGTH]
+        if not words:
+            return None
+        return ' AND '.join('"' + word.replace('"', '""') + '"' for word in words)
+
+    @staticmethod
+    def short_terms(search):
+        """Words too short for the trigram index, as escaped LIKE patterns"""
+        return ['%' + word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+                for word in search.split() if len(word) < UserSearch.MIN_TERM_LENGTH]
+
+    @classmethod
+    def search(cls, search, page=1, per_page=20, include_total=True):
+        """Ranked page of matching users, plus total/has_more"""
+        page = max(1, page or 1)
+        per_page = max(1, min(per_page or 20, MAX_PER_PAGE))
+        offset = (page - 1) * per_page
+
+        expression = cls.match_expression(search) if cls.is_available() else None
+        if expression is None:
+            query = User.query.filter(
+                (User.name.contains(search)) |
+                (User.email.contains(search)) |
+                (User.phone_number.contains(search))
+            )
+            total = query.count() if include_total else None
+            users = query.order_by(User.created_at.desc(), User.id.desc())\
+                .offset(offset).limit(per_page + 1).all()
+        else:
+            params = {'match': expression, 'limit': per_page + 1, 'offset': offset}
+            where = "user_fts MATCH :match"
+            # Short words must still appear somewhere, as they would with LIKE
+            for number, pattern in enumerate(cls.short_terms(search)):
+                params[f'short{number}'] = pattern
+                where += " AND (" + " OR ".join(
+                    f"{column} LIKE :short{number} ESCAPE '\\'" for column in ('name', 'email', 'phone_number')
+                ) + ")"
+            ids = [row[0] for row in db.session.execute(text(
+                f"SELECT rowid FROM user_fts WHERE {where} "
+                "ORDER BY rank, rowid DESC LIMIT :limit OFFSET :offset"
+            ), params)]
+            total = db.session.execute(text(
+                f"SELECT count(*) FROM user_fts WHERE {where}"
+            ), params).scalar() if include_total else None
+            by_id = {user.id: user for user in User.query.filter(User.id.in_(ids))} if ids else {}
+            users = [by_id[user_id] for user_id in ids if user_id in by_id]
+
+        result = {
+            'items': users[:per_page],
+            'per_page': per_page,
+            'current_page': page,
+            'has_more': len(users) > per_page,
+            'ranked': expression is not None
+        }
+        if total is not None:
+            result['total'] = total
+            result['pages'] = -(-total // per_page)
+        return result
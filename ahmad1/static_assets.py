@@ -0,0 +1,111 @@
+from flask import Response, request, send_file
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+
+class StaticManifest:
+    """In-memory manifest of the static folder, built once on first use.
+
+    Every file is hashed for its ETag and, when it is a compressible text
+    asset, gzip (and brotli, if the brotli package is installed) variants
+    are produced up front, or picked up from .gz/.br files shipped next to
+    it. Requests are answered from the manifest without touching the
+    filesystem; content-hashed build assets under assets/ get a one-year
+    immutable Cache-Control and everything else must revalidate its ETag.
+    Files added after the first request are only seen after reload().
+    """
+
+    COMPRESSIBLE = ('.js', '.mjs', '.css', '.html', '.json', '.svg', '.txt', '.xml', '.map', '.ico', '.wasm')
+    MIN_COMPRESS_SIZE = 1024
+    MAX_MEMORY_SIZE = 8 * 1024 * 1024  # larger files are streamed from disk
+    # Vite build output: assets/[name]-[hash].[ext] with an 8-character hash
+    HASHED_NAME = re.compile(r'^assets/(?:[^/]+/)*[^/]+-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$')
+    IMMUTABLE = 'public, max-age=31536000, immutable'
+    REVALIDATE = 'public, no-cache'
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.entries = None
+        self._lock = threading.Lock()
+
+    def reload(self):
+        entries = {}
+        if self.folder and os.path.isdir(self.folder):
+            for root, _, files in os.walk(self.folder):
+                for filename in files:
+                    if filename.endswith(('.gz', '.br')):
+                        continue
+                    full_path = os.path.join(root, filename)
+                    relative = os.path.relpath(full_path, self.folder).replace(os.sep, '/')
+                    entries[relative] = self._entry(full_path, relative)
+        self.entries = entries
+        return len(entries)
+
+    def _entry(self, full_path, relative):
+        with open(full_path, 'rb') as f:
+            body = f.read()
+
+        entry = {
+            'path': full_path,
+            'mimetype': mimetypes.guess_type(relative)[0] or 'application/octet-stream',
+            'etag': hashlib.sha1(body).hexdigest(),
+            'cache_control': self.IMMUTABLE if self.HASHED_NAME.search(relative) else self.REVALIDATE,
+            'variants': {}
+        }
+        in_memory = len(body) <= self.MAX_MEMORY_SIZE
+        entry['body'] = body if in_memory else None
+
+        if relative.lower().endswith(self.COMPRESSIBLE) and len(body) >= self.MIN_COMPRESS_SIZE and in_memory:
+            variants = {}
+            for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+                if os.path.exists(full_path + suffix):
+                    with open(full_path + suffix, 'rb') as f:
+                        variants[encoding] = f.read()
+            if 'gzip' not in variants:
+                variants['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+            if 'br' not in variants and brotli is not None:
+                variants['br'] = brotli.compress(body, quality=11)
+            entry['variants'] = {
+                encoding: data for encoding, data in variants.items() if len(data) < len(body)
+            }
+        return entry
+
+    def get(self, path):
+        if self.entries is None:
+            # Built lazily so worker start-up doesn't pay for hashing and compression
+            with self._lock:
+                if self.entries is None:
+                    self.reload()
+        return self.entries.get(path)
+
+    def response(self, entry):
+        """Best encoding the client accepts, with ETag/304 handling"""
+        encoding = None
+        for candidate in ('br', 'gzip'):
+            if candidate in entry['variants'] and request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+
+        if encoding:
+            response = Response(entry['variants'][encoding], mimetype=entry['mimetype'])
+            response.headers['Content-Encoding'] = encoding
+            response.set_etag(f"{entry['etag']}-{encoding}")
+        elif entry['body'] is not None:
+            response = Response(entry['body'], mimetype=entry['mimetype'])
+            response.set_etag(entry['etag'])
+        else:
+            response = send_file(entry['path'], mimetype=entry['mimetype'], etag=entry['etag'], conditional=False)
+
+        if entry['variants']:
+            response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = entry['cache_control']
+        return response.make_conditional(request)
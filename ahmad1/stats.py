@@ -0,0 +1,112 @@
+from src.models.user import User, Game, PointLog, WithdrawalRequest, GameSession, Referral, DailyStat, db
+from datetime import datetime
+import threading
+import time
+
+
+class DashboardStats:
+    """Admin dashboard numbers served from the daily_stats rollups.
+
+    The write paths bump per-day counters with DailyStat.bump(); this class
+    only sums a handful of rollup rows and keeps the result in a short TTL
+    snapshot, so loading the dashboard no longer scans the big tables.
+    """
+
+    CACHE_SECONDS = 30
+
+    _lock = threading.Lock()
+    _snapshot = None
+    _built_at = 0
+
+    @classmethod
+    def get(cls):
+        if cls._snapshot is not None and time.monotonic() - cls._built_at < cls.CACHE_SECONDS:
+            return cls._snapshot
+
+        snapshot = cls._compute()
+        with cls._lock:
+            cls._snapshot = snapshot
+            cls._built_at = time.monotonic()
+        return snapshot
+
+    @classmethod
+    def invalidate(cls):
+        with cls._lock:
+            cls._snapshot = None
+
+    @staticmethod
+    def _compute():
+        today = datetime.utcnow().date()
+        totals = dict(db.session.query(DailyStat.metric, db.func.sum(DailyStat.value))
+                      .group_by(DailyStat.metric).all())
+        today_counts = dict(db.session.query(DailyStat.metric, DailyStat.value)
+                            .filter(DailyStat.day == today).all())
+
+        approved_cents = totals.get('approved_withdrawal_cents', 0)
+
+        return {
+            'users': {
+                'total': totals.get('new_users', 0),
+                'new_today': today_counts.get('new_users', 0),
+                'active_today': today_counts.get('active_users', 0)
+            },
+            'points': {
+                'total_distributed': totals.get('points_distributed', 0),
+                'distributed_today': today_counts.get('points_distributed', 0)
+            },
+            'games': {
+                'total': Game.query.count(),
+                'sessions_today': today_counts.get('sessions', 0)
+            },
+            'withdrawals': {
+                'pending': WithdrawalRequest.query.filter_by(status='pending').count(),
+                'total': totals.get('withdrawals', 0),
+                'total_amount': approved_cents / 100 if approved_cents else 0
+            },
+            'referrals': {
+                'total': totals.get('referrals', 0),
+                'today': today_counts.get('referrals', 0)
+            },
+            'generated_at': datetime.utcnow().isoformat()
+        }
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute every rollup from the base tables (backfill/repair)"""
+        date_of = db.func.date
+        sources = {
+            'new_users': db.session.query(date_of(User.created_at), db.func.count(User.id))
+                .group_by(date_of(User.created_at)),
+            'active_users': db.session.query(date_of(User.last_login), db.func.count(User.id))
+                .filter(User.last_login.isnot(None)).group_by(date_of(User.last_login)),
+            'points_distributed': db.session.query(date_of(PointLog.created_at), db.func.sum(PointLog.points_earned))
+                .group_by(date_of(PointLog.created_at)),
+            'sessions': db.session.query(date_of(GameSession.start_time), db.func.count(GameSession.id))
+                .group_by(date_of(GameSession.start_time)),
+            'withdrawals': db.session.query(date_of(WithdrawalRequest.created_at), db.func.count(WithdrawalRequest.id))
+                .group_by(date_of(WithdrawalRequest.created_at)),
+            'approved_withdrawal_cents': db.session.query(
+                date_of(WithdrawalRequest.updated_at),
+                db.func.sum(db.func.round(WithdrawalRequest.amount_usd * 100))
+            ).filter(WithdrawalRequest.status == 'approved').group_by(date_of(WithdrawalRequest.updated_at)),
+            'referrals': db.session.query(date_of(Referral.created_at), db.func.count(Referral.id))
+                .group_by(date_of(Referral.created_at)),
+        }
+
+        rows = []
+        for metric, query in sources.items():
+            for day_value, value in query.all():
+                if day_value is None or not value:
+                    continue
+                rows.append({
+                    'day': datetime.strptime(day_value, '%Y-%m-%d').date(),
+                    'metric': metric,
+                    'value': int(value)
+                })
+
+        DailyStat.query.delete()
+        if rows:
+            db.session.execute(DailyStat.__table__.insert(), rows)
+        db.session.commit()
+        cls.invalidate()
+        return len(rows)
@@ -0,0 +1,151 @@
+from src.models.user import User, PointLog, SuspiciousActivitySnapshot, db, day_start
+from datetime import datetime, timedelta
+import threading
+import time
+
+
+class SuspiciousActivityReport:
+    """Builds the suspicious-activity report into suspicious_activity_snapshot.
+
+    The report is computed with two set-based queries (a conditional
+    aggregate over recent PointLog rows and a window count over users per
+    IP) and replaced in one transaction. The admin endpoint only reads the
+    snapshot, refreshing it inline when it is older than REFRESH_SECONDS
+    and no background refresher is running. Every refresh also writes a
+    MARKER row, so an empty report still records when it was built.
+    """
+
+    MARKER = 'refreshed'  # kind of the row that only carries generated_at
+
+    REFRESH_SECONDS = 300
+    DAILY_POINTS_THRESHOLD = 100  # Suspicious if more than 100 points per day
+    USERS_PER_IP_THRESHOLD = 3  # Suspicious if more than 3 users per IP
+    HOURLY_ACTIVITY_THRESHOLD = 20  # More than 20 activities per hour
+
+    _lock = threading.Lock()
+
+    @classmethod
+    def refresh(cls):
+        """Recompute the whole report and swap it in atomically"""
+        with cls._lock:
+            now = datetime.utcnow()
+            today_start = day_start(now.date())
+            hour_ago = now - timedelta(hours=1)
+
+            in_today = PointLog.created_at >= today_start
+            in_last_hour = PointLog.created_at >= hour_ago
+            daily_points = db.func.sum(db.case((in_today, PointLog.points_earned), else_=0))
+            daily_count = db.func.sum(db.case((in_today, 1), else_=0))
+            hourly_count = db.func.sum(db.case((in_last_hour, 1), else_=0))
+
+            point_rows = db.session.query(
+                PointLog.user_id, daily_points, daily_count, hourly_count
+            ).filter(
+                PointLog.created_at >= min(today_start, hour_ago)
+            ).group_by(PointLog.user_id).having(db.or_(
+                daily_points > cls.DAILY_POINTS_THRESHOLD,
+                hourly_count > cls.HOURLY_ACTIVITY_THRESHOLD
+            )).all()
+
+            users_per_ip = db.func.count(User.id).over(partition_by=User.ip_address).label('user_count')
+            ip_users = db.session.query(User.id, User.ip_address, users_per_ip)\
+                .filter(User.ip_address.isnot(None)).subquery()
+            ip_rows = db.session.query(ip_users)\
+                .filter(ip_users.c.user_count > cls.USERS_PER_IP_THRESHOLD).all()
+
+            def row(kind, user_id, ip_address=None, daily_points=None, activities_count=None, user_count=None):
+                return {'kind': kind, 'user_id': user_id, 'ip_address': ip_address, 'daily_points': daily_points,
+                        'activities_count': activities_count, 'user_count': user_count, 'generated_at': now}
+
+            rows = []
+            for user_id, points, day_activities, hour_activities in point_rows:
+                if points > cls.DAILY_POINTS_THRESHOLD:
+                    rows.append(row('high_daily_points', user_id, daily_points=points, activities_count=day_activities))
+                if hour_activities > cls.HOURLY_ACTIVITY_THRESHOLD:
+                    rows.append(row('rapid_earner', user_id, activities_count=hour_activities))
+            for user_id, ip_address, user_count in ip_rows:
+                rows.append(row('duplicate_ip', user_id, ip_address=ip_address, user_count=user_count))
+
+            SuspiciousActivitySnapshot.query.delete()
+            db.session.execute(SuspiciousActivitySnapshot.__table__.insert(), rows + [row(cls.MARKER, None)])
+            db.session.commit()
+            return len(rows)
+
+    @classmethod
+    def generated_at(cls):
+        return db.session.query(SuspiciousActivitySnapshot.generated_at)\
+            .filter(SuspiciousActivitySnapshot.kind == cls.MARKER).scalar()
+
+    @classmethod
+    def ensure_fresh(cls):
+        generated_at = cls.generated_at()
+        if generated_at is None or datetime.utcnow() - generated_at > timedelta(seconds=cls.REFRESH_SECONDS):
+            cls.refresh()
+
+    @classmethod
+    def page(cls, kind, page=1, per_page=20):
+        """One page of a report section, with users loaded in bulk"""
+        snapshot = SuspiciousActivitySnapshot
+        if kind == 'duplicate_ip':
+            ips = db.session.query(snapshot.ip_address, snapshot.user_count)\
+                .filter(snapshot.kind == kind)\
+                .group_by(snapshot.ip_address, snapshot.user_count)\
+                .order_by(snapshot.user_count.desc(), snapshot.ip_address)
+            total = ips.count()
+            ips = ips.limit(per_page).offset((page - 1) * per_page).all()
+
+            users_by_ip = {}
+            if ips:
+                members = db.session.query(snapshot.ip_address, User)\
+                    .join(User, User.id == snapshot.user_id)\
+                    .filter(snapshot.kind == kind, snapshot.ip_address.in_([ip for ip, _ in ips]))
+                for ip_address, user in members:
+                    users_by_ip.setdefault(ip_address, []).append(user.to_dict_lite())
+
+            items = [
+                {
+                    'ip_address': ip_address,
+                    'user_count': user_count,
+                    'users': users_by_ip.get(ip_address, [])
+                }
+                for ip_address, user_count in ips
+            ]
+            return items, total
+
+        order = snapshot.daily_points.desc() if kind == 'high_daily_points' else snapshot.activities_count.desc()
+        query = db.session.query(snapshot, User)\
+            .join(User, User.id == snapshot.user_id)\
+            .filter(snapshot.kind == kind)\
+            .order_by(order, snapshot.id)
+        total = query.count()
+        rows = query.limit(per_page).offset((page - 1) * per_page).all()
+
+        users = User.bulk_to_dict([user for _, user in rows])
+        items = []
+        for (row, _), user in zip(rows, users):
+            item = {
+                'user_id': row.user_id,
+                'activities_count': row.activities_count,
+                'user': user
+            }
+            if kind == 'high_daily_points':
+                item['daily_points'] = row.daily_points
+            items.append(item)
+        return items, total
+
+
+def start_refresher(app, interval):
+    """Refresh the suspicious-activity snapshot every `interval` seconds"""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                with app.app_context():
+                    SuspiciousActivityReport.refresh()
+            except Exception:
+                app.logger.exception('suspicious activity refresh failed')
+
+    SuspiciousActivityReport.REFRESH_SECONDS = interval * 2
+    thread = threading.Thread(target=run, name='suspicious-activity-refresh', daemon=True)
+    thread.start()
+    return thread
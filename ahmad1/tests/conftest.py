@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import create_app, init_db
+from src.models.user import db
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    """Config for the app fixture; override it in a test module to change settings"""
+    return {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}",
+        'GAME_CATALOG_STAMP_PATH': str(tmp_path / 'game_catalog.stamp'),
+        'RATE_LIMIT_PATH': str(tmp_path / 'ratelimit.bin'),
+        'BACKGROUND_WORKERS': False,
+        'PASSWORD_HASH_WORKERS': 0,
+        'TESTING': True,
+    }
+
+
+@pytest.fixture
+def app(app_config):
+    app = create_app(app_config)
+    with app.app_context():
+        init_db()
+        yield app
+        db.session.remove()
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+from src.models.heartbeat import HeartbeatBuffer
+from src.models.user import User, Game, GameSession, PointLog, db
+
+
+def start_session(age_seconds):
+    user = User(name='player', email='player@example.com', password_hash='x')
+    game = Game(name='game', html_path='game.html')
+    db.session.add_all([user, game])
+    db.session.flush()
+    session_obj = GameSession(user_id=user.id, game_id=game.id,
+                              start_time=datetime.utcnow() - timedelta(seconds=age_seconds))
+    db.session.add(session_obj)
+    db.session.commit()
+    return user.id, session_obj.id
+
+
+def end_session(app, user_id, session_id):
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = user_id
+    return client.post(f'/api/games/sessions/{session_id}/end')
+
+
+def test_ticks_buffered_elsewhere_are_credited_after_end(app):
+    user_id, session_id = start_session(600)
+    HeartbeatBuffer.record(user_id, [(session_id, 60)])
+    HeartbeatBuffer.flush()
+
+    # This worker's /end sees 60 seconds; another worker still holds the last 180
+    response = end_session(app, user_id, session_id)
+    assert response.status_code == 200
+    assert response.get_json()['points_awarded'] == 0
+
+    HeartbeatBuffer.record(user_id, [(session_id, 60)] * 3)
+    result = HeartbeatBuffer.flush()
+    db.session.expire_all()
+
+    session_obj = db.session.get(GameSession, session_id)
+    assert session_obj.played_seconds == 240
+    assert session_obj.duration_minutes == 4
+    assert session_obj.bonus_awarded
+    assert result['bonuses'] == 1
+    assert PointLog.query.filter_by(user_id=user_id, activity_type='play_game').count() == 1
+
+
+def test_late_ticks_are_capped_at_session_length(app):
+    user_id, session_id = start_session(100)
+    HeartbeatBuffer.record(user_id, [(session_id, 30)])
+    HeartbeatBuffer.flush()
+    end_session(app, user_id, session_id)
+
+    HeartbeatBuffer.record(user_id, [(session_id, 60)] * 4)
+    HeartbeatBuffer.flush()
+    db.session.expire_all()
+
+    session_obj = db.session.get(GameSession, session_id)
+    length = (session_obj.end_time - session_obj.start_time).total_seconds()
+    assert session_obj.played_seconds <= length
+    assert not session_obj.bonus_awarded
+
+
+def test_flush_bonus_is_counted_in_award_metrics(app):
+    from src.models.metrics import Metrics
+
+    def awarded():
+        totals = Metrics.collect()
+        return (totals.get(('point_awards_total', (('activity_type', 'play_game'),)), 0),
+                totals.get(('points_awarded_total', (('activity_type', 'play_game'),)), 0))
+
+    before = awarded()
+    user_id, session_id = start_session(600)
+    HeartbeatBuffer.record(user_id, [(session_id, 60)] * 3)
+    assert HeartbeatBuffer.flush()['bonuses'] == 1
+    assert awarded() == (before[0] + 1, before[1] + HeartbeatBuffer.BONUS_POINTS)
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.models.user import User, PointLog, GameSession, Referral, UserDailyPoints, db, day_window, day_start
+
+
+def query_plan(query):
+    """EXPLAIN QUERY PLAN details for an ORM query"""
+    compiled = query.statement.compile(db.engine)
+    params = [compiled.params[name] for name in compiled.positiontup]
+    params = [str(value) if hasattr(value, 'isoformat') else value for value in params]
+    connection = db.session.connection().connection.dbapi_connection
+    return [row[-1] for row in connection.execute('EXPLAIN QUERY PLAN ' + str(compiled), params)]
+
+
+HOT_QUERIES = {
+    'game_ad_views_today': lambda: PointLog.query.filter(
+        PointLog.user_id == 1, PointLog.activity_type == 'watch_ad', PointLog.game_id == 1,
+        day_window(PointLog.created_at)),
+    'standalone_ad_views_today': lambda: PointLog.query.filter(
+        PointLog.user_id == 1, PointLog.activity_type == 'watch_ad', PointLog.game_id.is_(None),
+        day_window(PointLog.created_at)),
+    'user_points_since': lambda: db.session.query(db.func.sum(PointLog.points_earned)).filter(
+        PointLog.user_id == 1, PointLog.created_at >= day_start(datetime.utcnow().date() - timedelta(days=7))),
+    'points_today': lambda: db.session.query(db.func.sum(PointLog.points_earned)).filter(
+        day_window(PointLog.created_at)),
+    'game_sessions_today': lambda: GameSession.query.filter(
+        GameSession.user_id == 1, GameSession.game_id == 1, day_window(GameSession.start_time)),
+    'all_sessions_today': lambda: GameSession.query.filter(day_window(GameSession.start_time)),
+    'new_users_today': lambda: User.query.filter(day_window(User.created_at)),
+    'active_users_today': lambda: User.query.filter(day_window(User.last_login)),
+    'referrals_today': lambda: Referral.query.filter(day_window(Referral.created_at)),
+    'activity_resync': lambda: db.session.query(PointLog.id, PointLog.created_at).filter(
+        PointLog.user_id == 1, PointLog.id > 100),
+    'daily_points_ledger': lambda: UserDailyPoints.query.filter_by(user_id=1, day=datetime.utcnow().date()),
+}
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_uses_index(app, name):
+    plan = query_plan(HOT_QUERIES[name]())
+    assert any('USING INDEX' in step or 'USING COVERING INDEX' in step for step in plan), plan
+    assert not any(step.startswith('SCAN') for step in plan), plan
@@ -0,0 +1,32 @@
+from src.models.leaderboard import Leaderboard
+from src.models.user import User, db
+
+
+def add_users(points):
+    db.session.execute(User.__table__.insert(), [
+        {'name': f'user {i}', 'email': f'user{i}@example.com', 'password_hash': 'x', 'points': value}
+        for i, value in enumerate(points)
+    ])
+    db.session.commit()
+
+
+def test_rank_matches_sorted_order(app):
+    add_users([5, 10, 10, 0, 7, 10, 3])
+    order = [user.id for user in User.query.order_by(User.points.desc(), User.id)]
+    for user in User.query:
+        assert Leaderboard.rank_of(user.id, user.points) == order.index(user.id) + 1
+
+
+def test_top_cache_only_dropped_by_changes_that_can_move_it(app):
+    Leaderboard.invalidate()
+    add_users([50, 40, 30, 20, 10])
+    top = Leaderboard.top(3)
+    version = Leaderboard._version
+
+    Leaderboard.record_change(5, 10, 15)  # still below the lowest listed score
+    assert Leaderboard._version == version
+    assert Leaderboard.top(3) is top
+
+    Leaderboard.record_change(5, 15, 35)  # enters the list
+    assert Leaderboard._version != version
+    assert [entry['points'] for entry in Leaderboard.top(3)] == [50, 40, 30]
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.models.user import User, PointLog, db
+from src.models.activity import ActivityTracker
+from src.routes.protection import SuspiciousPatternDetector
+
+
+@pytest.fixture
+def user(app):
+    ActivityTracker.reset()
+    ActivityTracker._versions.clear()
+    SuspiciousPatternDetector._verdicts.clear()
+    user = User(name='player', email='player@example.com', password_hash='x', ip_address='10.0.0.1')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def write_awards_elsewhere(user_id, count):
+    """Insert PointLog rows the way another worker would: no ORM events in this process"""
+    now = datetime.utcnow()
+    db.session.execute(PointLog.__table__.insert(), [
+        {'user_id': user_id, 'points_earned': 1, 'activity_type': 'watch_ad', 'created_at': now - timedelta(seconds=offset)}
+        for offset in range(count)
+    ])
+    db.session.commit()
+
+
+def test_verdict_is_cached_until_something_changes(user):
+    first = SuspiciousPatternDetector.evaluate(user.id, '10.0.0.1', 'agent')
+    second = SuspiciousPatternDetector.evaluate(user.id, '10.0.0.1', 'agent')
+    assert first['cached'] is False
+    assert second['cached'] is True
+
+
+def test_award_from_another_worker_invalidates_cached_verdict(user):
+    first = SuspiciousPatternDetector.evaluate(user.id, '10.0.0.1', 'agent')
+    assert first['checks']['rapid_clicking'] is False
+
+    write_awards_elsewhere(user.id, 25)
+
+    verdict = SuspiciousPatternDetector.evaluate(user.id, '10.0.0.1', 'agent')
+    assert verdict['cached'] is False
+    assert verdict['checks']['rapid_clicking'] is True
@@ -0,0 +1,53 @@
+import pytest
+
+from src.models.ratelimit import BucketTable
+
+
+@pytest.fixture
+def app_config(app_config):
+    return dict(app_config, TRUSTED_PROXIES=1)
+
+
+def login(client, forwarded_for):
+    return client.post('/api/auth/login', json={'email': 'nobody@example.com', 'password': 'x'},
+                       headers={'X-Forwarded-For': forwarded_for})
+
+
+def test_anonymous_limit_is_per_forwarded_client(app):
+    client = app.test_client()
+    # Same proxy address for everyone; only the forwarded client differs
+    for attempt in range(10):
+        assert login(client, '203.0.113.1').status_code != 429
+    assert login(client, '203.0.113.1').status_code == 429
+    assert login(client, '203.0.113.2').status_code != 429
+
+
+def test_only_trusted_hops_are_believed(app):
+    client = app.test_client()
+    # A client-supplied extra hop is ignored: the proxy appended the real address last
+    for attempt in range(10):
+        assert login(client, f'198.51.100.{attempt}, 203.0.113.1').status_code != 429
+    assert login(client, '198.51.100.99, 203.0.113.1').status_code == 429
+
+
+def test_layout_mismatch_leaves_shared_file_alone(tmp_path):
+    path = str(tmp_path / 'buckets.bin')
+    table = BucketTable(path, 1024)
+    table.take('key', rate=1.0, burst=2, now=1000.0)
+    before = open(path, 'rb').read()
+
+    with pytest.raises(ValueError):
+        BucketTable(path, 4096)
+
+    assert open(path, 'rb').read() == before
+    allowed, _ = table.take('key', rate=1.0, burst=2, now=1000.0)
+    assert allowed
+    assert table.take('key', rate=1.0, burst=2, now=1000.0)[0] is False
+
+
+def test_matching_layout_shares_buckets(tmp_path):
+    path = str(tmp_path / 'buckets.bin')
+    first = BucketTable(path, 1024)
+    second = BucketTable(path, 1024)
+    assert first.take('key', rate=1.0, burst=1, now=1000.0)[0]
+    assert second.take('key', rate=1.0, burst=1, now=1000.0)[0] is False
@@ -0,0 +1,39 @@
+import random
+from datetime import datetime, timedelta
+
+from src.models.referrals import ReferralGraph
+from src.models.user import User, Referral, ReferralStats, db
+
+
+def stats_snapshot():
+    """Non-empty ReferralStats rows (record() also keeps zero rows for referred users)"""
+    return {
+        row.user_id: (row.referrer_id, row.direct_count, row.descendant_count)
+        for row in ReferralStats.query.all()
+        if row.referrer_id is not None or row.direct_count or row.descendant_count
+    }
+
+
+def test_incremental_stats_match_rebuild(app):
+    rng = random.Random(7)
+    users = [User(name=f'user {i}', email=f'user{i}@example.com', password_hash='x') for i in range(40)]
+    db.session.add_all(users)
+    db.session.commit()
+    user_ids = [user.id for user in users]
+
+    # Random edges, with repeat referrals and rings (the last edges point back up the tree)
+    edges = [(rng.choice(user_ids[:i]), user_ids[i]) for i in range(1, len(user_ids))]
+    edges += [(rng.choice(user_ids), rng.choice(user_ids)) for _ in range(30)]
+    edges += [(user_ids[-1], user_ids[0]), (user_ids[5], user_ids[1])]
+
+    started = datetime.utcnow()
+    for index, (referrer_id, referred_id) in enumerate(edges):
+        db.session.add(Referral(referrer_id=referrer_id, referred_id=referred_id,
+                                created_at=started + timedelta(seconds=index)))
+        ReferralGraph.record(referrer_id, referred_id)
+        db.session.commit()
+
+    incremental = stats_snapshot()
+    ReferralGraph.rebuild()
+    assert stats_snapshot() == incremental
+    assert incremental[user_ids[0]][2] == len(user_ids) - 1
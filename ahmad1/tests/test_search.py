@@ -0,0 +1,38 @@
+import pytest
+
+from src.models.user import User, db
+from src.models.search import UserSearch
+
+
+@pytest.fixture
+def users(app):
+    if not UserSearch.is_available():
+        pytest.skip('SQLite build lacks FTS5 trigram')
+    db.session.add_all([
+        User(name='Ali Hassan', email='ali.hassan@example.com', password_hash='x'),
+        User(name='Omar Hassan', email='omar.hassan@example.com', password_hash='x'),
+        User(name='Sara 50%', email='sara@example.com', password_hash='x'),
+        User(name='Sara 50x', email='sara.x@example.com', password_hash='x'),
+    ])
+    db.session.commit()
+
+
+def names(result):
+    return sorted(user.name for user in result['items'])
+
+
+def test_short_term_narrows_ranked_matches(users):
+    result = UserSearch.search('hassan al')
+    assert result['ranked'] is True
+    assert names(result) == ['Ali Hassan']
+    assert result['total'] == 1
+
+
+def test_short_term_wildcards_are_literal(users):
+    assert names(UserSearch.search('sara 0%')) == ['Sara 50%']
+
+
+def test_only_short_terms_fall_back_to_like(users):
+    result = UserSearch.search('li')
+    assert result['ranked'] is False
+    assert names(result) == ['Ali Hassan']
@@ -0,0 +1,19 @@
+from src.models.suspicious import SuspiciousActivityReport
+from src.models.user import User, db
+
+
+def test_empty_snapshot_is_not_rebuilt_on_every_read(app, monkeypatch):
+    db.session.add(User(name='quiet', email='quiet@example.com', password_hash='x'))
+    db.session.commit()
+
+    assert SuspiciousActivityReport.refresh() == 0
+    assert SuspiciousActivityReport.generated_at() is not None
+
+    refreshes = []
+    monkeypatch.setattr(SuspiciousActivityReport, 'refresh', classmethod(lambda cls: refreshes.append(1)))
+    SuspiciousActivityReport.ensure_fresh()
+    SuspiciousActivityReport.ensure_fresh()
+    assert refreshes == []
+
+    for kind in ('high_daily_points', 'rapid_earner', 'duplicate_ip'):
+        assert SuspiciousActivityReport.page(kind) == ([], 0)
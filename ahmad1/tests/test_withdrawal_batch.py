@@ -0,0 +1,40 @@
+import pytest
+
+from src.models.user import User, WithdrawalRequest, db
+
+
+@pytest.fixture
+def admin_client(app):
+    admin = User(name='admin', email='admin@example.com', password_hash='x', level=10)
+    db.session.add(admin)
+    db.session.flush()
+    db.session.add_all([WithdrawalRequest(user_id=admin.id, points_redeemed=100, amount_usd=1,
+                                          payment_method='paypal') for _ in range(5)])
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = admin.id
+    return client
+
+
+@pytest.mark.parametrize('body', [
+    {'action': 'approve', 'ids': '15'},
+    {'action': 'approve', 'ids': ['1', 'x']},
+    {'action': 'approve', 'ids': [1, None]},
+    {'action': 'approve', 'ids': 15},
+    {'action': 'approve', 'ids': {'1': 1}},
+    {'action': 'approve', 'filter': 'pending'},
+    {'action': 'approve', 'filter': ['pending']},
+    {'action': 'approve', 'ids': [1], 'transaction_ids': ['t1']},
+    ['approve'],
+])
+def test_malformed_batch_is_rejected(admin_client, body):
+    response = admin_client.post('/api/admin/withdrawals/batch', json=body)
+    assert response.status_code == 400
+    assert WithdrawalRequest.query.filter_by(status='pending').count() == 5
+
+
+def test_ids_accept_ints_and_numeric_strings(admin_client):
+    response = admin_client.post('/api/admin/withdrawals/batch', json={'action': 'approve', 'ids': [1, '5']})
+    assert response.status_code == 200
+    assert response.get_json()['processed_ids'] == [1, 5]
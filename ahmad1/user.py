@@ -1,9 +1,27 @@
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from datetime import datetime, time, timedelta
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.models.passwords import PasswordHasher
 
 db = SQLAlchemy()
 
+
+def day_start(day):
+    """Return the datetime at which the given date starts"""
+    return datetime.combine(day, time.min)
+
+
+def day_window(column, day=None):
+    """Half-open [start, end) range predicate for one day.
+
+    Unlike func.date(column) == day this leaves the column bare, so SQLite
+    can use an index on it.
+    """
+    start = day_start(day or datetime.utcnow().date())
+    return db.and_(column >= start, column < start + timedelta(days=1))
+
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -16,8 +34,8 @@ class User(db.Model):
     daily_points_cap = db.Column(db.Integer, default=50)
     level = db.Column(db.Integer, default=1)
     ip_address = db.Column(db.String(45), nullable=True)
-    last_login = db.Column(db.DateTime, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_login = db.Column(db.DateTime, nullable=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
@@ -28,48 +46,59 @@ class User(db.Model):
     referrals_received = db.relationship('Referral', foreign_keys='Referral.referred_id', backref='referred', lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = PasswordHasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Verify a password; a hash made with outdated parameters is upgraded (caller commits)"""
+        if not PasswordHasher.verify(self.password_hash, password):
+            return False
+        if PasswordHasher.needs_rehash(self.password_hash):
+            self.password_hash = PasswordHasher.hash(password)
+        return True
+
+    def add_points(self, points, activity_type, game_id=None, ad_id=None, commit=True, enforce_cap=True):
+        """Add points to user and create log entry; returns True if granted.
 
-    def add_points(self, points, activity_type, game_id=None, ad_id=None):
-        """Add points to user and create log entry"""
-        self.points += points
+        The daily cap is checked in the same UPDATE that moves the balance
+        (see src.models.awards), so concurrent requests cannot overshoot it.
+        Pass commit=False to join the caller's transaction so the request
+        commits once. When group commit is enabled, a standalone award is
+        handed to the shared writer and merged with concurrent awards.
+        """
+        from src.models.awards import award_points
         
-        # Create point log
-        point_log = PointLog(
-            user_id=self.id,
-            points_earned=points,
-            activity_type=activity_type,
-            game_id=game_id,
-            ad_id=ad_id
+        committer = current_app.extensions.get('points_group_commit')
+        if commit and committer and not (db.session.new or db.session.dirty or db.session.deleted):
+            new_balance = committer.submit(
+                self.id, points, activity_type, game_id=game_id, ad_id=ad_id, enforce_cap=enforce_cap
+            ).result()
+            db.session.expire(self, ['points'])
+            return new_balance is not None
+        
+        new_balance = award_points(
+            self.id, points, activity_type, game_id=game_id, ad_id=ad_id, enforce_cap=enforce_cap
         )
-        db.session.add(point_log)
-        db.session.commit()
+        if commit:
+            db.session.commit()
+        return new_balance is not None
 
     def can_earn_daily_points(self):
         """Check if user can still earn points today"""
-        today = datetime.utcnow().date()
-        today_points = db.session.query(db.func.sum(PointLog.points_earned)).filter(
-            PointLog.user_id == self.id,
-            db.func.date(PointLog.created_at) == today
-        ).scalar() or 0
-        
-        return today_points < self.daily_points_cap
+        return self.get_daily_points_earned() < self.daily_points_cap
 
     def get_daily_points_earned(self):
         """Get points earned today"""
         today = datetime.utcnow().date()
-        return db.session.query(db.func.sum(PointLog.points_earned)).filter(
-            PointLog.user_id == self.id,
-            db.func.date(PointLog.created_at) == today
-        ).scalar() or 0
+        ledger = UserDailyPoints.query.get((self.id, today))
+        return ledger.points_earned if ledger else 0
 
     def __repr__(self):
         return f'<User {self.name}>'
 
-    def to_dict(self):
+    def to_dict(self, daily_points_earned=None):
+        if daily_points_earned is None:
+            daily_points_earned = self.get_daily_points_earned()
+        
         return {
             'id': self.id,
             'name': self.name,
@@ -78,11 +107,34 @@ class User(db.Model):
             'points': self.points,
             'level': self.level,
             'daily_points_cap': self.daily_points_cap,
-            'daily_points_earned': self.get_daily_points_earned(),
+            'daily_points_earned': daily_points_earned,
             'last_login': self.last_login.isoformat() if self.last_login else None,
             'created_at': self.created_at.isoformat()
         }
 
+    def to_dict_lite(self):
+        """Profile shape for lists that don't need daily totals (no queries)"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'email': self.email,
+            'points': self.points,
+            'level': self.level
+        }
+
+    @staticmethod
+    def bulk_to_dict(users, lite=False):
+        """Serialize a list of users with one grouped query for daily totals"""
+        if lite:
+            return [user.to_dict_lite() for user in users]
+        
+        daily_totals = UserDailyPoints.totals_for([user.id for user in users])
+        return [user.to_dict(daily_points_earned=daily_totals.get(user.id, 0)) for user in users]
+
+
+# Leaderboard order (points desc, id asc) for ranking and keyset pagination
+db.Index('ix_user_points_id', User.points.desc(), User.id)
+
 
 class Game(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -133,13 +185,19 @@ class Ad(db.Model):
 
 
 class PointLog(db.Model):
+    __table_args__ = (
+        db.Index('ix_point_log_user_activity_game_created', 'user_id', 'activity_type', 'game_id', 'created_at'),
+        db.Index('ix_point_log_user_created', 'user_id', 'created_at'),
+        db.Index('ix_point_log_user_id', 'user_id', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     points_earned = db.Column(db.Integer, nullable=False)
     activity_type = db.Column(db.String(50), nullable=False)  # play_game, watch_ad, daily_login, invite_friend
     game_id = db.Column(db.Integer, db.ForeignKey('game.id'), nullable=True)
     ad_id = db.Column(db.Integer, db.ForeignKey('ad.id'), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     def to_dict(self):
         return {
@@ -153,7 +211,119 @@ class PointLog(db.Model):
         }
 
 
+class UserDailyPoints(db.Model):
+    """Per-user daily points ledger, maintained alongside PointLog"""
+    __tablename__ = 'user_daily_points'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    points_earned = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @staticmethod
+    def totals_for(user_ids, day=None):
+        """Map user_id -> points earned on the given day, in a single query"""
+        if not user_ids:
+            return {}
+        day = day or datetime.utcnow().date()
+        rows = db.session.query(UserDailyPoints.user_id, UserDailyPoints.points_earned).filter(
+            UserDailyPoints.user_id.in_(set(user_ids)),
+            UserDailyPoints.day == day
+        ).all()
+        return dict(rows)
+
+    @staticmethod
+    def rebuild(day=None):
+        """Recompute the ledger for a day from PointLog (backfill/repair)"""
+        day = day or datetime.utcnow().date()
+        totals = db.session.query(
+            PointLog.user_id,
+            db.func.sum(PointLog.points_earned)
+        ).filter(
+            day_window(PointLog.created_at, day)
+        ).group_by(PointLog.user_id).all()
+        
+        UserDailyPoints.query.filter_by(day=day).delete()
+        for user_id, points in totals:
+            db.session.add(UserDailyPoints(user_id=user_id, day=day, points_earned=points or 0))
+        db.session.commit()
+        return len(totals)
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'day': self.day.isoformat(),
+            'points_earned': self.points_earned
+        }
+
+
+class DailyStat(db.Model):
+    """Per-day counters for the admin dashboard, bumped by the write paths"""
+    __tablename__ = 'daily_stats'
+
+    day = db.Column(db.Date, primary_key=True)
+    metric = db.Column(db.String(50), primary_key=True)  # new_users, active_users, points_distributed, ...
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def bump(metric, amount=1, day=None, connection=None):
+        """Atomically add to a counter inside the caller's transaction (no commit)"""
+        if not amount:
+            return
+        stmt = sqlite_insert(DailyStat.__table__).values(
+            day=day or datetime.utcnow().date(),
+            metric=metric,
+            value=amount
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['day', 'metric'],
+            set_={'value': DailyStat.__table__.c.value + stmt.excluded.value}
+        )
+        (connection or db.session).execute(stmt)
+
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat(),
+            'metric': self.metric,
+            'value': self.value
+        }
+
+
+class SuspiciousActivitySnapshot(db.Model):
+    """Materialized rows of the suspicious-activity report"""
+    __tablename__ = 'suspicious_activity_snapshot'
+    __table_args__ = (
+        db.Index('ix_suspicious_snapshot_kind', 'kind', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)  # high_daily_points, duplicate_ip, rapid_earner, refreshed
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    ip_address = db.Column(db.String(45), nullable=True)
+    daily_points = db.Column(db.Integer, nullable=True)
+    activities_count = db.Column(db.Integer, nullable=True)
+    user_count = db.Column(db.Integer, nullable=True)
+    generated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'user_id': self.user_id,
+            'ip_address': self.ip_address,
+            'daily_points': self.daily_points,
+            'activities_count': self.activities_count,
+            'user_count': self.user_count,
+            'generated_at': self.generated_at.isoformat()
+        }
+
+
 class WithdrawalRequest(db.Model):
+    __table_args__ = (
+        db.Index('ix_withdrawal_user_created', 'user_id', 'created_at'),
+        db.Index('ix_withdrawal_status_created', 'status', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     points_redeemed = db.Column(db.Integer, nullable=False)
@@ -161,7 +331,7 @@ class WithdrawalRequest(db.Model):
     payment_method = db.Column(db.String(50), nullable=False)  # payeer, mobile_credit, gift_card
     status = db.Column(db.String(20), default='pending')  # pending, approved, rejected
     transaction_id = db.Column(db.String(100), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def to_dict(self):
@@ -179,10 +349,17 @@ class WithdrawalRequest(db.Model):
 
 
 class Referral(db.Model):
+    __table_args__ = (
+        # Duplicate checks and walks down the referral graph
+        db.Index('ix_referral_referrer_referred', 'referrer_id', 'referred_id'),
+        # Walks up the graph and ring detection
+        db.Index('ix_referral_referred_referrer', 'referred_id', 'referrer_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     referrer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     referred_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     def to_dict(self):
         return {
@@ -193,20 +370,61 @@ class Referral(db.Model):
         }
 
 
+class ReferralStats(db.Model):
+    """Per-user referral counts, maintained incrementally by ReferralGraph.record()
+
+    referrer_id is the user's primary referrer (the first referral that
+    didn't close a ring), so the rows form a forest; descendant_count is
+    the size of the user's subtree in it.
+    """
+    __tablename__ = 'referral_stats'
+    __table_args__ = (
+        db.Index('ix_referral_stats_direct', db.text('direct_count DESC'), 'user_id'),
+        db.Index('ix_referral_stats_descendants', db.text('descendant_count DESC'), 'user_id'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    referrer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    direct_count = db.Column(db.Integer, nullable=False, default=0)
+    descendant_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'referrer_id': self.referrer_id,
+            'direct_count': self.direct_count,
+            'descendant_count': self.descendant_count,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
 class GameSession(db.Model):
+    __table_args__ = (
+        db.Index('ix_game_session_user_game_start', 'user_id', 'game_id', 'start_time'),
+        # Open sessions only, for the stale-session sweep
+        db.Index('ix_game_session_open', 'start_time', sqlite_where=db.text('end_time IS NULL')),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     game_id = db.Column(db.Integer, db.ForeignKey('game.id'), nullable=False)
-    start_time = db.Column(db.DateTime, default=datetime.utcnow)
+    start_time = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     end_time = db.Column(db.DateTime, nullable=True)
     duration_minutes = db.Column(db.Float, nullable=True)
+    played_seconds = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # from heartbeats
+    last_heartbeat = db.Column(db.DateTime, nullable=True)
+    bonus_awarded = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def end_session(self):
         """End the game session and calculate duration"""
         self.end_time = datetime.utcnow()
-        if self.start_time:
+        if self.last_heartbeat:
+            # Heartbeat clients report actual play time
+            self.duration_minutes = (self.played_seconds or 0) / 60
+        elif self.start_time:
             duration = self.end_time - self.start_time
             self.duration_minutes = duration.total_seconds() / 60
 
@@ -218,6 +436,8 @@ class GameSession(db.Model):
             'start_time': self.start_time.isoformat(),
             'end_time': self.end_time.isoformat() if self.end_time else None,
             'duration_minutes': self.duration_minutes,
+            'played_seconds': self.played_seconds,
+            'last_heartbeat': self.last_heartbeat.isoformat() if self.last_heartbeat else None,
             'created_at': self.created_at.isoformat()
         }
 